@@ -1,20 +1,466 @@
 import cv2
 import matplotlib.pyplot as plt
+import numpy as np
 import sys
+import os
+import glob
+import json
+import math
+import time
+import shutil
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# interpolation modes by name, for --interpolation and the benchmark
+INTERPOLATIONS = {
+  "nearest": cv2.INTER_NEAREST,
+  "linear": cv2.INTER_LINEAR,
+  "cubic": cv2.INTER_CUBIC,
+  "area": cv2.INTER_AREA,
+  "lanczos": cv2.INTER_LANCZOS4,
+}
+
+# files picked up from directories
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+# JPEG decoders can skip detail while decoding: 1/2, 1/4 or 1/8 of the size
+REDUCED_DECODES = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+# side of the square tiles of the viewer's pyramid levels
+TILE_SIZE = 256
+
+# where pyramids are kept between runs, one directory per image version; the least
+# recently viewed ones are removed once they take more than CACHE_SIZE bytes (deleting
+# the directory by hand is always safe, pyramids are rebuilt on demand)
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "imshow")
+CACHE_SIZE = 4 * 1024 ** 3
 
 # define helper functions
+def displayZoom(fig, width, height):
+  # scale that fits width x height in the figure's pixels
+  display_width, display_height = fig.get_size_inches() * fig.dpi
+  return min(display_width / width, display_height / height)
+
 def imShow(path):
   image = cv2.imread(path)
   height, width = image.shape[:2]
-  resized_image = cv2.resize(image,(3*width, 3*height), interpolation = cv2.INTER_CUBIC)
 
   fig = plt.gcf()
   fig.set_size_inches(18, 10)
+  zoom = displayZoom(fig, width, height)
+  resized_image = cv2.resize(image,(max(1, round(zoom*width)), max(1, round(zoom*height))),
+                             interpolation = cv2.INTER_CUBIC if zoom > 1 else cv2.INTER_AREA)
   plt.axis("off")
   plt.imshow(cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB))
   plt.show()
 
-print('Number of arguments:', len(sys.argv), 'arguments.')
-print('Argument List:', str(sys.argv))
+def pyramidDir(path, cache_dir=CACHE_DIR):
+  # cache directory of an image, changing when the file does
+  st = os.stat(path)
+  key = "%s:%d:%d" % (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+  return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest()[:16])
+
+def directorySize(directory):
+  # bytes in the files of a directory
+  return sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)
+             if os.path.isfile(os.path.join(directory, f)))
+
+def pruneCache(cache_dir=CACHE_DIR, max_bytes=CACHE_SIZE, keep=None):
+  # remove the least recently viewed pyramids until the cache fits in max_bytes, never keep's
+  entries = []
+  for name in os.listdir(cache_dir):
+    directory = os.path.join(cache_dir, name)
+    if directory == keep or not os.path.isdir(directory):
+      continue
+    # loadPyramid touches pyramid.json on every view, builds in progress have none yet
+    meta_file = os.path.join(directory, "pyramid.json")
+    used = os.path.getmtime(meta_file if os.path.exists(meta_file) else directory)
+    entries.append((used, directory, directorySize(directory)))
+  total = sum(size for _, _, size in entries) + (directorySize(keep) if keep else 0)
+  for _, directory, size in sorted(entries):
+    if total <= max_bytes:
+      break
+    shutil.rmtree(directory, ignore_errors = True)
+    total -= size
+
+def imageRows(image):
+  # rows(y0, y1) of an in-memory image, for writeLevel
+  return lambda y0, y1: image[y0:y1]
+
+def readRegion(tiles, y0, y1, x0, x1):
+  # rows y0:y1 and columns x0:x1 of a tiled level, touching only the tiles they cover
+  tile = tiles.shape[2]
+  region = np.empty((y1 - y0, x1 - x0, 3), dtype = np.uint8)
+  for ty in range(y0 // tile, (y1 - 1) // tile + 1):
+    for tx in range(x0 // tile, (x1 - 1) // tile + 1):
+      top, left = max(y0, ty * tile), max(x0, tx * tile)
+      bottom, right = min(y1, (ty + 1) * tile), min(x1, (tx + 1) * tile)
+      region[top - y0:bottom - y0, left - x0:right - x0] = \
+        tiles[ty, tx, top - ty * tile:bottom - ty * tile, left - tx * tile:right - tx * tile]
+  return region
+
+def writeLevel(file_name, height, width, tile, rows):
+  # store a level as a (tile rows, tile columns, tile, tile, 3) memory-mapped array, one row
+  # of tiles at a time; rows(y0, y1) returns the level's BGR pixel rows y0:y1
+  tiles = np.lib.format.open_memmap(file_name, mode = "w+", dtype = np.uint8,
+                                    shape = ((height + tile - 1) // tile, (width + tile - 1) // tile, tile, tile, 3))
+  strip = np.zeros((tile, tiles.shape[1] * tile, 3), dtype = np.uint8)
+  for ty in range(tiles.shape[0]):
+    pixels = rows(ty * tile, min(height, (ty + 1) * tile))
+    strip[:] = 0
+    strip[:pixels.shape[0], :width] = pixels
+    tiles[ty] = strip.reshape(tile, tiles.shape[1], tile, 3).swapaxes(0, 1)
+  tiles.flush()
+  del tiles
+  return np.load(file_name, mmap_mode = "r")
+
+def loadPyramid(path, tile=TILE_SIZE, cache_dir=CACHE_DIR, cache_size=CACHE_SIZE):
+  # levels of an image halved until it fits in a tile, as (tiles, height, width), built on first use
+  directory = pyramidDir(path, cache_dir)
+  meta_file = os.path.join(directory, "pyramid.json")
+  level_file = lambda level: os.path.join(directory, "level_%d.npy" % level)
+  if os.path.exists(meta_file):
+    with open(meta_file) as f:
+      meta = json.load(f)
+    if meta["tile"] == tile:
+      # most recently used, for pruneCache
+      os.utime(meta_file)
+      return [(np.load(level_file(i), mmap_mode = "r"), h, w) for i, (h, w) in enumerate(meta["levels"])]
+
+  # the only full decode, released once the first level is on disk
+  image = cv2.imread(path)
+  if image is None:
+    raise IOError("Could not read %s" % path)
+  os.makedirs(directory, exist_ok = True)
+  height, width = image.shape[:2]
+  levels = [(writeLevel(level_file(0), height, width, tile, imageRows(image)), height, width)]
+  del image
+
+  while max(height, width) > tile:
+    previous, previous_height, previous_width = levels[-1]
+    height, width = (previous_height + 1) // 2, (previous_width + 1) // 2
+    # each row of tiles is resampled from the two rows of tiles above it
+    rows = lambda y0, y1, previous=previous, h=previous_height, w=previous_width, width=width: cv2.resize(
+      readRegion(previous, 2 * y0, min(h, 2 * y1), 0, w), (width, y1 - y0), interpolation = cv2.INTER_AREA)
+    levels.append((writeLevel(level_file(len(levels)), height, width, tile, rows), height, width))
+
+  # written last, so an interrupted build is started over
+  with open(meta_file, "w") as f:
+    json.dump({"tile": tile, "levels": [[h, w] for _, h, w in levels]}, f)
+  pruneCache(cache_dir, cache_size, keep = directory)
+  return levels
+
+class TileViewer:
+  # pan (drag, arrows) and zoom (scroll, +/-, 0 to fit) an image of any size, holding only
+  # the pixels on screen: each view is assembled from the visible tiles of the pyramid
+  # level closest to the zoom
+
+  def __init__(self, path, tile=TILE_SIZE, cache_dir=CACHE_DIR, cache_size=CACHE_SIZE):
+    self.levels = loadPyramid(path, tile, cache_dir, cache_size)
+    self.tile = tile
+    self.fig = plt.gcf()
+    self.fig.set_size_inches(18, 10)
+    self.ax = self.fig.add_axes([0, 0, 1, 1])
+    self.ax.axis("off")
+    self.artist = None
+    self.drag = None
+    _, height, width = self.levels[0]
+    self.center = (width / 2, height / 2)
+    self.zoom = self.fitZoom()
+    for event, handler in (("scroll_event", self.onScroll), ("key_press_event", self.onKey),
+                           ("button_press_event", self.onPress), ("motion_notify_event", self.onMotion),
+                           ("button_release_event", self.onRelease), ("resize_event", lambda event: self.render())):
+      self.fig.canvas.mpl_connect(event, handler)
+
+  def displaySize(self):
+    box = self.ax.get_window_extent()
+    return max(1, int(box.width)), max(1, int(box.height))
+
+  def fitZoom(self):
+    _, height, width = self.levels[0]
+    display_width, display_height = self.displaySize()
+    return min(display_width / width, display_height / height)
+
+  def render(self):
+    display_width, display_height = self.displaySize()
+    # finest level with at least one pixel per screen pixel
+    level = min(len(self.levels) - 1, max(0, int(math.floor(math.log2(1 / self.zoom))))) if self.zoom < 1 else 0
+    tiles, height, width = self.levels[level]
+    scale = self.levels[0][2] / width  # full-size pixels per level pixel
+    zoom = self.zoom * scale  # screen pixels per level pixel
+    left = self.center[0] / scale - display_width / 2 / zoom
+    top = self.center[1] / scale - display_height / 2 / zoom
+    interpolation = cv2.INTER_AREA if zoom < 1 else cv2.INTER_NEAREST if zoom >= 4 else cv2.INTER_CUBIC
+
+    canvas = np.zeros((display_height, display_width, 3), dtype = np.uint8)
+    x0, x1 = max(0, int(left)), min(width, int(math.ceil(left + display_width / zoom)))
+    y0, y1 = max(0, int(top)), min(height, int(math.ceil(top + display_height / zoom)))
+    for ty in range(y0 // self.tile, (y1 - 1) // self.tile + 1 if y1 > y0 else 0):
+      for tx in range(x0 // self.tile, (x1 - 1) // self.tile + 1 if x1 > x0 else 0):
+        # the visible part of the tile, placed on rounded screen edges so tiles don't leave seams
+        tile_y0, tile_x0 = max(y0, ty * self.tile), max(x0, tx * self.tile)
+        tile_y1, tile_x1 = min(y1, (ty + 1) * self.tile), min(x1, (tx + 1) * self.tile)
+        screen_x0, screen_x1 = round((tile_x0 - left) * zoom), round((tile_x1 - left) * zoom)
+        screen_y0, screen_y1 = round((tile_y0 - top) * zoom), round((tile_y1 - top) * zoom)
+        if screen_x1 <= screen_x0 or screen_y1 <= screen_y0:
+          continue
+        pixels = tiles[ty, tx, tile_y0 - ty * self.tile:tile_y1 - ty * self.tile,
+                       tile_x0 - tx * self.tile:tile_x1 - tx * self.tile]
+        pixels = cv2.resize(cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB), (screen_x1 - screen_x0, screen_y1 - screen_y0),
+                            interpolation = interpolation)
+        # clip to the canvas
+        cx0, cy0 = max(0, screen_x0), max(0, screen_y0)
+        cx1, cy1 = min(display_width, screen_x1), min(display_height, screen_y1)
+        if cx1 > cx0 and cy1 > cy0:
+          canvas[cy0:cy1, cx0:cx1] = pixels[cy0 - screen_y0:cy1 - screen_y0, cx0 - screen_x0:cx1 - screen_x0]
+
+    if self.artist is None:
+      self.artist = self.ax.imshow(canvas, aspect = "auto", interpolation = "none")
+    else:
+      self.artist.set_data(canvas)
+    self.artist.set_extent((0, display_width, display_height, 0))
+    self.ax.set_xlim(0, display_width)
+    self.ax.set_ylim(display_height, 0)
+    self.fig.canvas.draw_idle()
+
+  def zoomAt(self, factor, x=None, y=None):
+    # zoom keeping the image point under screen position (x, y from the top left) in place
+    display_width, display_height = self.displaySize()
+    x = display_width / 2 if x is None else x
+    y = display_height / 2 if y is None else y
+    new_zoom = min(max(self.zoom * factor, self.fitZoom() / 4), 32)
+    point = (self.center[0] + (x - display_width / 2) / self.zoom, self.center[1] + (y - display_height / 2) / self.zoom)
+    self.center = (point[0] - (x - display_width / 2) / new_zoom, point[1] - (y - display_height / 2) / new_zoom)
+    self.zoom = new_zoom
+    self.render()
+
+  def pan(self, dx, dy):
+    # move by screen pixels
+    self.center = (self.center[0] + dx / self.zoom, self.center[1] + dy / self.zoom)
+    self.render()
+
+  def onScroll(self, event):
+    self.zoomAt(1.25 ** event.step, event.xdata, event.ydata)
+
+  def onKey(self, event):
+    display_width, display_height = self.displaySize()
+    if event.key in ("+", "="):
+      self.zoomAt(1.5)
+    elif event.key == "-":
+      self.zoomAt(1 / 1.5)
+    elif event.key == "0":
+      _, height, width = self.levels[0]
+      self.center = (width / 2, height / 2)
+      self.zoom = self.fitZoom()
+      self.render()
+    elif event.key in ("left", "right", "up", "down"):
+      step_x, step_y = {"left": (-1, 0), "right": (1, 0), "up": (0, -1), "down": (0, 1)}[event.key]
+      self.pan(step_x * display_width / 4, step_y * display_height / 4)
+
+  def onPress(self, event):
+    if event.button == 1 and event.xdata is not None:
+      self.drag = (event.xdata, event.ydata)
+
+  def onMotion(self, event):
+    if self.drag is not None and event.xdata is not None:
+      self.pan(self.drag[0] - event.xdata, self.drag[1] - event.ydata)
+      self.drag = (event.xdata, event.ydata)
+
+  def onRelease(self, event):
+    self.drag = None
+
+  def show(self):
+    self.render()
+    plt.show()
+
+def expandPaths(patterns):
+  # files, directories (searched recursively) and glob patterns, in a stable order
+  paths = []
+  for pattern in patterns:
+    if os.path.isdir(pattern):
+      for root, dirs, files in os.walk(pattern):
+        dirs.sort()
+        paths += [os.path.join(root, f) for f in sorted(files) if f.lower().endswith(IMAGE_EXTENSIONS)]
+    elif os.path.isfile(pattern):
+      paths.append(pattern)
+    else:
+      paths += sorted(glob.glob(pattern, recursive=True))
+  return list(dict.fromkeys(paths))
+
+def thumbnailPaths(paths, out_dir):
+  # output file of each image, mirroring the input directories under out_dir; names that
+  # would still clash (0001.jpg and 0001.png) get a number and are reported
+  root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+  targets, used, collisions = [], set(), 0
+  for path in paths:
+    name = os.path.splitext(os.path.relpath(os.path.abspath(path), root))[0]
+    target, number = name + ".jpg", 1
+    while target in used:
+      number += 1
+      target = "%s_%d.jpg" % (name, number)
+    if number > 1:
+      print("%s would overwrite another thumbnail, writing %s instead" % (path, target))
+      collisions += 1
+    used.add(target)
+    targets.append(os.path.join(out_dir, target))
+  return targets, collisions
+
+def chooseDecode(path, size):
+  # largest reduced decode that still leaves at least size pixels on the long side,
+  # measured on one image since a batch of camera frames shares its resolution
+  image = cv2.imread(path)
+  if image is None:
+    return cv2.IMREAD_COLOR
+  for factor, flag in REDUCED_DECODES:
+    if max(image.shape[:2]) // factor >= size:
+      return flag
+  return cv2.IMREAD_COLOR
+
+def initWorker():
+  # one OpenCV thread per process, the pool already uses every core
+  cv2.setNumThreads(1)
+
+def makeThumbnail(path, size, interpolation, decode=cv2.IMREAD_COLOR, out_path=None):
+  # decode and shrink one image to fit in size x size, run in the worker processes
+  image = cv2.imread(path, decode)
+  if image is not None and decode != cv2.IMREAD_COLOR and max(image.shape[:2]) < size:
+    image = cv2.imread(path)  # smaller than the rest of the batch, decode it fully
+  if image is None:
+    return path, None
+  height, width = image.shape[:2]
+  scale = size / max(height, width)
+  thumbnail = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation = interpolation)
+  if out_path:
+    # written here so only the shape goes back to the main process
+    os.makedirs(os.path.dirname(out_path), exist_ok = True)
+    if not cv2.imwrite(out_path, thumbnail):
+      return path, None
+    return path, thumbnail.shape
+  return path, thumbnail
+
+def processImages(paths, size, interpolation, workers, prefetch, decode=cv2.IMREAD_COLOR, out_paths=None):
+  # yield (path, result) in order, keeping at most workers * prefetch images in flight
+  # so memory stays bounded however many files there are; with out_paths (one per path)
+  # the thumbnails are written there
+  with ProcessPoolExecutor(workers, initializer = initWorker) as pool:
+    pending = deque()
+    for i, path in enumerate(paths):
+      pending.append(pool.submit(makeThumbnail, path, size, interpolation, decode, out_paths[i] if out_paths else None))
+      if len(pending) >= workers * prefetch:
+        yield pending.popleft().result()
+    while pending:
+      yield pending.popleft().result()
+
+def contactSheet(thumbnails, size, columns, labels=True):
+  # paste (path, thumbnail) pairs into a grid of size x size cells
+  rows = (len(thumbnails) + columns - 1) // columns
+  sheet = np.full((rows * size, columns * size, 3), 32, dtype = np.uint8)
+  for i, (path, thumbnail) in enumerate(thumbnails):
+    height, width = thumbnail.shape[:2]
+    top = (i // columns) * size + (size - height) // 2
+    left = (i % columns) * size + (size - width) // 2
+    sheet[top:top + height, left:left + width] = thumbnail
+    if labels:
+      cv2.putText(sheet, os.path.basename(path)[:size // 8], ((i % columns) * size + 4, (i // columns + 1) * size - 6),
+                  cv2.FONT_HERSHEY_SIMPLEX, 0.35, (255, 255, 255), 1, cv2.LINE_AA)
+  return sheet
+
+def runBatch(args):
+  paths = expandPaths(args.paths)
+  if not paths:
+    print("No images found")
+    return 1
+  os.makedirs(args.out, exist_ok = True)
+  decode = chooseDecode(paths[0], args.size) if args.fast_decode else cv2.IMREAD_COLOR
+  interpolation = INTERPOLATIONS[args.interpolation]
+  per_sheet = args.columns * args.rows
+  out_paths, collisions = (None, 0) if args.sheet else thumbnailPaths(paths, args.out)
+
+  start = time.time()
+  done = failed = sheets = 0
+  batch = []
+  for path, result in processImages(paths, args.size, interpolation, args.workers, args.prefetch, decode, out_paths):
+    if result is None:
+      print("Could not read", path)
+      failed += 1
+      continue
+    done += 1
+    if args.sheet:
+      batch.append((path, result))
+      if len(batch) == per_sheet:
+        sheets += 1
+        cv2.imwrite(os.path.join(args.out, "sheet_%04d.jpg" % sheets), contactSheet(batch, args.size, args.columns, args.labels))
+        batch = []
+  if batch:
+    sheets += 1
+    cv2.imwrite(os.path.join(args.out, "sheet_%04d.jpg" % sheets), contactSheet(batch, args.size, args.columns, args.labels))
+  elapsed = time.time() - start
+
+  print("%d images (%d unreadable) in %.2fs: %.1f images/sec" % (done, failed, elapsed, done / elapsed if elapsed > 0 else 0))
+  if args.sheet:
+    print("%d contact sheets written to %s" % (sheets, args.out))
+  else:
+    print("Thumbnails written to %s (%d renamed to avoid overwriting another)" % (args.out, collisions))
+  return 0
+
+def runBenchmark(args):
+  # images/sec of decoding and resizing (nothing written) for each interpolation and worker count
+  paths = expandPaths(args.paths)[:args.limit]
+  if not paths:
+    print("No images found")
+    return 1
+  decode = chooseDecode(paths[0], args.size) if args.fast_decode else cv2.IMREAD_COLOR
+  workers = sorted(set(int(w) for w in args.benchmark_workers.split(",")))
+  print("%d images, %dpx thumbnails" % (len(paths), args.size))
+  print("%-10s" % "workers" + "".join("%12s" % name for name in INTERPOLATIONS))
+  for count in workers:
+    row = "%-10d" % count
+    for interpolation in INTERPOLATIONS.values():
+      start = time.time()
+      for _ in processImages(paths, args.size, interpolation, count, args.prefetch, decode):
+        pass
+      row += "%12.1f" % (len(paths) / (time.time() - start))
+    print(row)
+  return 0
+
+def main():
+  parser = argparse.ArgumentParser(description = "Show an image, or make thumbnails and contact sheets of many")
+  parser.add_argument("paths", nargs = "+", help = "Image files, directories or glob patterns")
+  parser.add_argument("--out", default = "previews", help = "Output directory of batch mode")
+  parser.add_argument("--size", type = int, default = 256, help = "Thumbnail size (long side, pixels)")
+  parser.add_argument("--sheet", action = "store_true", help = "Write contact sheets instead of thumbnails")
+  parser.add_argument("--columns", type = int, default = 8, help = "Thumbnails per contact sheet row")
+  parser.add_argument("--rows", type = int, default = 6, help = "Rows per contact sheet")
+  parser.add_argument("--no-labels", dest = "labels", action = "store_false", help = "Don't print file names on contact sheets")
+  parser.add_argument("--interpolation", choices = list(INTERPOLATIONS), default = "area", help = "Resize interpolation")
+  parser.add_argument("--workers", type = int, default = os.cpu_count(), help = "Decoding processes")
+  parser.add_argument("--prefetch", type = int, default = 4, help = "Images queued per process")
+  parser.add_argument("--fast-decode", action = "store_true", help = "Decode JPEGs at reduced size when the thumbnails allow it")
+  parser.add_argument("--viewer", action = "store_true", help = "Pan and zoom a large image through a cached tile pyramid")
+  parser.add_argument("--tile", type = int, default = TILE_SIZE, help = "Tile size of the viewer's pyramid")
+  parser.add_argument("--cache-dir", default = CACHE_DIR, help = "Where the viewer keeps pyramids")
+  parser.add_argument("--cache-size", type = int, default = CACHE_SIZE // 1024 ** 2,
+                      help = "Size (MB) above which the least recently viewed pyramids are removed")
+  parser.add_argument("--benchmark", action = "store_true", help = "Compare interpolation modes and worker counts")
+  parser.add_argument("--benchmark-workers", default = "1,2,4,%d" % os.cpu_count(), help = "Worker counts to compare")
+  parser.add_argument("--limit", type = int, default = 200, help = "Images used by the benchmark")
+  args = parser.parse_args()
+
+  if args.benchmark:
+    return runBenchmark(args)
+  if args.viewer:
+    TileViewer(args.paths[0], args.tile, args.cache_dir, args.cache_size * 1024 ** 2).show()
+    return 0
+  # a single file is shown like before, anything else is a batch
+  if len(args.paths) == 1 and os.path.isfile(args.paths[0]):
+    print('Number of arguments:', len(sys.argv), 'arguments.')
+    print('Argument List:', str(sys.argv))
+    imShow(args.paths[0])
+    return 0
+  return runBatch(args)
 
-imShow(sys.argv[1])
+if __name__ == "__main__":
+  sys.exit(main())
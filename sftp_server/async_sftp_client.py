@@ -0,0 +1,119 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sftp_pool import SFTPConnectionPool
+
+class TransferCancelled(Exception):
+    """Raised inside a worker thread to abort a transfer whose coroutine was cancelled."""
+
+class AsyncSFTPClient:
+    def __init__(self, host="localhost", port=2222, username="sftp_user", password=None, private_key_path=None,
+                 max_connections=8, **pool_options):
+        """
+        Initialize an asyncio SFTP client.
+        Blocking SFTP calls run on a fixed set of max_connections pooled connections,
+        each served by one worker thread, so any number of coroutines can be awaited
+        concurrently while at most max_connections operations hit the server.
+        """
+        self.max_connections = max_connections
+        self.pool = SFTPConnectionPool(host, port, username, password, private_key_path,
+                                       max_size=max_connections, **pool_options)
+        self._executor = None
+    
+    async def connect(self):
+        """Start the worker threads and open the pool's warm connections."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_connections,
+                                                thread_name_prefix="async-sftp")
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.pool.warm)
+        return True
+    
+    async def disconnect(self):
+        """Close all pooled connections and stop the worker threads."""
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+        self.pool.close()
+    
+    async def __aenter__(self):
+        """Async context manager entry."""
+        await self.connect()
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Async context manager exit."""
+        await self.disconnect()
+    
+    async def _run(self, method, *args, **kwargs):
+        """Run an SFTPClient method on a pooled connection without blocking the event loop."""
+        if self._executor is None:
+            raise RuntimeError("AsyncSFTPClient is not connected")
+        # Cancelling the awaiting coroutine drops the call if it is still queued
+        call = functools.partial(self.pool._run, method, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+    
+    async def _transfer(self, method, *args, callback=None, **kwargs):
+        """Run a transfer that a running worker abandons at its next progress update once cancelled."""
+        cancelled = threading.Event()
+        
+        def progress(transferred, total):
+            if cancelled.is_set():
+                raise TransferCancelled(f"{method} cancelled after {transferred} of {total} bytes")
+            if callback:
+                callback(transferred, total)
+        
+        try:
+            return await self._run(method, *args, callback=progress, **kwargs)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+    
+    async def upload_file(self, local_path, remote_path=None, callback=None, **kwargs):
+        """Upload a file to the SFTP server."""
+        return await self._transfer("upload_file", local_path, remote_path, callback=callback, **kwargs)
+    
+    async def download_file(self, remote_path, local_path=None, callback=None, **kwargs):
+        """Download a file from the SFTP server."""
+        return await self._transfer("download_file", remote_path, local_path, callback=callback, **kwargs)
+    
+    async def upload_bytes(self, data, remote_path, callback=None, **kwargs):
+        """Upload an in-memory buffer to the SFTP server."""
+        return await self._transfer("upload_bytes", data, remote_path, callback=callback, **kwargs)
+    
+    async def upload_stream(self, stream, remote_path, callback=None, **kwargs):
+        """Upload everything read from a file-like object to the SFTP server."""
+        return await self._transfer("upload_stream", stream, remote_path, callback=callback, **kwargs)
+    
+    async def download_into(self, remote_path, target, callback=None, **kwargs):
+        """Download a file into a writable buffer or file-like object."""
+        return await self._transfer("download_into", remote_path, target, callback=callback, **kwargs)
+    
+    async def ensure_directory(self, remote_path):
+        """Recursively create remote directories if they don't exist."""
+        return await self._run("ensure_directory", remote_path)
+    
+    async def create_directory(self, remote_path):
+        """Create a directory on the SFTP server."""
+        return await self._run("create_directory", remote_path)
+    
+    async def remove_file(self, remote_path):
+        """Remove a file from the SFTP server."""
+        return await self._run("remove_file", remote_path)
+    
+    async def remove_directory(self, remote_path, recursive=False):
+        """Remove a directory from the SFTP server."""
+        return await self._run("remove_directory", remote_path, recursive)
+    
+    async def list_directory(self, remote_path='.'):
+        """List contents of a directory on the SFTP server."""
+        return await self._run("list_directory", remote_path)
+    
+    async def file_exists(self, remote_path):
+        """Check if a file exists on the SFTP server."""
+        return await self._run("file_exists", remote_path)
+    
+    async def get_file_info(self, remote_path):
+        """Get detailed information about a file or directory."""
+        return await self._run("get_file_info", remote_path)
@@ -1,8 +1,19 @@
 import os
+import sys
 import json
 import time
+import signal
 import argparse
-from sftp_client import SFTPClient
+# Only the constants and the daemon client here: importing paramiko takes longer than a
+# command sent to a running daemon, so sftp_client is imported when a connection is needed
+from sftp_config import (DEFAULT_CHUNK_SIZE, DEFAULT_QUEUE_DEPTH, LISTING_FIELDS, CHECKSUM_ALGORITHMS,
+                         COMPRESSION_CODECS, PROFILE_STORE, DEDUP_ROOT)
+from sftp_daemon import SFTPDaemon, DaemonClient, default_socket_path, spawn_daemon
+
+# Commands a running daemon can execute
+DAEMON_COMMANDS = ("mkdir", "upload", "download", "ls", "find", "rm", "rmdir", "sync", "info")
+
+PRIVATE_KEY_PATH = "ssh_keys/sftp_key"
 
 def print_result(result):
     """Pretty print result dictionary."""
@@ -14,10 +25,26 @@ def create_directory(client, path):
     result = client.create_directory(path)
     print_result(result)
 
-def upload_file(client, local_path, remote_path=None):
-    """Upload a file to the SFTP server."""
+def upload_file(client, local_path, remote_path=None, streams=1, chunk_size=DEFAULT_CHUNK_SIZE, verify=None,
+                use_mmap=False, compress=None, dedup_root=None, delta=False, delta_exec=False):
+    """Upload a file to the SFTP server, or standard input if local_path is "-"."""
     print(f"Uploading {local_path} to {remote_path or 'root'}")
-    result = client.upload_file(local_path, remote_path)
+    if dedup_root:
+        from sftp_dedup import DedupStore
+        
+        result = DedupStore(client, dedup_root).upload_file(local_path, remote_path, streams=streams,
+                                                            chunk_size=chunk_size, verify=verify, use_mmap=use_mmap)
+        print_result(result)
+        print(f"Sent {result['bytes_sent'] / 1024:.2f} KB, saved {result['bytes_saved'] / 1024:.2f} KB")
+        return
+    if local_path == "-":
+        if not remote_path:
+            raise ValueError("A remote path is required when uploading standard input")
+        result = client.upload_stream(sys.stdin.buffer, remote_path, verify=verify)
+    else:
+        result = client.upload_file(local_path, remote_path, streams=streams, chunk_size=chunk_size, verify=verify,
+                                    use_mmap=use_mmap, compress=compress, delta=delta or delta_exec,
+                                    delta_exec=delta_exec)
     print_result(result)
     
     # Print speed information
@@ -25,10 +52,19 @@ def upload_file(client, local_path, remote_path=None):
     speed_mb = result["speed"] / (1024 * 1024)
     print(f"Uploaded {size_kb:.2f} KB at {speed_mb:.2f} MB/s")
 
-def download_file(client, remote_path, local_path=None):
-    """Download a file from the SFTP server."""
+def download_file(client, remote_path, local_path=None, streams=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                  queue_depth=DEFAULT_QUEUE_DEPTH, verify=None):
+    """Download a file from the SFTP server, or to standard output if local_path is "-"."""
+    if local_path == "-":
+        # Keep stdout for the data
+        result = client.download_into(remote_path, sys.stdout.buffer, queue_depth=queue_depth, verify=verify)
+        sys.stdout.buffer.flush()
+        print(f"Downloaded {result['size'] / 1024:.2f} KB at {result['speed'] / (1024 * 1024):.2f} MB/s", file=sys.stderr)
+        return
+    
     print(f"Downloading {remote_path} to {local_path or 'current directory'}")
-    result = client.download_file(remote_path, local_path)
+    result = client.download_file(remote_path, local_path, streams=streams, chunk_size=chunk_size,
+                                  queue_depth=queue_depth, verify=verify)
     print_result(result)
     
     # Print speed information
@@ -36,11 +72,32 @@ def download_file(client, remote_path, local_path=None):
     speed_mb = result["speed"] / (1024 * 1024)
     print(f"Downloaded {size_kb:.2f} KB at {speed_mb:.2f} MB/s")
 
-def list_directory(client, path='.'):
+def list_directory(client, path='.', stream=False, fields=None, raw_times=False, compact=False):
     """List contents of a directory on the SFTP server."""
-    print(f"Listing directory: {path}")
-    result = client.list_directory(path)
-    print_result(result)
+    if not stream:
+        print(f"Listing directory: {path}")
+        result = client.list_directory(path)
+        print_result(result)
+        return
+    
+    # One JSON document per line, written as entries arrive
+    for entry in client.iter_directory(path, fields=fields, raw_times=raw_times, compact=compact):
+        print(json.dumps(entry, separators=(",", ":")))
+
+def parse_time(value):
+    """Parse an ISO date/time, or an age like 30m, 12h or 7d, into epoch seconds."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+    if value and value[-1] in units and value[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(value[:-1]) * units[value[-1]]
+    from datetime import datetime
+    return datetime.fromisoformat(value).timestamp()
+
+def find_files(client, root, pattern=None, min_size=None, newer_than=None, file_type=None, workers=4,
+               use_exec=False):
+    """Search a remote tree, printing matches as NDJSON as they are found."""
+    for entry in client.find(root, pattern=pattern, min_size=min_size, newer_than=newer_than, type=file_type,
+                             workers=workers, use_exec=use_exec):
+        print(json.dumps(entry, separators=(",", ":")), flush=True)
 
 def remove_file(client, path):
     """Remove a file from the SFTP server."""
@@ -54,12 +111,132 @@ def remove_directory(client, path, recursive=False):
     result = client.remove_directory(path, recursive)
     print_result(result)
 
+def sync_directory(client, direction, source, destination, delete=False, dry_run=False):
+    """Mirror a directory tree to or from the SFTP server."""
+    print(f"Syncing {direction}: {source} -> {destination} (delete: {delete}, dry run: {dry_run})")
+    if direction == "up":
+        result = client.sync_up(source, destination, delete=delete, dry_run=dry_run)
+    else:
+        result = client.sync_down(source, destination, delete=delete, dry_run=dry_run)
+    print_result(result)
+    
+    print(f"{len(result['transferred'])} transferred, {result['unchanged']} unchanged, "
+          f"{len(result['deleted'])} deleted")
+
 def get_file_info(client, path):
     """Get information about a file or directory."""
     print(f"Getting info for: {path}")
     result = client.get_file_info(path)
     print_result(result)
 
+def calibrate_profile(args, size_mb=16, repeat=3, save=True):
+    """Time each transport profile against the server and save the fastest one."""
+    from sftp_benchmark import calibrate
+    
+    print(f"\n=== Calibrating transport profiles for {args.host}:{args.port} ===\n")
+    results = calibrate(args.host, args.port, args.username, args.password, PRIVATE_KEY_PATH,
+                        size=size_mb * 1024 * 1024, repeat=repeat, save=save)
+    
+    print(f"{'Profile':<24} {'Median':<12} {'Speed':<14} {'Cipher':<24}")
+    print(f"{'-'*70}")
+    for r in results:
+        print(f"{r['name']:<24} {r['median']:.4f}s {r['speed_mb']:.2f} MB/s {r['cipher']:<24}")
+    if save:
+        print(f"\nSaved {results[0]['name']} for {args.host}:{args.port} in {PROFILE_STORE}, use --profile auto")
+    return results
+
+def replicate_file(args):
+    """Upload a file to this server and the --to servers at once, reading it once."""
+    from sftp_replication import SFTPReplicator
+    
+    hosts = [f"{args.host}:{args.port}"] + args.to
+    print(f"Replicating {args.local_path} to {', '.join(hosts)}")
+    with SFTPReplicator.connect(hosts, args.username, args.password, PRIVATE_KEY_PATH, quorum=args.quorum,
+                                buffer_size=args.buffer * 1024 * 1024) as replicator:
+        result = replicator.upload_file(args.local_path, args.remote_path)
+    print_result(result)
+    for replica in result["replicas"]:
+        print(f"{replica['host']}:{replica['port']:<8} {replica['status']:<8} "
+              f"{replica['speed'] / (1024 * 1024):.2f} MB/s")
+    return 1 if "error" in result else 0
+
+def print_stats(metrics, output_format="json"):
+    """Print the collected client metrics."""
+    print("\n=== Client Stats ===\n")
+    if output_format == "prometheus":
+        print(metrics.to_prometheus(), end="")
+    else:
+        print(json.dumps(metrics.snapshot(), indent=2))
+
+def run_daemon(args):
+    """Start, stop or query the background daemon holding warm connections to the server."""
+    socket_path = default_socket_path(args.host, args.port, args.username)
+    if args.action == "start" and args.foreground:
+        daemon = SFTPDaemon(args.host, args.port, args.username, args.password, PRIVATE_KEY_PATH,
+                            socket_path=socket_path, max_connections=args.connections,
+                            idle_timeout=args.idle_timeout or None, profile=args.profile, retries=args.retries)
+        daemon.start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+        print(f"SFTP daemon for {args.username}@{args.host}:{args.port} listening on {socket_path}")
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    
+    client = DaemonClient(socket_path)
+    running = client.connect()
+    try:
+        if args.action == "start":
+            if running:
+                print(f"SFTP daemon already running on {socket_path}")
+                return 0
+            argv = [os.path.abspath(__file__), "--host", args.host, "--port", str(args.port),
+                    "--username", args.username, "daemon", "start", "--foreground",
+                    "--idle-timeout", str(args.idle_timeout), "--connections", str(args.connections)]
+            if args.profile:
+                argv[1:1] = ["--profile", args.profile]
+            if args.retries:
+                argv[1:1] = ["--retries", str(args.retries)]
+            # Through the environment, so the password doesn't show in the process list
+            env = dict(os.environ)
+            if args.password:
+                env["SFTP_PASSWORD"] = args.password
+            pid = spawn_daemon(argv, socket_path, env=env)
+            print(f"SFTP daemon started (pid {pid}) on {socket_path}")
+        elif not running:
+            print(f"No SFTP daemon running on {socket_path}")
+            return 1
+        elif args.action == "stop":
+            client.stop()
+            print("SFTP daemon stopped")
+        else:
+            print_result(client.status())
+    finally:
+        client.disconnect()
+    return 0
+
+def connect_daemon(args):
+    """Get a client for the running daemon if the command can go through it, otherwise None."""
+    if args.no_daemon or args.stats or args.command not in DAEMON_COMMANDS:
+        return None
+    # Standard input and output belong to this process
+    if getattr(args, "local_path", None) == "-" or getattr(args, "dedup", None):
+        return None
+    client = DaemonClient(default_socket_path(args.host, args.port, args.username))
+    if not client.connect():
+        return None
+    # The daemon's connections were opened with its own settings
+    if args.profile or args.retries:
+        status = client.status()
+        if ((args.profile and status.get("profile") != args.profile)
+                or (args.retries and status.get("retries") != args.retries)):
+            print(f"The SFTP daemon runs with --profile {status.get('profile')} --retries {status.get('retries')}, "
+                  f"connecting directly instead", file=sys.stderr)
+            client.disconnect()
+            return None
+    return client
+
 def create_test_file(filename, size):
     """Create a test file with random data."""
     with open(filename, 'wb') as f:
@@ -68,6 +245,8 @@ def create_test_file(filename, size):
 
 def run_performance_test(client):
     """Run performance tests with files of various sizes."""
+    from sftp_client import files_match
+    
     print("\n=== Running Performance Tests ===\n")
     
     # Create test directory
@@ -109,8 +288,7 @@ def run_performance_test(client):
         download_speed = actual_size / download_time if download_time > 0 else 0
         
         # Verify file integrity
-        with open(local_path, "rb") as f1, open(local_download, "rb") as f2:
-            match = f1.read() == f2.read()
+        match = files_match(local_path, local_download)
         
         # Store results
         result = {
@@ -144,6 +322,11 @@ def main():
     parser.add_argument("--port", type=int, default=2222, help="SFTP server port")
     parser.add_argument("--username", default="sftp_user", help="SFTP username")
     parser.add_argument("--password", help="SFTP password (if not provided, SFTP_PASSWORD environment variable will be used)")
+    parser.add_argument("--profile", help="Transport tuning profile: lan, wan, cpu_constrained, low_bandwidth, or auto for the calibrated one")
+    parser.add_argument("--stats", action="store_true", help="Print latency, request and byte counters when the command finishes")
+    parser.add_argument("--stats-format", choices=["json", "prometheus"], default="json", help="Output format for --stats")
+    parser.add_argument("--retries", type=int, default=0, help="Reconnect and retry this many times when the connection drops")
+    parser.add_argument("--no-daemon", action="store_true", help="Connect directly even if a daemon is running for this server")
     
     subparsers = parser.add_subparsers(dest="command", help="Command to execute")
     
@@ -153,17 +336,44 @@ def main():
     
     # upload command
     upload_parser = subparsers.add_parser("upload", help="Upload a file")
-    upload_parser.add_argument("local_path", help="Local file path")
+    upload_parser.add_argument("local_path", help="Local file path, or - for standard input")
     upload_parser.add_argument("remote_path", nargs="?", help="Remote path (optional)")
+    upload_parser.add_argument("--streams", type=int, default=1, help="Number of parallel SFTP channels")
+    upload_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Byte range size per stream in parallel mode")
+    upload_parser.add_argument("--compress", choices=list(COMPRESSION_CODECS) + ["auto"], help="Compress while sending; downloads decompress transparently")
+    upload_parser.add_argument("--mmap", action="store_true", help="Read the local file through a memory map")
+    upload_parser.add_argument("--delta", action="store_true", help="Only send the blocks that differ from the remote copy")
+    upload_parser.add_argument("--delta-exec", action="store_true", help="Like --delta, computing remote signatures with python3 over ssh exec if needed")
+    upload_parser.add_argument("--dedup", action="store_true", help="Skip content already stored on the server and copy or link it there instead")
+    upload_parser.add_argument("--dedup-root", default=DEDUP_ROOT, help="Remote root of the deduplicating store")
+    upload_parser.add_argument("--verify", metavar="ALGORITHM", help=f"Hash the data while sending and store a checksum file ({', '.join(CHECKSUM_ALGORITHMS)})")
     
     # download command
     download_parser = subparsers.add_parser("download", help="Download a file")
     download_parser.add_argument("remote_path", help="Remote file path")
-    download_parser.add_argument("local_path", nargs="?", help="Local path (optional)")
+    download_parser.add_argument("local_path", nargs="?", help="Local path (optional), or - for standard output")
+    download_parser.add_argument("--streams", type=int, default=1, help="Number of parallel SFTP channels")
+    download_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Byte range size per stream in parallel mode")
+    download_parser.add_argument("--queue-depth", type=int, default=DEFAULT_QUEUE_DEPTH, help="Outstanding read requests per stream")
+    download_parser.add_argument("--verify", metavar="ALGORITHM", help=f"Hash the data while receiving and check it against the remote checksum file ({', '.join(CHECKSUM_ALGORITHMS)})")
     
     # ls command
     ls_parser = subparsers.add_parser("ls", help="List directory contents")
     ls_parser.add_argument("path", nargs="?", default=".", help="Directory path to list")
+    ls_parser.add_argument("--stream", action="store_true", help="Stream entries as NDJSON as they arrive")
+    ls_parser.add_argument("--fields", type=lambda v: v.split(","), help=f"Comma-separated fields to include with --stream ({','.join(LISTING_FIELDS)})")
+    ls_parser.add_argument("--raw-times", action="store_true", help="Epoch timestamps instead of ISO strings with --stream")
+    ls_parser.add_argument("--compact", action="store_true", help="JSON arrays instead of objects with --stream")
+    
+    # find command
+    find_parser = subparsers.add_parser("find", help="Search a directory tree, streaming matches as NDJSON")
+    find_parser.add_argument("root", nargs="?", default=".", help="Directory to search")
+    find_parser.add_argument("--name", help="Glob matched against names, or against paths below root if it contains / (** spans directories)")
+    find_parser.add_argument("--min-size", type=int, help="Minimum file size in bytes")
+    find_parser.add_argument("--newer-than", type=parse_time, help="ISO date/time, or an age like 30m, 12h or 7d")
+    find_parser.add_argument("--type", choices=["f", "d", "l"], help="Entry type: file, directory or symlink")
+    find_parser.add_argument("--workers", type=int, default=4, help="Directories listed concurrently")
+    find_parser.add_argument("--exec", action="store_true", help="Run find on the server over ssh exec when allowed")
     
     # rm command
     rm_parser = subparsers.add_parser("rm", help="Remove a file")
@@ -174,35 +384,89 @@ def main():
     rmdir_parser.add_argument("path", help="Directory path to remove")
     rmdir_parser.add_argument("-r", "--recursive", action="store_true", help="Remove recursively")
     
+    # sync command
+    sync_parser = subparsers.add_parser("sync", help="Mirror a directory tree, transferring only changed files")
+    sync_parser.add_argument("direction", choices=["up", "down"], help="up: local -> remote, down: remote -> local")
+    sync_parser.add_argument("source", help="Source directory")
+    sync_parser.add_argument("destination", help="Destination directory")
+    sync_parser.add_argument("--delete", action="store_true", help="Delete destination files missing from the source")
+    sync_parser.add_argument("-n", "--dry-run", action="store_true", help="Only show what would be done")
+    
     # info command
     info_parser = subparsers.add_parser("info", help="Get file/directory info")
     info_parser.add_argument("path", help="Path to get info for")
     
+    # calibrate command
+    calibrate_parser = subparsers.add_parser("calibrate", help="Find and save the fastest transport profile for this server")
+    calibrate_parser.add_argument("--size", type=int, default=16, help="Test file size in MB")
+    calibrate_parser.add_argument("--repeat", type=int, default=3, help="Timed round trips per profile")
+    calibrate_parser.add_argument("--no-save", action="store_true", help="Only report, don't save the fastest profile")
+    
+    # daemon command
+    daemon_parser = subparsers.add_parser("daemon", help="Keep connections open in the background for the next commands")
+    daemon_parser.add_argument("action", choices=["start", "stop", "status"], help="Daemon action")
+    daemon_parser.add_argument("--foreground", action="store_true", help="Run the daemon in this process")
+    daemon_parser.add_argument("--idle-timeout", type=int, default=600, help="Exit after this many seconds without commands (0: never)")
+    daemon_parser.add_argument("--connections", type=int, default=4, help="Maximum concurrent SFTP connections")
+    
+    # replicate command
+    replicate_parser = subparsers.add_parser("replicate", help="Upload a file to several servers at once")
+    replicate_parser.add_argument("local_path", help="Local file path")
+    replicate_parser.add_argument("remote_path", nargs="?", help="Remote path on every server (optional)")
+    replicate_parser.add_argument("--to", action="append", default=[], metavar="HOST:PORT", help="Another server to upload to (repeatable)")
+    replicate_parser.add_argument("--quorum", type=int, help="Servers that must store the file (default: all)")
+    replicate_parser.add_argument("--buffer", type=int, default=64, help="MB a slow server may fall behind before it is dropped")
+    
     # performance test command
     perf_parser = subparsers.add_parser("perftest", help="Run performance tests")
     
     args = parser.parse_args()
     
-    # Create and connect SFTP client
-    client = SFTPClient(args.host, args.port, args.username, args.password, private_key_path="ssh_keys/sftp_key")
-    if not client.connect():
-        print("Failed to connect to SFTP server")
-        return 1
+    if args.command == "daemon":
+        return run_daemon(args)
+    if args.command == "replicate":
+        return replicate_file(args)
+    if args.command == "calibrate":
+        # Calibration opens its own connection for each profile
+        calibrate_profile(args, args.size, args.repeat, not args.no_save)
+        return 0
+    
+    # Reuse the daemon's connections when one is running for this server
+    metrics = None
+    client = connect_daemon(args)
+    if client is None:
+        from sftp_client import SFTPClient
+        from sftp_metrics import SFTPMetrics
+        
+        # Create and connect SFTP client
+        metrics = SFTPMetrics() if args.stats else None
+        client = SFTPClient(args.host, args.port, args.username, args.password, private_key_path=PRIVATE_KEY_PATH,
+                            metrics=metrics, profile=args.profile, retries=args.retries)
+        if not client.connect():
+            print("Failed to connect to SFTP server")
+            return 1
     
     try:
         # Execute the specified command
         if args.command == "mkdir":
             create_directory(client, args.path)
         elif args.command == "upload":
-            upload_file(client, args.local_path, args.remote_path)
+            upload_file(client, args.local_path, args.remote_path, args.streams, args.chunk_size, args.verify,
+                        args.mmap, args.compress, args.dedup and args.dedup_root, args.delta, args.delta_exec)
         elif args.command == "download":
-            download_file(client, args.remote_path, args.local_path)
+            download_file(client, args.remote_path, args.local_path, args.streams, args.chunk_size,
+                          args.queue_depth, args.verify)
         elif args.command == "ls":
-            list_directory(client, args.path)
+            list_directory(client, args.path, args.stream, args.fields, args.raw_times, args.compact)
+        elif args.command == "find":
+            find_files(client, args.root, args.name, args.min_size, args.newer_than, args.type, args.workers,
+                       args.exec)
         elif args.command == "rm":
             remove_file(client, args.path)
         elif args.command == "rmdir":
             remove_directory(client, args.path, args.recursive)
+        elif args.command == "sync":
+            sync_directory(client, args.direction, args.source, args.destination, args.delete, args.dry_run)
         elif args.command == "info":
             get_file_info(client, args.path)
         elif args.command == "perftest":
@@ -212,6 +476,8 @@ def main():
     finally:
         # Always disconnect when done
         client.disconnect()
+        if metrics:
+            print_stats(metrics, args.stats_format)
     
     return 0
 
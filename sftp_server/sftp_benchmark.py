@@ -0,0 +1,366 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import paramiko
+from concurrent.futures import ThreadPoolExecutor
+from sftp_client import SFTPClient, TRANSPORT_PROFILES, PROFILE_STORE, save_profile
+from sftp_pool import SFTPConnectionPool
+from sftp_test_server import LocalSFTPServer
+
+REMOTE_ROOT = "sftp_benchmark"
+DEFAULT_THRESHOLD = 0.10
+
+# Scenario sizes: the full run and a quick run for CI and smoke tests
+PRESETS = {
+    "full": {
+        "file_sizes": [(1024, "1KB"), (1024 * 1024, "1MB"), (10 * 1024 * 1024, "10MB"), (100 * 1024 * 1024, "100MB")],
+        "small_files": (1000, 4096),
+        "listing_size": 10000,
+        "delete_tree": (10, 100),
+        "concurrency": [1, 2, 4, 8],
+        "concurrency_files": (32, 1024 * 1024),
+        "repeat": 5,
+        "warmup": 1,
+    },
+    "quick": {
+        "file_sizes": [(1024, "1KB"), (1024 * 1024, "1MB")],
+        "small_files": (50, 4096),
+        "listing_size": 200,
+        "delete_tree": (3, 10),
+        "concurrency": [1, 4],
+        "concurrency_files": (8, 64 * 1024),
+        "repeat": 3,
+        "warmup": 0,
+    },
+}
+
+SCENARIOS = ("single_file", "small_files", "listing", "recursive_delete", "concurrency")
+
+def percentile(values, fraction):
+    """Linear-interpolated percentile of a list of numbers, fraction in [0, 1]."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(samples, size=None, count=None):
+    """
+    Summarize timing samples in seconds.
+    size (bytes) adds a median throughput, count (items per run) a median rate.
+    """
+    median = statistics.median(samples)
+    summary = {
+        "runs": len(samples),
+        "median": median,
+        "p95": percentile(samples, 0.95),
+        "p99": percentile(samples, 0.99),
+        "mean": statistics.mean(samples),
+        "min": min(samples),
+        "max": max(samples),
+    }
+    if size is not None:
+        summary["bytes"] = size
+        summary["speed_mb"] = size / median / (1024 * 1024) if median > 0 else 0
+    if count is not None:
+        summary["items"] = count
+        summary["items_per_sec"] = count / median if median > 0 else 0
+    return summary
+
+def measure(func, repeat, warmup=0, setup=None):
+    """Time func() with perf_counter, running setup() untimed before each call."""
+    samples = []
+    for i in range(warmup + repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            samples.append(elapsed)
+    return samples
+
+def create_file(path, size):
+    """Create a local file of random data."""
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    return path
+
+def bench_single_file(client, config, workdir):
+    """Upload and download throughput of one file per size."""
+    results = {}
+    for size, name in config["file_sizes"]:
+        local_path = create_file(os.path.join(workdir, f"single_{name}.bin"), size)
+        remote_path = f"{REMOTE_ROOT}/single_{name}.bin"
+        download_path = os.path.join(workdir, f"download_{name}.bin")
+        
+        samples = measure(lambda: client.upload_file(local_path, remote_path, write_checksum=False),
+                          config["repeat"], config["warmup"])
+        results[f"upload/{name}"] = summarize(samples, size=size)
+        samples = measure(lambda: client.download_file(remote_path, download_path),
+                          config["repeat"], config["warmup"])
+        results[f"download/{name}"] = summarize(samples, size=size)
+        
+        client.remove_file(remote_path)
+        os.remove(local_path)
+        os.remove(download_path)
+    return results
+
+def bench_small_files(client, config, workdir):
+    """Files per second when uploading many small files."""
+    count, size = config["small_files"]
+    local_dir = os.path.join(workdir, "small")
+    os.makedirs(local_dir, exist_ok=True)
+    pairs = [(create_file(os.path.join(local_dir, f"file_{i:05d}.bin"), size), f"{REMOTE_ROOT}/small/file_{i:05d}.bin")
+             for i in range(count)]
+    
+    samples = measure(lambda: client.upload_many(pairs), config["repeat"], config["warmup"])
+    client.remove_directory(f"{REMOTE_ROOT}/small", recursive=True)
+    shutil.rmtree(local_dir)
+    return {f"upload_many/{count}x{size}": summarize(samples, size=count * size, count=count)}
+
+def bench_listing(client, config, workdir):
+    """Listing a huge directory, buffered and streamed."""
+    count = config["listing_size"]
+    local_path = create_file(os.path.join(workdir, "empty.bin"), 0)
+    remote_dir = f"{REMOTE_ROOT}/listing"
+    client.upload_many([(local_path, f"{remote_dir}/entry_{i:06d}") for i in range(count)], concurrency=8)
+    
+    results = {}
+    samples = measure(lambda: client.list_directory(remote_dir), config["repeat"], config["warmup"])
+    results[f"list_directory/{count}"] = summarize(samples, count=count)
+    samples = measure(lambda: sum(1 for _ in client.iter_directory(remote_dir)), config["repeat"], config["warmup"])
+    results[f"iter_directory/{count}"] = summarize(samples, count=count)
+    
+    client.remove_directory(remote_dir, recursive=True)
+    os.remove(local_path)
+    return results
+
+def bench_recursive_delete(client, config, workdir):
+    """Recursive delete of a populated tree, serially and over several channels."""
+    directories, files_per_directory = config["delete_tree"]
+    local_path = create_file(os.path.join(workdir, "tree.bin"), 128)
+    remote_dir = f"{REMOTE_ROOT}/tree"
+    pairs = [(local_path, f"{remote_dir}/d{d:03d}/f{f:04d}.bin")
+             for d in range(directories) for f in range(files_per_directory)]
+    count = len(pairs)
+    
+    def populate():
+        client.upload_many(pairs)
+    
+    results = {}
+    for workers in (1, 4):
+        samples = measure(lambda: client.remove_directory(remote_dir, recursive=True, workers=workers),
+                          config["repeat"], config["warmup"], setup=populate)
+        results[f"remove_directory/{count}/w{workers}"] = summarize(samples, count=count)
+    os.remove(local_path)
+    return results
+
+def bench_concurrency(client, config, workdir):
+    """Aggregate upload throughput through a connection pool at several concurrency levels."""
+    count, size = config["concurrency_files"]
+    local_paths = [create_file(os.path.join(workdir, f"concurrent_{i:03d}.bin"), size) for i in range(count)]
+    client.ensure_directory(f"{REMOTE_ROOT}/concurrent")
+    
+    results = {}
+    for level in config["concurrency"]:
+        with SFTPConnectionPool(client.host, client.port, client.username, client.password,
+                                client.private_key_path, max_size=level, min_size=level,
+                                profile=client.profile) as pool:
+            def run():
+                with ThreadPoolExecutor(max_workers=level) as executor:
+                    futures = [executor.submit(pool.upload_file, path, f"{REMOTE_ROOT}/concurrent/{os.path.basename(path)}",
+                                               write_checksum=False)
+                               for path in local_paths]
+                    for future in futures:
+                        future.result()
+            samples = measure(run, config["repeat"], config["warmup"])
+        results[f"concurrent_upload/{count}x{size}/c{level}"] = summarize(samples, size=count * size, count=count)
+    
+    client.remove_directory(f"{REMOTE_ROOT}/concurrent", recursive=True)
+    for path in local_paths:
+        os.remove(path)
+    return results
+
+BENCHMARKS = {
+    "single_file": bench_single_file,
+    "small_files": bench_small_files,
+    "listing": bench_listing,
+    "recursive_delete": bench_recursive_delete,
+    "concurrency": bench_concurrency,
+}
+
+def run_benchmarks(client, config, scenarios=SCENARIOS, verbose=True):
+    """Run the selected scenarios and return a JSON-serializable report."""
+    workdir = tempfile.mkdtemp(prefix="sftp_benchmark_")
+    results = {}
+    try:
+        client.ensure_directory(REMOTE_ROOT)
+        for scenario in scenarios:
+            if verbose:
+                print(f"Running {scenario}...", file=sys.stderr)
+            results.update(BENCHMARKS[scenario](client, config, workdir))
+        client.remove_directory(REMOTE_ROOT, recursive=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "paramiko": paramiko.__version__,
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare median times against a baseline report.
+    Returns one entry per benchmark present in both, flagged as a regression
+    when the median is more than threshold (a fraction) slower than the baseline.
+    """
+    comparison = []
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        change = (current["median"] - previous["median"]) / previous["median"] if previous["median"] > 0 else 0
+        comparison.append({
+            "name": name,
+            "baseline": previous["median"],
+            "current": current["median"],
+            "change": change,
+            "regression": change > threshold,
+        })
+    return comparison
+
+def print_report(report, comparison=None):
+    """Print results as a table, with the baseline change when available."""
+    changes = {c["name"]: c for c in comparison or []}
+    print(f"{'Benchmark':<40} {'Median':>10} {'p95':>10} {'p99':>10} {'Rate':>16} {'vs Baseline':>14}")
+    print(f"{'-'*104}")
+    for name, r in report["results"].items():
+        if "speed_mb" in r:
+            rate = f"{r['speed_mb']:.2f} MB/s"
+        else:
+            rate = f"{r['items_per_sec']:.0f} items/s"
+        change = ""
+        if name in changes:
+            c = changes[name]
+            change = f"{c['change']:+.1%}" + (" REGRESSED" if c["regression"] else "")
+        print(f"{name:<40} {r['median']:>9.4f}s {r['p95']:>9.4f}s {r['p99']:>9.4f}s {rate:>16} {change:>14}")
+
+def calibration_candidates():
+    """Named profiles plus window size variations of the lan profile."""
+    candidates = {name: settings for name, settings in TRANSPORT_PROFILES.items()}
+    for window_mb in (2, 16, 32):
+        candidates[f"lan/window={window_mb}MB"] = dict(TRANSPORT_PROFILES["lan"], window_size=window_mb * 1024 * 1024)
+    candidates["lan/compressed"] = dict(TRANSPORT_PROFILES["lan"], compress=True)
+    return candidates
+
+def calibrate(host, port, username="sftp_user", password=None, private_key_path=None, size=16 * 1024 * 1024,
+              repeat=3, candidates=None, save=True, store=PROFILE_STORE, verbose=True):
+    """
+    Time an upload and download of size bytes with each candidate transport profile
+    (see calibration_candidates) on fresh connections to the server, and return the
+    results sorted fastest first. The fastest settings are saved for host:port in
+    store when save is True, for use with SFTPClient(profile="auto").
+    """
+    candidates = candidates or calibration_candidates()
+    workdir = tempfile.mkdtemp(prefix="sftp_calibrate_")
+    local_path = create_file(os.path.join(workdir, "calibrate.bin"), size)
+    download_path = os.path.join(workdir, "download.bin")
+    remote_path = f"{REMOTE_ROOT}_calibrate.bin"
+    
+    results = []
+    try:
+        for name, settings in candidates.items():
+            with SFTPClient(host, port, username, password, private_key_path, profile=settings) as client:
+                if client.sftp is None:
+                    raise ConnectionError(f"Failed to connect to SFTP server {host}:{port}")
+                
+                def round_trip():
+                    client.upload_file(local_path, remote_path, write_checksum=False)
+                    client.download_file(remote_path, download_path)
+                
+                samples = measure(round_trip, repeat, warmup=1)
+                client.remove_file(remote_path)
+                cipher = client.transport.remote_cipher
+            summary = summarize(samples, size=2 * size)
+            results.append({"name": name, "settings": settings, "cipher": cipher, **summary})
+            if verbose:
+                print(f"{name:<24} {summary['median']:.4f}s {summary['speed_mb']:.2f} MB/s ({cipher})", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    results.sort(key=lambda r: r["median"])
+    if save:
+        save_profile(host, port, results[0]["settings"], store)
+    return results
+
+def main():
+    """Main function to parse arguments and run the benchmarks."""
+    parser = argparse.ArgumentParser(description="SFTP Client Benchmark Suite")
+    parser.add_argument("--host", help="Benchmark an external SFTP server instead of an in-process one")
+    parser.add_argument("--port", type=int, default=2222, help="SFTP server port (with --host)")
+    parser.add_argument("--username", default="sftp_user", help="SFTP username")
+    parser.add_argument("--password", help="SFTP password (if not provided, SFTP_PASSWORD environment variable will be used)")
+    parser.add_argument("--profile", help="Transport tuning profile (lan, wan, cpu_constrained, low_bandwidth, auto)")
+    parser.add_argument("--quick", action="store_true", help="Small sizes and few repetitions")
+    parser.add_argument("--repeat", type=int, help="Timed repetitions per benchmark")
+    parser.add_argument("--warmup", type=int, help="Untimed repetitions before measuring")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against a previous JSON results file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed median slowdown before a regression is reported (fraction)")
+    
+    args = parser.parse_args()
+    
+    config = dict(PRESETS["quick" if args.quick else "full"])
+    if args.repeat is not None:
+        config["repeat"] = args.repeat
+    if args.warmup is not None:
+        config["warmup"] = args.warmup
+    
+    server = None
+    if args.host:
+        client = SFTPClient(args.host, args.port, args.username, args.password, profile=args.profile)
+    else:
+        server = LocalSFTPServer(tempfile.mkdtemp(prefix="sftp_benchmark_root_"), username=args.username).start()
+        client = SFTPClient(server.host, server.port, args.username, password="benchmark", profile=args.profile)
+    
+    try:
+        if not client.connect():
+            print("Failed to connect to SFTP server")
+            return 1
+        report = run_benchmarks(client, config, args.scenario or SCENARIOS)
+    finally:
+        client.disconnect()
+        if server:
+            server.stop()
+            shutil.rmtree(server.root, ignore_errors=True)
+    
+    comparison = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparison = compare(report, json.load(f), args.threshold)
+    print_report(report, comparison)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    
+    if comparison and any(c["regression"] for c in comparison):
+        print("\nPerformance regression detected")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
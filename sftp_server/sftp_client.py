@@ -1,13 +1,528 @@
 import os
+import re
 import json
+import mmap
+import zlib
 import time
+import shlex
+import random
+import socket
+import hashlib
+import queue
+import fnmatch
+import inspect
+import functools
+import threading
 import paramiko
-from stat import S_ISDIR
+from stat import S_ISDIR, S_IFMT, S_IFREG, S_IFDIR, S_IFLNK
+from collections import deque, OrderedDict
+from contextlib import nullcontext
+from paramiko.sftp import CMD_READ, CMD_STATUS, CMD_REMOVE, int64
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from sftp_config import (DEFAULT_CHUNK_SIZE, READ_BLOCK_SIZE, DEFAULT_QUEUE_DEPTH, PARTIAL_SUFFIX, CHECKPOINT_SUFFIX,
+                         CHECKPOINT_DIR, CHECKPOINT_INTERVAL, RESUME_VERIFY_SIZE, CHECKSUM_ALGORITHMS, LISTING_FIELDS,
+                         DEFAULT_CACHE_SIZE, COMPRESSION_CODECS, COMPRESSION_META_SUFFIX, COMPRESSION_MIN_RATIO,
+                         COMPRESSION_THREADS_MIN_SIZE, TRANSPORT_PROFILES, PROFILE_STORE, DELTA_BLOCK_SIZE,
+                         DELTA_ALGORITHM, SIGNATURE_SUFFIX, RETRY_BACKOFF, RETRY_MAX_DELAY)
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# Sentinel telling worker threads to exit
+_STOP = object()
+
+# Prints the adler32 and strong hash of each block of a file, for signatures computed over an exec channel
+_SIGNATURE_SCRIPT = ("import sys, zlib, hashlib\n"
+                     "f = open(sys.argv[1], 'rb')\n"
+                     "for b in iter(lambda: f.read(int(sys.argv[2])), b''):\n"
+                     "    print(zlib.adler32(b), hashlib.new(sys.argv[3], b).hexdigest())\n")
+
+# Blocks hashed per check-file request, keeping each reply small
+_CHECK_FILE_BLOCKS = 4096
+
+# find() entry types, as printed by find's %y
+_FILE_TYPES = {S_IFREG: "f", S_IFDIR: "d", S_IFLNK: "l"}
+
+# Set while a thread runs a retried call, so the calls it makes don't retry on their own
+_retry_state = threading.local()
+
+def load_profiles(path=PROFILE_STORE):
+    """Load the saved per-host transport profiles."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_profile(host, port, settings, path=PROFILE_STORE):
+    """Save the transport settings to use for a host, see SFTPClient(profile="auto")."""
+    profiles = load_profiles(path)
+    profiles[f"{host}:{port}"] = settings
+    with open(path, 'w') as f:
+        json.dump(profiles, f, indent=2)
+
+def resolve_profile(profile, host=None, port=None, path=PROFILE_STORE):
+    """
+    Get the transport settings for a profile: a TRANSPORT_PROFILES name, a settings
+    dictionary, "auto" for the profile saved for host:port (default if none), or None.
+    """
+    if profile is None:
+        return {}
+    if isinstance(profile, dict):
+        return profile
+    if profile == "auto":
+        return load_profiles(path).get(f"{host}:{port}", {})
+    if profile not in TRANSPORT_PROFILES:
+        raise ValueError(f"Unknown transport profile: {profile} (expected one of {', '.join(TRANSPORT_PROFILES)} or auto)")
+    return TRANSPORT_PROFILES[profile]
+
+def new_hash(algorithm):
+    """Create a hash object for one of CHECKSUM_ALGORITHMS or any hashlib algorithm."""
+    if algorithm == "xxhash":
+        if xxhash is None:
+            raise ValueError("The xxhash algorithm requires the xxhash package (pip install xxhash)")
+        return xxhash.xxh3_128()
+    try:
+        return hashlib.new(algorithm)
+    except ValueError:
+        raise ValueError(f"Unsupported checksum algorithm: {algorithm}")
+
+class _LZ4Compressor:
+    """lz4 frame compressor with the compress/flush interface of zlib's."""
+    
+    def __init__(self):
+        self.compressor = lz4_frame.LZ4FrameCompressor()
+        self.started = False
+    
+    def compress(self, data):
+        if not self.started:
+            self.started = True
+            return self.compressor.begin() + self.compressor.compress(data)
+        return self.compressor.compress(data)
+    
+    def flush(self):
+        header = b"" if self.started else self.compressor.begin()
+        self.started = True
+        return header + self.compressor.flush()
+
+def _require_codec(codec):
+    """Check that a compression codec is known and its package is installed."""
+    if codec not in COMPRESSION_CODECS:
+        raise ValueError(f"Unsupported compression codec: {codec} (expected one of {', '.join(COMPRESSION_CODECS)} or auto)")
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("The zstd codec requires the zstandard package (pip install zstandard)")
+    if codec == "lz4" and lz4_frame is None:
+        raise ValueError("The lz4 codec requires the lz4 package (pip install lz4)")
+
+def new_compressor(codec, threads=0):
+    """
+    Create a streaming compressor with compress(data) and flush() methods.
+    threads > 0 (or -1 for all cores) compresses zstd frames on worker threads.
+    """
+    _require_codec(codec)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(threads=threads).compressobj()
+    if codec == "lz4":
+        return _LZ4Compressor()
+    return zlib.compressobj()
+
+def new_decompressor(codec):
+    """Create a streaming decompressor with a decompress(data) method."""
+    _require_codec(codec)
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj()
+    if codec == "lz4":
+        return lz4_frame.LZ4FrameDecompressor()
+    return zlib.decompressobj()
+
+def file_digest(path, algorithm="sha256", block_size=READ_BLOCK_SIZE):
+    """Hash a local file, reading it in fixed-size blocks."""
+    hasher = new_hash(algorithm)
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(block_size), b''):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+def block_signatures(f, block_size=DELTA_BLOCK_SIZE, algorithm=DELTA_ALGORITHM):
+    """Yield (offset, data, adler32, strong hash) for each block read from a binary file."""
+    offset = 0
+    for data in iter(lambda: f.read(block_size), b''):
+        yield offset, data, zlib.adler32(data), hashlib.new(algorithm, data).hexdigest()
+        offset += len(data)
+
+def glob_regex(pattern):
+    """
+    Compile a path glob where * and ? don't match '/' and a ** component matches
+    any number of directories (e.g. "logs/**/*.gz").
+    """
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            members = pattern[i + 1:end].replace('\\', '\\\\')
+            regex += '[' + ('^' + members[1:] if members.startswith('!') else members) + ']'
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(regex + r'\Z', re.DOTALL)
+
+def glob_may_contain(pattern, directory):
+    """
+    Check whether entries below directory (a path relative to the glob's root) can
+    match a path glob, so that find() can skip the subtrees that can't.
+    """
+    parts = pattern.split('/')
+    for i, component in enumerate(directory.split('/') if directory else []):
+        if parts[i] == '**':
+            return True
+        if i >= len(parts) - 1 or not fnmatch.fnmatchcase(component, parts[i]):
+            return False
+    return True
+
+def files_match(path1, path2, block_size=READ_BLOCK_SIZE):
+    """Compare two local files block by block without loading them into memory."""
+    if os.path.getsize(path1) != os.path.getsize(path2):
+        return False
+    with open(path1, 'rb') as f1, open(path2, 'rb') as f2:
+        while True:
+            data1 = f1.read(block_size)
+            if data1 != f2.read(block_size):
+                return False
+            if not data1:
+                return True
+
+
+class _HashingReader:
+    """File wrapper that hashes the data as it is read."""
+    
+    def __init__(self, f, hasher):
+        self.f = f
+        self.hasher = hasher
+    
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.hasher.update(data)
+        return data
+
+
+class _CompressingReader:
+    """
+    File wrapper whose read() returns the compressed data of the wrapped file.
+    The original data is hashed and reported to a _Progress as it is read.
+    """
+    
+    def __init__(self, f, compressor, hasher=None, progress=None):
+        self.f = f
+        self.compressor = compressor
+        self.hasher = hasher
+        self.progress = progress
+        self.buffer = b""
+        self.position = 0
+        self.flushed = False
+    
+    def _refill(self):
+        """Compress input until some output is available, or return b"" at the end."""
+        while True:
+            data = self.f.read(READ_BLOCK_SIZE)
+            if not data:
+                if self.flushed:
+                    return b""
+                self.flushed = True
+                return self.compressor.flush()
+            if self.hasher is not None:
+                self.hasher.update(data)
+            if self.progress is not None:
+                self.progress.update(len(data))
+            compressed = self.compressor.compress(data)
+            if compressed:
+                return compressed
+    
+    def read(self, size=-1):
+        if self.position >= len(self.buffer):
+            self.buffer, self.position = self._refill(), 0
+        end = len(self.buffer) if size < 0 else self.position + size
+        data = self.buffer[self.position:end]
+        self.position += len(data)
+        return data
+
+
+class _ReadPipeline:
+    """
+    Sliding window of outstanding read requests on an open remote file.
+    paramiko's own prefetch either issues every request for the file at once or
+    throttles them with a busy loop, so the window is driven directly through the
+    SFTP request layer (paramiko is pinned in requirements.txt).
+    """
+    
+    def __init__(self, sftp, remote_file, queue_depth):
+        self.sftp = sftp
+        self.remote_file = remote_file
+        self.queue_depth = max(1, queue_depth or DEFAULT_QUEUE_DEPTH)
+        self.responses = {}
+    
+    def _async_response(self, t, msg, num):
+        """Called by paramiko when a response to one of our requests arrives."""
+        self.responses[num] = (t, msg)
+    
+    def _request(self, offset, length):
+        return self.sftp._async_request(self, CMD_READ, self.remote_file.handle, int64(offset), int(length))
+    
+    def read_range(self, offset, length):
+        """Yield the data of a byte range in order, keeping the window full."""
+        pending = deque()
+        next_offset = offset
+        end = offset + length
+        while pending or next_offset < end:
+            while next_offset < end and len(pending) < self.queue_depth:
+                size = min(paramiko.SFTPFile.MAX_REQUEST_SIZE, end - next_offset)
+                pending.append((self._request(next_offset, size), next_offset, size))
+                next_offset += size
+            
+            num, request_offset, size = pending.popleft()
+            while num not in self.responses:
+                self.sftp._read_response()
+            t, msg = self.responses.pop(num)
+            if t == CMD_STATUS:
+                # Raises EOFError/IOError, including for reads past the end of the file
+                self.sftp._convert_status(msg)
+            data = msg.get_string()
+            
+            # Servers may return fewer bytes than requested; fetch the rest synchronously
+            while len(data) < size:
+                self.remote_file.seek(request_offset + len(data))
+                extra = self.remote_file.read(size - len(data))
+                if not extra:
+                    raise IOError(f"Short read at offset {request_offset}")
+                data += extra
+            yield data
+
+
+class _Progress:
+    """Thread-safe byte counter reporting to a callback(bytes_transferred, total_bytes)."""
+    
+    def __init__(self, callback, total):
+        self.callback = callback
+        self.total = total
+        self.transferred = 0
+        self.lock = threading.Lock()
+    
+    def update(self, count):
+        if self.callback is None:
+            return
+        with self.lock:
+            self.transferred += count
+            transferred = self.transferred
+        self.callback(transferred, self.total)
+    
+    def skip(self, count):
+        """Report bytes transferred earlier (a resumed offset), which a throttling callback doesn't rate limit."""
+        if self.callback is None:
+            return
+        skip = getattr(self.callback, "skip", None)
+        if skip is not None:
+            skip(count)
+        self.update(count)
+
+
+class MetadataCache:
+    """
+    LRU cache of remote stat results with a time-to-live, plus the directories
+    known to exist (with the same time-to-live and size limit). Only positive
+    results are cached, so a path created by another client is never reported
+    as missing.
+    """
+    
+    def __init__(self, ttl=30, max_entries=DEFAULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # path -> (SFTPAttributes, expiry time)
+        self.known_dirs = OrderedDict()  # path -> expiry time
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def _key(remote_path):
+        return os.path.normpath(remote_path)
+    
+    def get(self, remote_path):
+        """Get the cached attributes of a path, or None if unknown or expired."""
+        key = self._key(remote_path)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, remote_path, file_attr):
+        """Store the attributes of a path, evicting the least recently used entries."""
+        key = self._key(remote_path)
+        with self.lock:
+            self.entries[key] = (file_attr, time.time() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            if S_ISDIR(file_attr.st_mode or 0):
+                self._add_directory(key)
+    
+    def _add_directory(self, key):
+        self.known_dirs[key] = time.time() + self.ttl
+        self.known_dirs.move_to_end(key)
+        while len(self.known_dirs) > self.max_entries:
+            self.known_dirs.popitem(last=False)
+    
+    def add_directory(self, remote_path):
+        """Record that a directory exists."""
+        with self.lock:
+            self._add_directory(self._key(remote_path))
+    
+    def is_known_directory(self, remote_path):
+        """Check if a directory is known to exist and the record hasn't expired."""
+        key = self._key(remote_path)
+        with self.lock:
+            expiry = self.known_dirs.get(key)
+            if expiry is None or expiry < time.time():
+                if expiry is not None:
+                    del self.known_dirs[key]
+                return False
+            self.known_dirs.move_to_end(key)
+            return True
+    
+    def invalidate(self, remote_path, recursive=False):
+        """Forget a path, and everything below it if recursive is True."""
+        key = self._key(remote_path)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.known_dirs.pop(key, None)
+            if recursive:
+                prefix = key.rstrip('/') + '/'
+                for path in [p for p in self.entries if p.startswith(prefix)]:
+                    del self.entries[path]
+                for path in [d for d in self.known_dirs if d.startswith(prefix)]:
+                    del self.known_dirs[path]
+    
+    def clear(self):
+        """Forget everything."""
+        with self.lock:
+            self.entries.clear()
+            self.known_dirs.clear()
+    
+    def stats(self):
+        """Get cache hit/miss counters."""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries),
+                    "known_directories": len(self.known_dirs)}
+
+
+def _instrumented(size_key=None):
+    """
+    Record calls of an SFTPClient method in the client's metrics (if any) under the method name.
+    size_key names the result field holding the number of bytes the call transferred.
+    Results reporting an "error" instead of raising count as "failed" errors.
+    Generator methods are timed until they are exhausted or closed.
+    """
+    def decorator(func):
+        operation = func.__name__
+        
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator(self, *args, **kwargs):
+                if self.metrics is None:
+                    return (yield from func(self, *args, **kwargs))
+                with self.metrics.time(operation):
+                    return (yield from func(self, *args, **kwargs))
+            return generator
+        
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return func(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = func(self, *args, **kwargs)
+            except Exception as e:
+                self.metrics.observe(operation, time.perf_counter() - start, error=e)
+                raise
+            size = error = None
+            if isinstance(result, dict):
+                size = result.get(size_key) if size_key else None
+                error = "failed" if result.get("error") else None
+            self.metrics.observe(operation, time.perf_counter() - start, size=size, error=error)
+            return result
+        return wrapper
+    return decorator
+
+
+def _retried(func):
+    """
+    Retry an idempotent SFTPClient method after connection failures, reconnecting
+    first (see the retries option). The whole call is repeated, so it must be safe
+    to run again after it was cut off halfway.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        return self._with_retries(func.__name__, func, self, *args, **kwargs)
+    return wrapper
+
 
 class SFTPClient:
-    def __init__(self, host="localhost", port=2222, username="sftp_user", password=None, private_key_path=None):
-        """Initialize SFTP client with connection parameters."""
+    def __init__(self, host="localhost", port=2222, username="sftp_user", password=None, private_key_path=None,
+                 cache_ttl=None, cache_size=DEFAULT_CACHE_SIZE, metrics=None, profile=None, retries=0,
+                 retry_backoff=RETRY_BACKOFF, retry_max_delay=RETRY_MAX_DELAY, keepalive=None, timeout=None,
+                 checkpoint_dir=CHECKPOINT_DIR, clean_sidecars=False):
+        """
+        Initialize SFTP client with connection parameters.
+        If cache_ttl is set, remote stat results are cached for that many seconds
+        (see MetadataCache) to avoid repeated round trips.
+        If metrics is an SFTPMetrics instance, operation latencies, SFTP requests,
+        payload bytes and errors are recorded in it.
+        profile tunes the SSH transport: a TRANSPORT_PROFILES name (e.g. "lan", "wan"),
+        a settings dictionary, or "auto" for the profile calibrated for this host.
+        With retries, stat and listdir requests and the idempotent transfer methods
+        (upload_file, upload_bytes, download_file, ensure_directory) reconnect and run
+        again up to that many times when the connection fails, after an exponential
+        backoff with jitter (see RETRY_BACKOFF); a session found dead before a call is
+        reconnected first. keepalive sends a keepalive packet after that many idle
+        seconds (default: the profile's), and timeout bounds the TCP connect and each
+        wait for a response, so a hung session fails and is retried instead of blocking.
+        checkpoint_dir is where resumable uploads record their progress.
+        With clean_sidecars, every upload also removes the checksum files and compressed
+        copy earlier uploads by this client left next to the file (see _update_sidecars);
+        otherwise only uploads writing a checksum file do, so that plain uploads cost no
+        extra requests.
+        """
         self.host = host
         self.port = port
         self.username = username
@@ -15,31 +530,90 @@ class SFTPClient:
         self.private_key_path = private_key_path
         self.transport = None
         self.sftp = None
+        self.cache = MetadataCache(cache_ttl, cache_size) if cache_ttl else None
+        self.metrics = metrics
+        self.profile = resolve_profile(profile, host, port)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_max_delay = retry_max_delay
+        self.keepalive = keepalive if keepalive is not None else self.profile.get("keepalive")
+        self.timeout = timeout
+        self.checkpoint_dir = checkpoint_dir
+        self.clean_sidecars = clean_sidecars
         
+    def _create_transport(self, sock):
+        """Create an unstarted transport over sock with the profile's settings applied."""
+        settings = self.profile
+        if settings.get("nodelay"):
+            # Don't hold back small writes until the previous segment is acknowledged
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive:
+            # Let the kernel notice a peer that vanished without closing the connection
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        transport = paramiko.Transport(
+            sock,
+            default_window_size=settings.get("window_size", paramiko.common.DEFAULT_WINDOW_SIZE),
+            default_max_packet_size=settings.get("max_packet_size", paramiko.common.DEFAULT_MAX_PACKET_SIZE))
+        
+        options = transport.get_security_options()
+        for name in ("ciphers", "digests"):
+            if name in settings:
+                available = getattr(options, name)
+                preferred = [n for n in settings[name] if n in available]
+                setattr(options, name, preferred + [n for n in available if n not in preferred])
+        if "compress" in settings:
+            transport.use_compression(settings["compress"])
+        if "rekey_bytes" in settings:
+            transport.packetizer.REKEY_BYTES = settings["rekey_bytes"]
+        if "rekey_packets" in settings:
+            transport.packetizer.REKEY_PACKETS = settings["rekey_packets"]
+        return transport
+    
+    def _timed(self, operation):
+        """Time a with block in the metrics, if any."""
+        return self.metrics.time(operation) if self.metrics else nullcontext()
+    
+    @_instrumented()
     def connect(self):
-        """Establish connection to SFTP server."""
+        """
+        Establish connection to SFTP server.
+        With metrics, the TCP connect, SSH handshake, authentication and SFTP
+        session setup are also timed separately as connect.<phase>.
+        """
         try:
-            self.transport = paramiko.Transport((self.host, self.port))
+            with self._timed("connect.tcp"):
+                sock = socket.create_connection((self.host, self.port), self.timeout)
+            self.transport = self._create_transport(sock)
             
             # Try SSH key authentication first
+            private_key = None
             if self.private_key_path:
                 private_key = paramiko.RSAKey.from_private_key_file(self.private_key_path)
-                self.transport.connect(username=self.username, pkey=private_key)
             elif os.path.exists('ssh_keys/sftp_key'):
                 # Default to local SSH key if available
                 private_key = paramiko.RSAKey.from_private_key_file('ssh_keys/sftp_key')
-                self.transport.connect(username=self.username, pkey=private_key)
-            else:
+            elif self.password is None:
                 # Fall back to password authentication
+                self.password = os.environ.get('SFTP_PASSWORD')
                 if self.password is None:
-                    self.password = os.environ.get('SFTP_PASSWORD')
-                    if self.password is None:
-                        raise ValueError("No SSH key found and no password provided")
-                self.transport.connect(username=self.username, password=self.password)
+                    raise ValueError("No SSH key found and no password provided")
             
-            self.sftp = paramiko.SFTPClient.from_transport(self.transport)
+            # Same steps as Transport.connect(), split so each can be timed
+            with self._timed("connect.handshake"):
+                self.transport.start_client()
+            with self._timed("connect.auth"):
+                if private_key:
+                    self.transport.auth_publickey(self.username, private_key)
+                else:
+                    self.transport.auth_password(self.username, self.password)
+            if self.keepalive:
+                self.transport.set_keepalive(self.keepalive)
+            with self._timed("connect.session"):
+                self.sftp = self._open_channel()
             return True
         except Exception as e:
+            if self.metrics:
+                self.metrics.record_error("connect", e)
             print(f"Connection error: {str(e)}")
             return False
             
@@ -52,6 +626,21 @@ class SFTPClient:
         self.sftp = None
         self.transport = None
     
+    def is_connected(self):
+        """Check that the transport and the main SFTP channel are still open."""
+        return (self.transport is not None and self.transport.is_active() and self.sftp is not None
+                and not self.sftp.sock.closed)
+    
+    def reconnect(self):
+        """Drop the current connection, if any, and connect again. Returns False on failure."""
+        try:
+            self.disconnect()
+        except Exception:
+            # Closing a dead session can fail, it is discarded anyway
+            self.sftp = None
+            self.transport = None
+        return self.connect()
+    
     def __enter__(self):
         """Context manager entry."""
         self.connect()
@@ -61,23 +650,162 @@ class SFTPClient:
         """Context manager exit."""
         self.disconnect()
     
-    def ensure_directory(self, remote_path):
+    def _open_channel(self):
+        """Open an SFTP channel on the existing transport."""
+        channel = paramiko.SFTPClient.from_transport(self.transport)
+        if self.timeout:
+            channel.get_channel().settimeout(self.timeout)
+        if self.metrics:
+            self.metrics.instrument(channel)
+        return channel
+    
+    def _is_connection_error(self, error):
+        """Tell failures of the connection, which a new one may fix, from errors the server returned."""
+        if isinstance(error, (paramiko.SSHException, ConnectionError, socket.timeout)):
+            return True
+        # paramiko reports a closed channel with a plain OSError, like SFTP error statuses,
+        # and raises EOFError both for a dropped session and for an SFTP_EOF status
+        return isinstance(error, (OSError, EOFError)) and not self.is_connected()
+    
+    def _backoff_delay(self, attempt):
+        """Seconds to wait before retry number attempt (from 0): full jitter over an exponential backoff."""
+        return random.uniform(0, min(self.retry_max_delay, self.retry_backoff * 2 ** attempt))
+    
+    def _with_retries(self, operation, func, *args, **kwargs):
+        """Run func, reconnecting and running it again after connection failures (see retries)."""
+        if self.retries <= 0 or getattr(_retry_state, "active", False):
+            return func(*args, **kwargs)
+        
+        _retry_state.active = True
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    # Reconnect after a failure, or when the session died while idle
+                    if attempt or (self.transport is not None and not self.is_connected()):
+                        if not self.reconnect():
+                            raise ConnectionError(f"Failed to reconnect to SFTP server {self.host}:{self.port}")
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if attempt >= self.retries or not self._is_connection_error(e):
+                        raise
+                    if self.metrics:
+                        self.metrics.record_retry(operation)
+                    time.sleep(self._backoff_delay(attempt))
+        finally:
+            _retry_state.active = False
+    
+    @staticmethod
+    def _split_ranges(file_size, chunk_size):
+        """Split a file size into (offset, length) byte ranges."""
+        return [(offset, min(chunk_size, file_size - offset))
+                for offset in range(0, file_size, chunk_size)]
+    
+    def _stat(self, remote_path, use_cache=True):
+        """Stat a remote path, going through the metadata cache when enabled."""
+        if self.cache is None:
+            return self._with_retries("stat", lambda: self.sftp.stat(remote_path))
+        
+        file_attr = self.cache.get(remote_path) if use_cache else None
+        if file_attr is None:
+            try:
+                file_attr = self._with_retries("stat", lambda: self.sftp.stat(remote_path))
+            except FileNotFoundError:
+                self.cache.invalidate(remote_path)
+                raise
+            self.cache.put(remote_path, file_attr)
+        return file_attr
+    
+    def _invalidate(self, remote_path, recursive=False):
+        """Drop a path from the metadata cache after it was modified."""
+        if self.cache is not None:
+            self.cache.invalidate(remote_path, recursive)
+    
+    def _mkdir(self, remote_path):
+        """Create a remote directory and record it in the metadata cache."""
+        self.sftp.mkdir(remote_path)
+        if self.cache is not None:
+            self.cache.invalidate(remote_path)
+            self.cache.add_directory(remote_path)
+    
+    def _retry_missing_directory(self, remote_path, write):
+        """
+        Run write(), and if it fails with ENOENT because the parent directory was removed
+        behind the metadata cache, forget the directory, create it and run write() once more.
+        """
+        try:
+            return write()
+        except FileNotFoundError:
+            remote_dir = os.path.dirname(remote_path)
+            try:
+                directory_exists = bool(remote_dir) and bool(self.sftp.stat(remote_dir))
+            except FileNotFoundError:
+                directory_exists = False
+            if not remote_dir or directory_exists:
+                raise
+            self._invalidate(remote_dir, recursive=True)
+            self.ensure_directory(remote_dir, use_cache=False)
+            return write()
+    
+    @staticmethod
+    def _parent_directories(remote_path):
+        """List a path and all of its parent directories."""
+        parents = []
+        while remote_path not in ('', '/'):
+            parents.append(remote_path)
+            remote_path = os.path.dirname(remote_path)
+        return parents
+    
+    @_instrumented()
+    @_retried
+    def ensure_directory(self, remote_path, use_cache=True):
         """Recursively create remote directories if they don't exist."""
         if remote_path == '/' or remote_path == '':
             return
+        if use_cache and self.cache is not None and self.cache.is_known_directory(remote_path):
+            return
         
         try:
-            self.sftp.stat(remote_path)
+            self._stat(remote_path, use_cache)
         except FileNotFoundError:
             parent = os.path.dirname(remote_path)
-            self.ensure_directory(parent)
-            self.sftp.mkdir(remote_path)
+            self.ensure_directory(parent, use_cache)
+            self._mkdir(remote_path)
     
-    def upload_file(self, local_path, remote_path=None):
+    @_instrumented("size")
+    @_retried
+    def upload_file(self, local_path, remote_path=None, streams=1, chunk_size=DEFAULT_CHUNK_SIZE, callback=None,
+                    use_cache=True, resume=False, verify_tail=True, verify=None, write_checksum=True, use_mmap=False,
+                    compress=None, delta=False, delta_exec=False):
         """
         Upload a file to the SFTP server.
         If remote_path is a directory, the file will be uploaded with its original name.
         If remote_path is not provided, the file will be uploaded to the root with its original name.
+        If streams is greater than 1, the file is split into chunk_size byte ranges
+        which are written in parallel over that many SFTP channels.
+        The optional callback(bytes_transferred, total_bytes) is called as data is sent;
+        an exception raised from it aborts the transfer.
+        Set use_cache to False to bypass the metadata cache for this call.
+        If resume is True, the file is written to a partial file that a retried call
+        continues from (after comparing the last block before the offset when verify_tail
+        is True), progress is checkpointed in checkpoint_dir, and the result is
+        renamed into place once complete. Resumable uploads use a single stream.
+        If verify names a hash algorithm (see CHECKSUM_ALGORITHMS), the data is hashed as it
+        is sent (parallel and resumed uploads hash the local file in blocks instead), the
+        digest is returned, and a "<remote_path>.<algorithm>" checksum file is written
+        unless write_checksum is False.
+        If use_mmap is True, a single-stream upload reads the file through a memory map
+        and sends slices of it without copying them into read buffers first.
+        If compress names a codec in COMPRESSION_CODECS, the data is compressed as it is
+        sent and stored as "<remote_path><suffix>" (e.g. ".zst") plus a metadata file,
+        which download_file decompresses transparently; "auto" samples the first block
+        and only compresses data that shrinks below COMPRESSION_MIN_RATIO.
+        Compressed uploads use a single stream and can't be resumed.
+        If delta is True and remote_path exists, only the blocks that differ from the
+        remote copy are written, in place (see _delta_upload); the result reports the
+        changed blocks and bytes_saved. Block signatures of the remote copy come from the
+        check-file extension or the signature file left by the previous delta upload,
+        or with delta_exec from a script run in an exec channel (which hangs on servers
+        forcing internal-sftp, hence opt-in).
         """
         if not os.path.isfile(local_path):
             raise FileNotFoundError(f"Local file not found: {local_path}")
@@ -88,7 +816,7 @@ class SFTPClient:
         
         # If remote_path is a directory, append the filename from local_path
         try:
-            remote_stat = self.sftp.stat(remote_path)
+            remote_stat = self._stat(remote_path, use_cache)
             is_dir = S_ISDIR(remote_stat.st_mode)
             if is_dir:
                 remote_path = os.path.join(remote_path, os.path.basename(local_path))
@@ -96,26 +824,736 @@ class SFTPClient:
             # If the remote path doesn't exist, ensure parent directories exist
             remote_dir = os.path.dirname(remote_path)
             if remote_dir:
-                self.ensure_directory(remote_dir)
+                self.ensure_directory(remote_dir, use_cache)
+        
+        self._invalidate(remote_path)
+        codec = self._choose_codec(local_path, compress) if compress else None
+        if codec and resume:
+            raise ValueError("Compressed uploads can't be resumed")
+        if delta and (codec or resume):
+            raise ValueError("Delta uploads can't be compressed or resumed")
         
+        def write():
+            # A fresh hasher per attempt, in case the write is retried
+            hasher = new_hash(verify) if verify else None
+            if codec:
+                return self._compressed_upload(local_path, remote_path, codec, callback, hasher)
+            if delta:
+                return self._delta_upload(local_path, remote_path, delta_exec, callback)
+            if resume:
+                return self._resumable_upload(local_path, remote_path, verify_tail, callback)
+            if streams > 1:
+                return self._parallel_upload(local_path, remote_path, streams, chunk_size, callback)
+            result = self._single_upload(local_path, remote_path, callback, hasher, use_mmap)
+            if hasher is not None:
+                result["digest"] = hasher.hexdigest()
+            return result
+        
+        result = self._retry_missing_directory(remote_path, write)
+        
+        if compress == "auto" and not codec:
+            result["codec"] = None
+        if verify:
+            if "digest" not in result:
+                result["digest"] = file_digest(local_path, verify)
+            result["algorithm"] = verify
+        self._update_sidecars(remote_path, verify if write_checksum else None, result.get("digest"), codec)
+        return result
+    
+    def _single_upload(self, local_path, remote_path, callback=None, hasher=None, use_mmap=False):
+        """Upload a file over the main channel, hashing it on the way when a hasher is given."""
         start_time = time.time()
-        self.sftp.put(local_path, remote_path)
+        file_size = os.path.getsize(local_path)
+        if use_mmap and file_size:
+            # Empty files can't be mapped and take the regular path
+            with open(local_path, 'rb') as local_file:
+                with mmap.mmap(local_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    with memoryview(mapped) as view:
+                        result = self._write_remote(view, remote_path, file_size, callback, hasher)
+            result["path"] = remote_path
+            return result
+        
+        with open(local_path, 'rb') as local_file:
+            source = _HashingReader(local_file, hasher) if hasher is not None else local_file
+            file_attr = self.sftp.putfo(source, remote_path, file_size, callback=callback)
+        if self.cache is not None:
+            self.cache.put(remote_path, file_attr)
         elapsed_time = time.time() - start_time
+        
+        return {
+            "path": remote_path,
+            "size": file_size,
+            "time": elapsed_time,
+            "speed": file_size / elapsed_time if elapsed_time > 0 else 0
+        }
+    
+    @staticmethod
+    def _choose_codec(local_path, compress):
+        """Resolve compress to a codec, or None when auto mode finds the data incompressible."""
+        if compress != "auto":
+            _require_codec(compress)
+            return compress
+        
+        codec = next(c for c in COMPRESSION_CODECS if c == "zlib" or
+                     (c == "zstd" and zstandard is not None) or (c == "lz4" and lz4_frame is not None))
+        with open(local_path, 'rb') as f:
+            sample = f.read(READ_BLOCK_SIZE)
+        if not sample:
+            return None
+        compressor = new_compressor(codec)
+        compressed_size = len(compressor.compress(sample)) + len(compressor.flush())
+        return codec if compressed_size < len(sample) * COMPRESSION_MIN_RATIO else None
+    
+    def _compressed_upload(self, local_path, remote_path, codec, callback=None, hasher=None):
+        """
+        Compress a file into "<remote_path><suffix>" while sending it, then store its
+        metadata in "<remote_path>.sftp-meta". A plain remote_path left from an earlier
+        upload is removed so that it doesn't shadow the new data, and so is the object
+        of an earlier compressed upload with another codec.
+        """
+        start_time = time.time()
+        previous = self._owned_compression_metadata(remote_path)
         file_size = os.path.getsize(local_path)
+        object_path = remote_path + COMPRESSION_CODECS[codec]
+        threads = -1 if file_size >= COMPRESSION_THREADS_MIN_SIZE else 0
+        with open(local_path, 'rb') as local_file:
+            reader = _CompressingReader(local_file, new_compressor(codec, threads), hasher,
+                                        _Progress(callback, file_size))
+            compressed_size = self._write_remote(reader, object_path)["size"]
+        
+        metadata = {
+            "object": os.path.basename(object_path),
+            "codec": codec,
+            "size": file_size,
+            "compressed_size": compressed_size,
+            "modified": os.path.getmtime(local_path)
+        }
+        with self.sftp.open(remote_path + COMPRESSION_META_SUFFIX, 'w') as f:
+            f.write(json.dumps(metadata))
+        try:
+            self.sftp.remove(remote_path)
+        except FileNotFoundError:
+            pass
+        if previous is not None and previous["object"] != metadata["object"]:
+            self._discard_async([os.path.join(os.path.dirname(remote_path), previous["object"])])
+        elapsed_time = time.time() - start_time
+        
+        return {
+            "path": object_path,
+            "size": file_size,
+            "compressed_size": compressed_size,
+            "ratio": compressed_size / file_size if file_size else 1.0,
+            "codec": codec,
+            "time": elapsed_time,
+            "speed": file_size / elapsed_time if elapsed_time > 0 else 0
+        }
+    
+    def _read_compression_metadata(self, remote_path):
+        """Read the metadata of a compressed upload of remote_path, or None if there is none."""
+        try:
+            with self.sftp.open(remote_path + COMPRESSION_META_SUFFIX, 'r') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+    
+    def _owned_compression_metadata(self, remote_path):
+        """
+        Read the metadata of a compressed upload of remote_path, or None unless it is a
+        metadata file this client wrote for it, naming an object and codec of its own.
+        """
+        try:
+            metadata = self._read_compression_metadata(remote_path)
+        except ValueError:
+            # Not JSON, so not ours
+            return None
+        if not isinstance(metadata, dict) or metadata.get("codec") not in COMPRESSION_CODECS:
+            return None
+        if metadata.get("object") != os.path.basename(remote_path) + COMPRESSION_CODECS[metadata["codec"]]:
+            return None
+        return metadata
+    
+    def _remove_compressed(self, remote_path):
+        """
+        Remove the object and metadata file of a compressed upload of remote_path, if this
+        client's metadata names them; other files are never touched. Returns whether
+        there was such an upload.
+        """
+        metadata = self._owned_compression_metadata(remote_path)
+        if metadata is None:
+            return False
+        self._discard_async([os.path.join(os.path.dirname(remote_path), metadata["object"]),
+                             remote_path + COMPRESSION_META_SUFFIX])
+        return True
+    
+    def _compressed_download(self, remote_path, local_path, metadata, queue_depth, callback=None, hasher=None):
+        """Download and decompress the object of a compressed upload into local_path."""
+        start_time = time.time()
+        object_path = os.path.join(os.path.dirname(remote_path), metadata["object"])
+        decompressor = new_decompressor(metadata["codec"])
+        progress = _Progress(callback, metadata["size"])
+        written = 0
+        with self.sftp.open(object_path, 'rb') as remote_file, open(local_path, 'wb') as local_file:
+            compressed_size = remote_file.stat().st_size
+            pipeline = _ReadPipeline(self.sftp, remote_file, queue_depth)
+            for data in pipeline.read_range(0, compressed_size):
+                data = decompressor.decompress(data)
+                if not data:
+                    continue
+                local_file.write(data)
+                written += len(data)
+                if hasher is not None:
+                    hasher.update(data)
+                progress.update(len(data))
+        if written != metadata["size"]:
+            raise IOError(f"Decompressed {object_path} to {written} bytes, expected {metadata['size']}")
+        elapsed_time = time.time() - start_time
+        
+        return {
+            "path": local_path,
+            "size": written,
+            "compressed_size": compressed_size,
+            "codec": metadata["codec"],
+            "time": elapsed_time,
+            "speed": written / elapsed_time if elapsed_time > 0 else 0,
+            "queue_depth": queue_depth
+        }
+    
+    def _check_file_signatures(self, remote_path, size, block_size):
+        """Get the strong hash of each block of a remote file through the check-file extension."""
+        digest_size = hashlib.new(DELTA_ALGORITHM).digest_size
+        span = block_size * _CHECK_FILE_BLOCKS
+        hashes = b""
+        with self.sftp.open(remote_path, 'rb') as f:
+            for offset in range(0, size, span):
+                hashes += f.check(DELTA_ALGORITHM, offset, min(span, size - offset), block_size)
+        return [(None, hashes[i:i + digest_size].hex()) for i in range(0, len(hashes), digest_size)]
+    
+    def _exec_signatures(self, remote_path, block_size, timeout=60):
+        """Compute the block signatures of a remote file with python3 in an exec channel."""
+        command = (f"python3 -c {shlex.quote(_SIGNATURE_SCRIPT)} {shlex.quote(remote_path)} {block_size} "
+                   f"{DELTA_ALGORITHM}")
+        channel = self.transport.open_session()
+        try:
+            channel.settimeout(timeout)
+            channel.exec_command(command)
+            output = b"".join(iter(lambda: channel.recv(READ_BLOCK_SIZE), b""))
+            if channel.recv_exit_status() != 0:
+                raise IOError(f"Signature command failed on {remote_path}")
+        finally:
+            channel.close()
+        return [(int(weak), strong) for weak, strong in (line.split() for line in output.decode().splitlines())]
+    
+    def _read_signature_file(self, remote_path, file_attr, block_size):
+        """Read the block signatures stored by the last delta upload, if they still describe the file."""
+        try:
+            with self.sftp.open(remote_path + SIGNATURE_SUFFIX, 'r') as f:
+                signature = json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+        if (signature.get("size"), signature.get("mtime"), signature.get("block_size"), signature.get("algorithm")) != \
+                (file_attr.st_size, file_attr.st_mtime, block_size, DELTA_ALGORITHM):
+            return None
+        return signature["blocks"]
+    
+    def _remote_signatures(self, remote_path, file_attr, block_size, use_exec):
+        """Get (source, [(adler32 or None, strong hash), ...]) for a remote file, or (None, None)."""
+        try:
+            return "check-file", self._check_file_signatures(remote_path, file_attr.st_size, block_size)
+        except IOError:
+            pass  # Extension not supported (OpenSSH)
+        blocks = self._read_signature_file(remote_path, file_attr, block_size)
+        if blocks is not None:
+            return "signature-file", blocks
+        if use_exec:
+            try:
+                return "exec", self._exec_signatures(remote_path, block_size)
+            except (IOError, ValueError, socket.timeout, paramiko.SSHException):
+                if self.metrics:
+                    self.metrics.record_retry("delta")
+        return None, None
+    
+    def _delta_upload(self, local_path, remote_path, use_exec=False, callback=None, block_size=DELTA_BLOCK_SIZE):
+        """
+        Write the blocks of a file that differ from the remote copy at their offsets,
+        like rsync --inplace. Blocks are compared at the same offsets (their adler32
+        first when the signature has it), so data inserted into the file makes the
+        following blocks differ. Without a remote copy or a signature for it the whole
+        file is sent. The remote mtime is then set to the local one and the new block
+        signatures are stored in "<remote_path>.sftp-sig" for the next delta upload.
+        """
+        start_time = time.time()
+        local_stat = os.stat(local_path)
+        file_size = local_stat.st_size
+        try:
+            remote_attr = self.sftp.stat(remote_path)
+            source, remote_blocks = self._remote_signatures(remote_path, remote_attr, block_size, use_exec)
+        except FileNotFoundError:
+            remote_attr, source, remote_blocks = None, None, None
+        
+        progress = _Progress(callback, file_size)
+        signatures = []
+        changed = 0
+        sent = 0
+        mode = 'r+b' if remote_blocks is not None else 'wb'
+        with open(local_path, 'rb') as local_file, self.sftp.open(remote_path, mode, bufsize=0) as remote_file:
+            remote_file.set_pipelined(True)
+            for i, (offset, data, weak, strong) in enumerate(block_signatures(local_file, block_size)):
+                signatures.append((weak, strong))
+                if remote_blocks is not None and i < len(remote_blocks):
+                    remote_weak, remote_strong = remote_blocks[i]
+                    if remote_weak in (None, weak) and remote_strong == strong:
+                        progress.update(len(data))
+                        continue
+                remote_file.seek(offset)
+                for piece in self._blocks(memoryview(data), paramiko.SFTPFile.MAX_REQUEST_SIZE):
+                    remote_file.write(piece)
+                changed += 1
+                sent += len(data)
+                progress.update(len(data))
+        if remote_attr is not None and remote_attr.st_size > file_size:
+            self.sftp.truncate(remote_path, file_size)
+        
+        # Tie the signatures to this version of the file
+        self.sftp.utime(remote_path, (local_stat.st_atime, local_stat.st_mtime))
+        file_attr = self.sftp.stat(remote_path)
+        if file_attr.st_size != file_size:
+            raise IOError(f"Size mismatch updating {remote_path}: expected {file_size} bytes, server has {file_attr.st_size}")
+        signature = {"size": file_size, "mtime": file_attr.st_mtime, "block_size": block_size,
+                     "algorithm": DELTA_ALGORITHM, "blocks": signatures}
+        self._invalidate(remote_path + SIGNATURE_SUFFIX)
+        with self.sftp.open(remote_path + SIGNATURE_SUFFIX, 'w') as f:
+            f.write(json.dumps(signature, separators=(",", ":")))
+        if self.cache is not None:
+            self.cache.put(remote_path, file_attr)
+        elapsed_time = time.time() - start_time
         
         return {
             "path": remote_path,
             "size": file_size,
+            "signature": source,
+            "blocks": len(signatures),
+            "changed_blocks": changed,
+            "bytes_sent": sent,
+            "bytes_saved": file_size - sent,
             "time": elapsed_time,
             "speed": file_size / elapsed_time if elapsed_time > 0 else 0
         }
     
-    def download_file(self, remote_path, local_path=None):
+    @staticmethod
+    def _blocks(source, block_size):
+        """
+        Yield the data of a memoryview or file-like object in block_size pieces.
+        Memoryviews are sliced without copying; file-like objects are read into one
+        reused buffer when they support readinto, so each piece is only valid until
+        the next one is requested.
+        """
+        if isinstance(source, memoryview):
+            for offset in range(0, len(source), block_size):
+                yield source[offset:offset + block_size]
+            return
+        
+        readinto = getattr(source, 'readinto', None)
+        buffer = memoryview(bytearray(block_size)) if readinto else None
+        while True:
+            if readinto:
+                count = readinto(buffer)
+                if not count:
+                    return
+                yield buffer[:count]
+            else:
+                data = source.read(block_size)
+                if not data:
+                    return
+                yield data
+    
+    def _write_remote(self, source, remote_path, size=None, callback=None, hasher=None):
+        """
+        Write a memoryview or file-like object to a remote file with pipelined requests.
+        Each piece is packed straight into one SFTP write request, so no copy of the
+        whole payload is made; the written size is checked against the server's.
+        """
+        start_time = time.time()
+        progress = _Progress(callback, size)
+        written = 0
+        with self.sftp.open(remote_path, 'wb', bufsize=0) as remote_file:
+            remote_file.set_pipelined(True)
+            for data in self._blocks(source, paramiko.SFTPFile.MAX_REQUEST_SIZE):
+                if hasher is not None:
+                    hasher.update(data)
+                remote_file.write(data)
+                written += len(data)
+                progress.update(len(data))
+        
+        file_attr = self.sftp.stat(remote_path)
+        if file_attr.st_size != written:
+            raise IOError(f"Size mismatch uploading {remote_path}: sent {written} bytes, server has {file_attr.st_size}")
+        if self.cache is not None:
+            self.cache.put(remote_path, file_attr)
+        elapsed_time = time.time() - start_time
+        
+        return {
+            "path": remote_path,
+            "size": written,
+            "time": elapsed_time,
+            "speed": written / elapsed_time if elapsed_time > 0 else 0
+        }
+    
+    def _upload_from(self, source, remote_path, size, callback, use_cache, verify, write_checksum):
+        """Shared part of upload_bytes and upload_stream."""
+        remote_dir = os.path.dirname(remote_path)
+        if remote_dir:
+            self.ensure_directory(remote_dir, use_cache)
+        self._invalidate(remote_path)
+        
+        hasher = new_hash(verify) if verify else None
+        result = self._retry_missing_directory(
+            remote_path, lambda: self._write_remote(source, remote_path, size, callback, hasher))
+        if verify:
+            result["digest"] = hasher.hexdigest()
+            result["algorithm"] = verify
+        self._update_sidecars(remote_path, verify if write_checksum else None, result.get("digest"))
+        return result
+    
+    @_instrumented("size")
+    @_retried
+    def upload_bytes(self, data, remote_path, callback=None, use_cache=True, verify=None, write_checksum=True):
+        """
+        Upload an in-memory buffer to remote_path, creating its parent directories.
+        data is anything exposing the buffer protocol (bytes, bytearray, memoryview,
+        mmap, array, ...); it is sent in slices without being copied first.
+        callback, use_cache, verify and write_checksum work as in upload_file.
+        """
+        with memoryview(data) as raw, raw.cast('B') as view:
+            return self._upload_from(view, remote_path, len(view), callback, use_cache, verify, write_checksum)
+    
+    @_instrumented("size")
+    def upload_stream(self, stream, remote_path, size=None, callback=None, use_cache=True, verify=None,
+                      write_checksum=True):
+        """
+        Upload everything read from a binary file-like object to remote_path.
+        The stream is read in request-sized blocks (into one reused buffer if it
+        supports readinto) until it is exhausted. size is only used as the total
+        reported to callback; the other options work as in upload_file.
+        """
+        return self._upload_from(stream, remote_path, size, callback, use_cache, verify, write_checksum)
+    
+    def _write_checksum_file(self, remote_path, algorithm, digest):
+        """Store a digest next to a remote file, in sha256sum format."""
+        checksum_path = f"{remote_path}.{algorithm}"
+        self._invalidate(checksum_path)
+        with self.sftp.open(checksum_path, 'w') as f:
+            f.write(f"{digest}  {os.path.basename(remote_path)}\n")
+    
+    def _sidecar_names(self, remote_path):
+        """Names of the possible sidecar files of remote_path that exist, from one listing of its directory."""
+        name = os.path.basename(remote_path)
+        candidates = {f"{name}.{algorithm}" for algorithm in CHECKSUM_ALGORITHMS}
+        candidates.add(name + COMPRESSION_META_SUFFIX)
+        return candidates.intersection(self.sftp.listdir(os.path.dirname(remote_path) or "."))
+    
+    def _owned_checksum_files(self, remote_path, present, exclude=None):
+        """
+        List the checksum files next to remote_path among the present names, other than
+        exclude's, that hold this client's "<digest>  <name>" line for it, so that a
+        user's own files are left alone. Only files that exist are read.
+        """
+        owned = []
+        for algorithm in CHECKSUM_ALGORITHMS:
+            if algorithm == exclude or f"{os.path.basename(remote_path)}.{algorithm}" not in present:
+                continue
+            checksum_path = f"{remote_path}.{algorithm}"
+            try:
+                with self.sftp.open(checksum_path, 'r') as f:
+                    content = f.read(4096).decode('utf-8', 'replace')
+            except FileNotFoundError:
+                continue
+            if re.fullmatch(r"[0-9a-f]+  " + re.escape(os.path.basename(remote_path)) + r"\n", content):
+                owned.append(checksum_path)
+        return owned
+    
+    def _discard_async(self, paths):
+        """
+        Remove remote files that may not exist, sending all the requests before waiting
+        for the last reply (the server answers in order), so that they cost one round
+        trip and are done before the connection can be closed.
+        """
+        request = None
+        for path in paths:
+            self._invalidate(path)
+            request = self.sftp._async_request(type(None), CMD_REMOVE, self.sftp._adjust_cwd(path))
+        if request is not None:
+            try:
+                self.sftp._read_response(request)
+            except IOError:
+                pass
+    
+    def _update_sidecars(self, remote_path, algorithm=None, digest=None, codec=None):
+        """
+        After remote_path was written, write its checksum file for algorithm (if any). When
+        one was written or the client has clean_sidecars, also remove what earlier uploads
+        left next to it that no longer matches it (see _clean_sidecars), keeping the
+        compressed copy when it was just stored compressed with codec.
+        """
+        if algorithm:
+            self._write_checksum_file(remote_path, algorithm, digest)
+        if algorithm or self.clean_sidecars:
+            self._clean_sidecars(remote_path, exclude=algorithm, compressed=codec is None)
+    
+    def _clean_sidecars(self, remote_path, exclude=None, compressed=True):
+        """
+        Remove the checksum files (other than exclude's) and, if compressed is True, the
+        compressed copy that this client wrote for remote_path. One listing of its
+        directory shows which exist; only those are read to confirm they are this
+        client's. Returns whether a compressed copy was removed.
+        """
+        present = self._sidecar_names(remote_path)
+        self._discard_async(self._owned_checksum_files(remote_path, present, exclude))
+        return (compressed and os.path.basename(remote_path) + COMPRESSION_META_SUFFIX in present
+                and self._remove_compressed(remote_path))
+    
+    def _read_checksum_file(self, remote_path, algorithm):
+        """Read the digest stored next to a remote file, or None if there is none."""
+        try:
+            with self.sftp.open(f"{remote_path}.{algorithm}", 'r') as f:
+                content = f.read(4096).decode('utf-8', 'replace').split()
+        except FileNotFoundError:
+            return None
+        return content[0].lower() if content else None
+    
+    def _upload_stream(self, stream_id, local_path, remote_path, ranges, progress):
+        """Write byte ranges taken from the shared queue over a dedicated channel."""
+        stats = {"stream": stream_id, "bytes": 0, "chunks": 0}
+        start_time = time.time()
+        channel = self._open_channel()
+        try:
+            with open(local_path, 'rb') as local_file, channel.open(remote_path, 'r+b') as remote_file:
+                remote_file.set_pipelined(True)
+                while True:
+                    try:
+                        offset, length = ranges.get_nowait()
+                    except queue.Empty:
+                        break
+                    
+                    local_file.seek(offset)
+                    remote_file.seek(offset)
+                    remaining = length
+                    while remaining > 0:
+                        data = local_file.read(min(READ_BLOCK_SIZE, remaining))
+                        if not data:
+                            raise IOError(f"Unexpected end of file: {local_path}")
+                        remote_file.write(data)
+                        remaining -= len(data)
+                        progress.update(len(data))
+                    
+                    stats["bytes"] += length
+                    stats["chunks"] += 1
+        finally:
+            channel.close()
+        
+        stats["time"] = time.time() - start_time
+        stats["speed"] = stats["bytes"] / stats["time"] if stats["time"] > 0 else 0
+        return stats
+    
+    def _parallel_upload(self, local_path, remote_path, streams, chunk_size, callback=None):
+        """Upload a file as byte ranges written concurrently over several channels."""
+        file_size = os.path.getsize(local_path)
+        ranges = queue.Queue()
+        for byte_range in self._split_ranges(file_size, chunk_size):
+            ranges.put(byte_range)
+        streams = max(1, min(streams, ranges.qsize()))
+        progress = _Progress(callback, file_size)
+        
+        start_time = time.time()
+        # Create (or truncate) the destination before the streams write into it
+        self.sftp.open(remote_path, 'wb').close()
+        with ThreadPoolExecutor(max_workers=streams) as executor:
+            futures = [executor.submit(self._upload_stream, i, local_path, remote_path, ranges, progress)
+                       for i in range(streams)]
+            stream_stats = [future.result() for future in futures]
+        
+        remote_size = self.sftp.stat(remote_path).st_size
+        if remote_size != file_size:
+            raise IOError(f"Size mismatch after parallel upload: {remote_size} != {file_size}")
+        elapsed_time = time.time() - start_time
+        
+        return {
+            "path": remote_path,
+            "size": file_size,
+            "time": elapsed_time,
+            "speed": file_size / elapsed_time if elapsed_time > 0 else 0,
+            "chunk_size": chunk_size,
+            "streams": stream_stats
+        }
+    
+    def _upload_worker(self, files, results):
+        """Upload (index, local_path, remote_path) items taken from the shared queue over a dedicated channel."""
+        channel = self._open_channel()
+        try:
+            while True:
+                try:
+                    index, local_path, remote_path = files.get_nowait()
+                except queue.Empty:
+                    break
+                
+                start_time = time.time()
+                try:
+                    with open(local_path, 'rb') as local_file, channel.open(remote_path, 'wb') as remote_file:
+                        remote_file.set_pipelined(True)
+                        size = 0
+                        for data in iter(lambda: local_file.read(READ_BLOCK_SIZE), b''):
+                            remote_file.write(data)
+                            size += len(data)
+                    results[index] = {"local_path": local_path, "path": remote_path, "size": size,
+                                      "time": time.time() - start_time, "uploaded": True}
+                except Exception as e:
+                    results[index] = {"local_path": local_path, "path": remote_path, "uploaded": False,
+                                      "error": str(e)}
+        finally:
+            channel.close()
+    
+    @_instrumented("size")
+    def upload_many(self, pairs, concurrency=8):
+        """
+        Upload many (local_path, remote_path) pairs, typically small files.
+        All remote directories are created first, then files are written over
+        concurrency SFTP channels so that many open/write/close sequences are in
+        flight at once. Returns per-file results and the aggregate files/sec.
+        """
+        items = []
+        for local_path, remote_path in pairs:
+            items.append((local_path, remote_path or os.path.basename(local_path)))
+        
+        start_time = time.time()
+        directories = set()
+        for _, remote_path in items:
+            directories.update(self._parent_directories(os.path.dirname(remote_path)))
+        # Parents come before their children, so each directory needs at most one stat and one mkdir
+        created = set()
+        for remote_dir in sorted(directories, key=lambda d: d.count('/')):
+            if os.path.dirname(remote_dir) in created:
+                self._mkdir(remote_dir)
+                created.add(remote_dir)
+                continue
+            try:
+                self._stat(remote_dir)
+            except FileNotFoundError:
+                self._mkdir(remote_dir)
+                created.add(remote_dir)
+        
+        files = queue.Queue()
+        for index, (local_path, remote_path) in enumerate(items):
+            self._invalidate(remote_path)
+            files.put((index, local_path, remote_path))
+        results = [None] * len(items)
+        
+        workers = max(1, min(concurrency, len(items)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._upload_worker, files, results) for _ in range(workers)]
+            for future in futures:
+                future.result()
+        elapsed_time = time.time() - start_time
+        
+        uploaded = [r for r in results if r["uploaded"]]
+        total_bytes = sum(r["size"] for r in uploaded)
+        return {
+            "files": results,
+            "count": len(uploaded),
+            "failed": len(results) - len(uploaded),
+            "size": total_bytes,
+            "time": elapsed_time,
+            "files_per_sec": len(uploaded) / elapsed_time if elapsed_time > 0 else 0,
+            "speed": total_bytes / elapsed_time if elapsed_time > 0 else 0
+        }
+    
+    def _download_stream(self, stream_id, remote_path, local_path, ranges, queue_depth, progress, hasher=None):
+        """Read byte ranges taken from the shared queue over a dedicated channel."""
+        stats = {"stream": stream_id, "bytes": 0, "chunks": 0}
+        start_time = time.time()
+        channel = self._open_channel()
+        try:
+            with channel.open(remote_path, 'rb') as remote_file, open(local_path, 'r+b') as local_file:
+                pipeline = _ReadPipeline(channel, remote_file, queue_depth)
+                while True:
+                    try:
+                        offset, length = ranges.get_nowait()
+                    except queue.Empty:
+                        break
+                    
+                    local_file.seek(offset)
+                    for data in pipeline.read_range(offset, length):
+                        local_file.write(data)
+                        progress.update(len(data))
+                        if hasher is not None:
+                            hasher.update(data)
+                    
+                    stats["bytes"] += length
+                    stats["chunks"] += 1
+        finally:
+            channel.close()
+        
+        stats["time"] = time.time() - start_time
+        stats["speed"] = stats["bytes"] / stats["time"] if stats["time"] > 0 else 0
+        return stats
+    
+    def _ranged_download(self, remote_path, local_path, file_size, streams, chunk_size, queue_depth, callback=None,
+                         hasher=None):
+        """
+        Download disjoint byte ranges concurrently into a preallocated local file.
+        A hasher is only fed when a single stream reads the ranges in order.
+        """
+        ranges = queue.Queue()
+        for byte_range in self._split_ranges(file_size, chunk_size):
+            ranges.put(byte_range)
+        streams = max(1, min(streams, ranges.qsize()))
+        progress = _Progress(callback, file_size)
+        
+        start_time = time.time()
+        with open(local_path, 'wb') as local_file:
+            if file_size and hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(local_file.fileno(), 0, file_size)
+            local_file.truncate(file_size)
+        
+        with ThreadPoolExecutor(max_workers=streams) as executor:
+            futures = [executor.submit(self._download_stream, i, remote_path, local_path, ranges, queue_depth,
+                                       progress, hasher if streams == 1 else None)
+                       for i in range(streams)]
+            stream_stats = [future.result() for future in futures]
+        elapsed_time = time.time() - start_time
+        
+        return {
+            "path": local_path,
+            "size": file_size,
+            "time": elapsed_time,
+            "speed": file_size / elapsed_time if elapsed_time > 0 else 0,
+            "chunk_size": chunk_size,
+            "queue_depth": queue_depth,
+            "streams": stream_stats
+        }
+    
+    @_instrumented("size")
+    @_retried
+    def download_file(self, remote_path, local_path=None, streams=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                      queue_depth=DEFAULT_QUEUE_DEPTH, callback=None, resume=False, verify_tail=True, verify=None):
         """
         Download a file from the SFTP server.
         If local_path is a directory, the file will be downloaded with its original name.
         If local_path is not provided, the file will be downloaded to the current directory.
+        Up to queue_depth read requests are kept in flight per stream. If streams is
+        greater than 1, disjoint chunk_size byte ranges are fetched over that many
+        SFTP channels into the preallocated local file.
+        The optional callback(bytes_transferred, total_bytes) is called as data arrives;
+        an exception raised from it aborts the transfer.
+        If resume is True, data goes to a local partial file that a retried call continues
+        from, with progress checkpointed next to it, and is renamed into place once complete.
+        Resumable downloads use a single stream.
+        If verify names a hash algorithm (see CHECKSUM_ALGORITHMS), the data is hashed as it
+        arrives (parallel and resumed downloads hash the local file in blocks instead) and
+        compared with the "<remote_path>.<algorithm>" checksum file when the server has one;
+        a mismatch raises IOError.
+        A file uploaded with compression is fetched from its compressed object and
+        decompressed on the fly, over a single stream.
         """
+        hasher = new_hash(verify) if verify else None
         if not local_path:
             local_path = os.path.basename(remote_path)
         
@@ -127,68 +1565,726 @@ class SFTPClient:
         if local_dir and not os.path.exists(local_dir):
             os.makedirs(local_dir)
         
+        if resume:
+            result = self._resumable_download(remote_path, local_path, queue_depth, verify_tail, callback)
+        else:
+            try:
+                file_size = self.sftp.stat(remote_path).st_size
+                metadata = None
+            except FileNotFoundError:
+                # Only stored compressed?
+                metadata = self._read_compression_metadata(remote_path)
+                if metadata is None:
+                    raise
+            
+            if metadata is not None:
+                result = self._compressed_download(remote_path, local_path, metadata, queue_depth, callback, hasher)
+                streams = 1
+            else:
+                if streams <= 1:
+                    # A single stream pipelines the whole file as one range
+                    chunk_size = max(chunk_size, file_size)
+                result = self._ranged_download(remote_path, local_path, file_size, streams, chunk_size, queue_depth,
+                                               callback, hasher)
+            if streams <= 1 and hasher is not None:
+                result["digest"] = hasher.hexdigest()
+        
+        if verify:
+            if "digest" not in result:
+                result["digest"] = file_digest(local_path, verify)
+            self._check_digest(result, remote_path, verify)
+        return result
+    
+    def _check_digest(self, result, remote_path, algorithm):
+        """Compare a downloaded digest with the remote checksum file, raising IOError on a mismatch."""
+        result["algorithm"] = algorithm
+        expected = self._read_checksum_file(remote_path, algorithm)
+        result["verified"] = None if expected is None else expected == result["digest"]
+        if result["verified"] is False:
+            raise IOError(f"Checksum mismatch for {remote_path}: expected {expected}, got {result['digest']}")
+    
+    @_instrumented("size")
+    def download_into(self, remote_path, target, queue_depth=DEFAULT_QUEUE_DEPTH, callback=None, verify=None):
+        """
+        Download a remote file into memory or a stream instead of a local path.
+        target is either a writable buffer at least as large as the file (bytearray,
+        writable memoryview or mmap, array, ...), which is filled from the start
+        without intermediate buffers, or a binary file-like object with a write method.
+        queue_depth, callback and verify work as in download_file.
+        """
         start_time = time.time()
-        self.sftp.get(remote_path, local_path)
+        hasher = new_hash(verify) if verify else None
+        with self.sftp.open(remote_path, 'rb') as remote_file:
+            file_size = remote_file.stat().st_size
+            progress = _Progress(callback, file_size)
+            pipeline = _ReadPipeline(self.sftp, remote_file, queue_depth)
+            
+            if hasattr(target, 'write'):
+                for data in pipeline.read_range(0, file_size):
+                    target.write(data)
+                    if hasher is not None:
+                        hasher.update(data)
+                    progress.update(len(data))
+            else:
+                with memoryview(target) as raw, raw.cast('B') as view:
+                    if view.readonly:
+                        raise TypeError("download_into() needs a writable buffer")
+                    if len(view) < file_size:
+                        raise ValueError(f"Buffer of {len(view)} bytes is too small for {remote_path} ({file_size} bytes)")
+                    position = 0
+                    for data in pipeline.read_range(0, file_size):
+                        view[position:position + len(data)] = data
+                        position += len(data)
+                        if hasher is not None:
+                            hasher.update(data)
+                        progress.update(len(data))
         elapsed_time = time.time() - start_time
-        file_size = os.path.getsize(local_path)
         
+        result = {
+            "path": remote_path,
+            "size": file_size,
+            "time": elapsed_time,
+            "speed": file_size / elapsed_time if elapsed_time > 0 else 0
+        }
+        if verify:
+            result["digest"] = hasher.hexdigest()
+            self._check_digest(result, remote_path, verify)
+        return result
+    
+    @_instrumented()
+    def download_stream(self, remote_path, queue_depth=DEFAULT_QUEUE_DEPTH, callback=None):
+        """
+        Iterate over the content of a remote file as bytes pieces, in order, as they arrive.
+        Reads are pipelined like download_file. The download runs on its own channel,
+        so other calls can be made while iterating.
+        """
+        channel = self._open_channel()
+        try:
+            with channel.open(remote_path, 'rb') as remote_file:
+                file_size = remote_file.stat().st_size
+                progress = _Progress(callback, file_size)
+                for data in _ReadPipeline(channel, remote_file, queue_depth).read_range(0, file_size):
+                    progress.update(len(data))
+                    yield data
+        finally:
+            channel.close()
+    
+    @staticmethod
+    def _load_checkpoint(checkpoint_path):
+        """Read a transfer checkpoint, or None if there is no usable one."""
+        try:
+            with open(checkpoint_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def _save_checkpoint(checkpoint_path, checkpoint):
+        """Write a transfer checkpoint atomically."""
+        temp_path = checkpoint_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, checkpoint_path)
+    
+    @staticmethod
+    def _tail_digest(f, offset):
+        """Hash the block that ends at offset in an open local or remote file."""
+        start = max(0, offset - RESUME_VERIFY_SIZE)
+        f.seek(start)
+        return hashlib.sha256(f.read(offset - start)).hexdigest()
+    
+    def _commit_remote(self, partial_path, remote_path):
+        """Atomically replace remote_path with a completed partial file."""
+        try:
+            self.sftp.posix_rename(partial_path, remote_path)
+        except IOError:
+            # Server without the posix-rename extension: plain rename refuses to overwrite
+            if self.metrics:
+                self.metrics.record_retry("commit")
+            try:
+                self.sftp.remove(remote_path)
+            except FileNotFoundError:
+                pass
+            self.sftp.rename(partial_path, remote_path)
+    
+    def _upload_checkpoint_path(self, local_path, remote_path):
+        """Checkpoint file of a resumable upload, in checkpoint_dir and named after a hash of both ends."""
+        key = f"{os.path.abspath(local_path)}\0{self.username}@{self.host}:{self.port}/{remote_path}"
+        return os.path.join(self.checkpoint_dir, hashlib.sha256(key.encode()).hexdigest() + CHECKPOINT_SUFFIX)
+    
+    def _resumable_upload(self, local_path, remote_path, verify_tail, callback):
+        """
+        Upload into remote_path + PARTIAL_SUFFIX, continuing after the data already there when the
+        checkpoint shows it came from the same source file, then rename it into place.
+        """
+        local_stat = os.stat(local_path)
+        file_size = local_stat.st_size
+        partial_path = remote_path + PARTIAL_SUFFIX
+        checkpoint_path = self._upload_checkpoint_path(local_path, remote_path)
+        os.makedirs(self.checkpoint_dir, mode=0o700, exist_ok=True)
+        source = {"destination": remote_path, "size": file_size, "mtime": int(local_stat.st_mtime)}
+        
+        offset = 0
+        checkpoint = self._load_checkpoint(checkpoint_path)
+        if checkpoint and all(checkpoint.get(key) == value for key, value in source.items()):
+            try:
+                offset = self.sftp.stat(partial_path).st_size
+            except FileNotFoundError:
+                offset = 0
+            if offset > file_size:
+                offset = 0
+        
+        start_time = time.time()
+        with open(local_path, 'rb') as local_file:
+            if offset and verify_tail:
+                with self.sftp.open(partial_path, 'rb') as remote_file:
+                    if self._tail_digest(remote_file, offset) != self._tail_digest(local_file, offset):
+                        offset = 0
+            
+            resumed_from = offset
+            progress = _Progress(callback, file_size)
+            progress.skip(offset)
+            self._save_checkpoint(checkpoint_path, dict(source, offset=offset))
+            with self.sftp.open(partial_path, 'r+b' if offset else 'wb') as remote_file:
+                remote_file.set_pipelined(True)
+                local_file.seek(offset)
+                remote_file.seek(offset)
+                saved_offset = offset
+                for data in iter(lambda: local_file.read(READ_BLOCK_SIZE), b''):
+                    remote_file.write(data)
+                    offset += len(data)
+                    progress.update(len(data))
+                    if offset - saved_offset >= CHECKPOINT_INTERVAL:
+                        self._save_checkpoint(checkpoint_path, dict(source, offset=offset))
+                        saved_offset = offset
+        
+        remote_size = self.sftp.stat(partial_path).st_size
+        if remote_size != file_size:
+            raise IOError(f"Size mismatch after upload: {remote_size} != {file_size}")
+        self._commit_remote(partial_path, remote_path)
+        os.remove(checkpoint_path)
+        elapsed_time = time.time() - start_time
+        
+        transferred = file_size - resumed_from
+        return {
+            "path": remote_path,
+            "size": file_size,
+            "time": elapsed_time,
+            "speed": transferred / elapsed_time if elapsed_time > 0 else 0,
+            "resumed_from": resumed_from,
+            "transferred": transferred
+        }
+    
+    def _resumable_download(self, remote_path, local_path, queue_depth, verify_tail, callback):
+        """
+        Download into local_path + PARTIAL_SUFFIX, continuing after the data already there when the
+        checkpoint shows it came from the same remote file, then rename it into place.
+        """
+        remote_stat = self.sftp.stat(remote_path)
+        file_size = remote_stat.st_size
+        partial_path = local_path + PARTIAL_SUFFIX
+        checkpoint_path = partial_path + CHECKPOINT_SUFFIX
+        source = {"source": remote_path, "size": file_size, "mtime": int(remote_stat.st_mtime)}
+        
+        offset = 0
+        checkpoint = self._load_checkpoint(checkpoint_path)
+        if checkpoint and all(checkpoint.get(key) == value for key, value in source.items()):
+            offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+            if offset > file_size:
+                offset = 0
+        
+        start_time = time.time()
+        with self.sftp.open(remote_path, 'rb') as remote_file:
+            if offset and verify_tail:
+                with open(partial_path, 'rb') as local_file:
+                    if self._tail_digest(remote_file, offset) != self._tail_digest(local_file, offset):
+                        offset = 0
+            
+            resumed_from = offset
+            progress = _Progress(callback, file_size)
+            progress.skip(offset)
+            self._save_checkpoint(checkpoint_path, dict(source, offset=offset))
+            with open(partial_path, 'r+b' if offset else 'wb') as local_file:
+                local_file.truncate(offset)
+                local_file.seek(offset)
+                saved_offset = offset
+                pipeline = _ReadPipeline(self.sftp, remote_file, queue_depth)
+                for data in pipeline.read_range(offset, file_size - offset):
+                    local_file.write(data)
+                    offset += len(data)
+                    progress.update(len(data))
+                    if offset - saved_offset >= CHECKPOINT_INTERVAL:
+                        local_file.flush()
+                        self._save_checkpoint(checkpoint_path, dict(source, offset=offset))
+                        saved_offset = offset
+        
+        os.replace(partial_path, local_path)
+        os.remove(checkpoint_path)
+        elapsed_time = time.time() - start_time
+        
+        transferred = file_size - resumed_from
         return {
             "path": local_path,
             "size": file_size,
             "time": elapsed_time,
-            "speed": file_size / elapsed_time if elapsed_time > 0 else 0
+            "speed": transferred / elapsed_time if elapsed_time > 0 else 0,
+            "queue_depth": queue_depth,
+            "resumed_from": resumed_from,
+            "transferred": transferred
+        }
+    
+    def _remote_manifest(self, remote_dir):
+        """Map relative paths under a remote directory to (size, mtime), plus the set of subdirectories."""
+        files = {}
+        dirs = set()
+        pending = ['']
+        while pending:
+            relative_dir = pending.pop()
+            try:
+                entries = self.sftp.listdir_attr(os.path.join(remote_dir, relative_dir) if relative_dir else remote_dir)
+            except FileNotFoundError:
+                if relative_dir:
+                    raise
+                break
+            for file_attr in entries:
+                relative_path = os.path.join(relative_dir, file_attr.filename)
+                if S_ISDIR(file_attr.st_mode):
+                    dirs.add(relative_path)
+                    pending.append(relative_path)
+                else:
+                    files[relative_path] = (file_attr.st_size, int(file_attr.st_mtime))
+        return files, dirs
+    
+    @staticmethod
+    def _local_manifest(local_dir):
+        """Map relative paths under a local directory to (size, mtime), plus the set of subdirectories."""
+        files = {}
+        dirs = set()
+        for root, dir_names, file_names in os.walk(local_dir):
+            relative_dir = os.path.relpath(root, local_dir)
+            relative_dir = '' if relative_dir == '.' else relative_dir
+            for name in dir_names:
+                dirs.add(os.path.join(relative_dir, name))
+            for name in file_names:
+                file_stat = os.stat(os.path.join(root, name))
+                files[os.path.join(relative_dir, name)] = (file_stat.st_size, int(file_stat.st_mtime))
+        return files, dirs
+    
+    @staticmethod
+    def _plan_sync(source, target, delete):
+        """Compare two (files, dirs) manifests and decide what to create, transfer and delete."""
+        source_files, source_dirs = source
+        target_files, target_dirs = target
+        plan = {
+            "mkdir": sorted(source_dirs - target_dirs),
+            "transfer": sorted(path for path, meta in source_files.items() if target_files.get(path) != meta),
+            "delete_files": [],
+            "delete_dirs": [],
+            "unchanged": sum(1 for path, meta in source_files.items() if target_files.get(path) == meta)
         }
+        if delete:
+            plan["delete_files"] = sorted(set(target_files) - set(source_files))
+            # Deepest directories first so that they are empty when removed
+            plan["delete_dirs"] = sorted(target_dirs - source_dirs, key=lambda d: d.count(os.sep), reverse=True)
+        return plan
     
+    def _sync_result(self, source, destination, plan, dry_run, transferred_bytes, start_time):
+        """Build the result dictionary for a sync operation."""
+        elapsed_time = time.time() - start_time
+        return {
+            "source": source,
+            "destination": destination,
+            "dry_run": dry_run,
+            "created_directories": plan["mkdir"],
+            "transferred": plan["transfer"],
+            "deleted": plan["delete_files"] + plan["delete_dirs"],
+            "unchanged": plan["unchanged"],
+            "bytes": transferred_bytes,
+            "time": elapsed_time,
+            "speed": transferred_bytes / elapsed_time if elapsed_time > 0 else 0
+        }
+    
+    @_instrumented("bytes")
+    def sync_up(self, local_dir, remote_dir, delete=False, dry_run=False):
+        """
+        Mirror a local directory tree to the SFTP server.
+        Only files whose size or modification time differ from the remote copy are uploaded,
+        and uploaded files get the local modification time so later runs can skip them.
+        If delete is True, remote files and directories missing locally are removed.
+        If dry_run is True, nothing is changed and the result describes the plan.
+        """
+        if not os.path.isdir(local_dir):
+            raise FileNotFoundError(f"Local directory not found: {local_dir}")
+        
+        start_time = time.time()
+        local_manifest = self._local_manifest(local_dir)
+        plan = self._plan_sync(local_manifest, self._remote_manifest(remote_dir), delete)
+        transferred_bytes = sum(local_manifest[0][path][0] for path in plan["transfer"])
+        if dry_run:
+            return self._sync_result(local_dir, remote_dir, plan, True, transferred_bytes, start_time)
+        
+        self.ensure_directory(remote_dir)
+        for relative_dir in plan["mkdir"]:
+            self._mkdir(os.path.join(remote_dir, relative_dir))
+        
+        for relative_path in plan["transfer"]:
+            local_path = os.path.join(local_dir, relative_path)
+            remote_path = os.path.join(remote_dir, relative_path)
+            self._invalidate(remote_path)
+            self.sftp.put(local_path, remote_path)
+            local_stat = os.stat(local_path)
+            self.sftp.utime(remote_path, (local_stat.st_atime, local_stat.st_mtime))
+        
+        for relative_path in plan["delete_files"]:
+            self._invalidate(os.path.join(remote_dir, relative_path))
+            self.sftp.remove(os.path.join(remote_dir, relative_path))
+        for relative_dir in plan["delete_dirs"]:
+            self._invalidate(os.path.join(remote_dir, relative_dir), recursive=True)
+            self.sftp.rmdir(os.path.join(remote_dir, relative_dir))
+        
+        return self._sync_result(local_dir, remote_dir, plan, False, transferred_bytes, start_time)
+    
+    @_instrumented("bytes")
+    def sync_down(self, remote_dir, local_dir, delete=False, dry_run=False):
+        """
+        Mirror a directory tree from the SFTP server to a local directory.
+        Only files whose size or modification time differ from the local copy are downloaded,
+        and downloaded files get the remote modification time so later runs can skip them.
+        If delete is True, local files and directories missing remotely are removed.
+        If dry_run is True, nothing is changed and the result describes the plan.
+        """
+        start_time = time.time()
+        remote_manifest = self._remote_manifest(remote_dir)
+        local_manifest = self._local_manifest(local_dir) if os.path.isdir(local_dir) else ({}, set())
+        plan = self._plan_sync(remote_manifest, local_manifest, delete)
+        transferred_bytes = sum(remote_manifest[0][path][0] for path in plan["transfer"])
+        if dry_run:
+            return self._sync_result(remote_dir, local_dir, plan, True, transferred_bytes, start_time)
+        
+        os.makedirs(local_dir, exist_ok=True)
+        for relative_dir in plan["mkdir"]:
+            os.makedirs(os.path.join(local_dir, relative_dir), exist_ok=True)
+        
+        for relative_path in plan["transfer"]:
+            local_path = os.path.join(local_dir, relative_path)
+            remote_path = os.path.join(remote_dir, relative_path)
+            self.sftp.get(remote_path, local_path)
+            mtime = remote_manifest[0][relative_path][1]
+            os.utime(local_path, (mtime, mtime))
+        
+        for relative_path in plan["delete_files"]:
+            os.remove(os.path.join(local_dir, relative_path))
+        for relative_dir in plan["delete_dirs"]:
+            os.rmdir(os.path.join(local_dir, relative_dir))
+        
+        return self._sync_result(remote_dir, local_dir, plan, False, transferred_bytes, start_time)
+    
+    def _channel_workers(self, func, items, workers):
+        """
+        Call func(channel, item) for every item using worker threads with dedicated channels.
+        Items may be a generator that is still producing; it is consumed in the calling thread.
+        Returns the list of (item, exception) pairs for the calls that failed.
+        """
+        work = queue.Queue(maxsize=workers * 64)
+        failures = []
+        lock = threading.Lock()
+        
+        def worker(channel):
+            try:
+                while True:
+                    item = work.get()
+                    if item is _STOP:
+                        break
+                    try:
+                        func(channel, item)
+                    except Exception as e:
+                        with lock:
+                            failures.append((item, e))
+            finally:
+                channel.close()
+        
+        threads = [threading.Thread(target=worker, args=(self._open_channel(),), daemon=True)
+                   for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for item in items:
+                work.put(item)
+        finally:
+            for _ in threads:
+                work.put(_STOP)
+            for thread in threads:
+                thread.join()
+        return failures
+    
+    @_instrumented()
+    def walk(self, remote_path='.', workers=4, onerror=None, descend=None):
+        """
+        Recursively list a remote directory, yielding (path, SFTPAttributes) pairs as
+        entries arrive. Up to `workers` directories are listed at the same time, each
+        over its own channel, so entries are not yielded in a sorted or depth-first order.
+        If a directory can't be listed, onerror(path, exception) is called when given,
+        otherwise the exception is raised.
+        If descend is given, subdirectories for which descend(path) is false are
+        yielded but not listed.
+        """
+        directories = queue.Queue()
+        entries = queue.Queue(maxsize=workers * 1024)
+        stop = threading.Event()
+        lock = threading.Lock()
+        pending = [1]  # directories queued or being listed
+        
+        def worker(channel):
+            try:
+                while not stop.is_set():
+                    directory = directories.get()
+                    if directory is _STOP:
+                        break
+                    try:
+                        for file_attr in channel.listdir_attr(directory):
+                            path = os.path.join(directory, file_attr.filename)
+                            if S_ISDIR(file_attr.st_mode) and (descend is None or descend(path)):
+                                with lock:
+                                    pending[0] += 1
+                                directories.put(path)
+                            entries.put((path, file_attr))
+                    except Exception as e:
+                        entries.put((directory, e))
+                    with lock:
+                        pending[0] -= 1
+                        finished = pending[0] == 0
+                    if finished:
+                        entries.put(_STOP)
+            finally:
+                channel.close()
+        
+        threads = [threading.Thread(target=worker, args=(self._open_channel(),), daemon=True)
+                   for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        directories.put(remote_path)
+        try:
+            while True:
+                entry = entries.get()
+                if entry is _STOP:
+                    break
+                path, file_attr = entry
+                if isinstance(file_attr, Exception):
+                    if onerror is None:
+                        raise file_attr
+                    onerror(path, file_attr)
+                    continue
+                if self.cache is not None:
+                    self.cache.put(path, file_attr)
+                yield path, file_attr
+        finally:
+            stop.set()
+            for _ in threads:
+                directories.put(_STOP)
+            # Unblock workers waiting on a full entry queue
+            while any(thread.is_alive() for thread in threads):
+                try:
+                    entries.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+    
+    @_instrumented()
+    def find(self, root='.', pattern=None, min_size=None, newer_than=None, type=None, workers=4, use_exec=False,
+             raw_times=False, onerror=None):
+        """
+        Search a remote tree, yielding {"path", "type", "size", "modified"} for each
+        matching entry as it is found (in no particular order).
+        pattern is a glob matched against the file name, or against the path relative
+        to root if it contains '/' (see glob_regex); subtrees that can't match such a
+        pattern are not listed. min_size is in bytes, newer_than an epoch time or
+        datetime for the modification time, and type one of "f", "d" or "l".
+        The tree is walked over `workers` channels (see walk) and only matching entries
+        are converted. With use_exec, GNU find is run in an exec channel instead when
+        the server allows it (exec hangs on servers forcing internal-sftp, hence opt-in).
+        """
+        if isinstance(newer_than, datetime):
+            newer_than = newer_than.timestamp()
+        name_only = pattern is not None and '/' not in pattern
+        regex = glob_regex(pattern) if pattern is not None and not name_only else None
+        root = root.rstrip('/') or '/'
+        
+        def matches(path, kind, size, mtime):
+            if type is not None and kind != type:
+                return False
+            if min_size is not None and (kind != "f" or size < min_size):
+                return False
+            if newer_than is not None and mtime <= newer_than:
+                return False
+            if name_only:
+                return fnmatch.fnmatchcase(os.path.basename(path), pattern)
+            return regex is None or regex.match(os.path.relpath(path, root)) is not None
+        
+        def entry(path, kind, size, mtime):
+            modified = mtime if raw_times else datetime.fromtimestamp(mtime).isoformat()
+            return {"path": path, "type": kind, "size": size, "modified": modified}
+        
+        if use_exec:
+            found = False
+            try:
+                for path, kind, size, mtime in self._exec_find(root, pattern if name_only else None, min_size,
+                                                                newer_than, type):
+                    if matches(path, kind, size, mtime):
+                        found = True
+                        yield entry(path, kind, size, mtime)
+                return
+            except (IOError, socket.timeout, paramiko.SSHException):
+                if found:
+                    raise
+                if self.metrics:
+                    self.metrics.record_retry("find")
+        
+        descend = None
+        if regex is not None:
+            descend = lambda path: glob_may_contain(pattern, os.path.relpath(path, root))
+        for path, file_attr in self.walk(root, workers, onerror, descend):
+            kind = _FILE_TYPES.get(S_IFMT(file_attr.st_mode), "o")
+            if matches(path, kind, file_attr.st_size, file_attr.st_mtime):
+                yield entry(path, kind, file_attr.st_size, file_attr.st_mtime)
+    
+    def _exec_find(self, root, name, min_size, newer_than, type, timeout=60):
+        """Run GNU find in an exec channel, yielding (path, type, size, mtime) as results arrive."""
+        args = ["find", root, "-mindepth", "1"]
+        if type is not None:
+            args += ["-type", type]
+        if min_size:
+            args += ["-size", f"+{min_size - 1}c"]
+        if newer_than is not None:
+            args += ["-newermt", f"@{newer_than}"]
+        if name is not None:
+            args += ["-name", name]
+        args += ["-printf", "%y %s %T@ %p\\0"]
+        
+        channel = self.transport.open_session()
+        try:
+            channel.settimeout(timeout)
+            channel.exec_command(" ".join(shlex.quote(arg) for arg in args))
+            buffer = b""
+            count = 0
+            for data in iter(lambda: channel.recv(READ_BLOCK_SIZE), b""):
+                *records, buffer = (buffer + data).split(b"\0")
+                for record in records:
+                    kind, size, mtime, path = record.decode('utf-8', 'surrogateescape').split(' ', 3)
+                    count += 1
+                    yield path, kind, int(size), float(mtime)
+            # find exits with 1 for unreadable directories, but without output it didn't run
+            if channel.recv_exit_status() != 0 and count == 0:
+                raise IOError(f"find failed on {root}")
+        finally:
+            channel.close()
+    
+    @_instrumented()
     def create_directory(self, remote_path):
         """Create a directory on the SFTP server."""
         self.ensure_directory(remote_path)
         return {"path": remote_path, "created": True}
     
+    @_instrumented()
     def remove_file(self, remote_path):
-        """Remove a file from the SFTP server."""
+        """Remove a file from the SFTP server, with its checksum and compression files."""
+        self._invalidate(remote_path)
         try:
-            self.sftp.remove(remote_path)
+            try:
+                self.sftp.remove(remote_path)
+            except FileNotFoundError:
+                # Only stored compressed?
+                if not self._clean_sidecars(remote_path):
+                    raise
+            else:
+                self._clean_sidecars(remote_path)
             return {"path": remote_path, "removed": True}
         except Exception as e:
             return {"path": remote_path, "removed": False, "error": str(e)}
     
-    def _rmdir_recursive(self, remote_path):
-        """Recursively remove a directory and its contents."""
-        file_list = self.sftp.listdir_attr(remote_path)
-        
-        for file_attr in file_list:
-            filepath = os.path.join(remote_path, file_attr.filename)
-            if S_ISDIR(file_attr.st_mode):
-                self._rmdir_recursive(filepath)
-            else:
-                self.sftp.remove(filepath)
-        
-        self.sftp.rmdir(remote_path)
-    
-    def remove_directory(self, remote_path, recursive=False):
+    @_instrumented()
+    def remove_directory(self, remote_path, recursive=False, workers=4, progress=None):
         """
         Remove a directory from the SFTP server.
-        If recursive is True, all contents will be removed.
+        If recursive is True, all contents will be removed: files are deleted concurrently
+        over `workers` channels while walk() streams the tree, then directories are
+        removed bottom-up. progress(path, removed_count) is called after each removal.
+        Entries that could not be removed are listed under "failed".
+        Each worker uses its own SSH session, so keep 2 * workers below the server's
+        MaxSessions (10 by default for OpenSSH).
         """
-        try:
-            if recursive:
-                self._rmdir_recursive(remote_path)
-            else:
+        self._invalidate(remote_path, recursive=True)
+        if not recursive:
+            try:
                 self.sftp.rmdir(remote_path)
-            return {"path": remote_path, "removed": True}
+                return {"path": remote_path, "removed": True}
+            except Exception as e:
+                return {"path": remote_path, "removed": False, "error": str(e)}
+        
+        start_time = time.time()
+        failures = []
+        directories = [remote_path]
+        removed = {"files": 0, "directories": 0}
+        lock = threading.Lock()
+        
+        def removed_one(path, kind):
+            with lock:
+                removed[kind] += 1
+                count = removed["files"] + removed["directories"]
+            if progress:
+                progress(path, count)
+        
+        def remove_file(channel, path):
+            channel.remove(path)
+            removed_one(path, "files")
+        
+        def remove_dir(channel, path):
+            channel.rmdir(path)
+            removed_one(path, "directories")
+        
+        def files():
+            for path, file_attr in self.walk(remote_path, workers, onerror=lambda p, e: failures.append((p, e))):
+                if S_ISDIR(file_attr.st_mode):
+                    directories.append(path)
+                else:
+                    yield path
+        
+        try:
+            failures.extend(self._channel_workers(remove_file, files(), workers))
+            # Directories of the same depth don't contain each other and can go in parallel
+            by_depth = {}
+            for path in directories:
+                by_depth.setdefault(path.count('/'), []).append(path)
+            for depth in sorted(by_depth, reverse=True):
+                failures.extend(self._channel_workers(remove_dir, by_depth[depth], workers))
         except Exception as e:
-            return {"path": remote_path, "removed": False, "error": str(e)}
+            failures.append((remote_path, e))
+        # walk() refilled the cache with what was just deleted
+        self._invalidate(remote_path, recursive=True)
+        
+        result = {
+            "path": remote_path,
+            "removed": not failures,
+            "files_removed": removed["files"],
+            "directories_removed": removed["directories"],
+            "time": time.time() - start_time
+        }
+        if failures:
+            result["failed"] = [{"path": path, "error": str(e)} for path, e in failures]
+            result["error"] = f"{len(failures)} entries could not be removed"
+        return result
     
+    @_instrumented()
     def list_directory(self, remote_path='.'):
         """
         List contents of a directory on the SFTP server.
         Returns a JSON structure with file information.
         """
         try:
-            files = self.sftp.listdir_attr(remote_path)
+            files = self._with_retries("listdir", lambda: self.sftp.listdir_attr(remote_path))
             result = []
             
             for file_attr in files:
+                if self.cache is not None:
+                    self.cache.put(os.path.join(remote_path, file_attr.filename), file_attr)
                 is_directory = S_ISDIR(file_attr.st_mode)
                 file_info = {
                     "name": file_attr.filename,
@@ -204,18 +2300,59 @@ class SFTPClient:
         except Exception as e:
             return {"error": str(e)}
     
-    def file_exists(self, remote_path):
+    @_instrumented()
+    def iter_directory(self, remote_path='.', fields=None, raw_times=False, compact=False, read_aheads=50):
+        """
+        Iterate over the contents of a directory as entries arrive from the server,
+        without building the whole listing in memory.
+        fields selects which of LISTING_FIELDS are computed (all by default).
+        If raw_times is True, modified/accessed are epoch seconds instead of ISO strings.
+        If compact is True, tuples in fields order are yielded instead of dictionaries.
+        The listing runs on its own channel, so other calls can be made while iterating.
+        """
+        fields = tuple(fields or LISTING_FIELDS)
+        unknown = set(fields) - set(LISTING_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown listing fields: {', '.join(sorted(unknown))}")
+        
+        if raw_times:
+            modified = lambda a: a.st_mtime
+            accessed = lambda a: a.st_atime
+        else:
+            modified = lambda a: datetime.fromtimestamp(a.st_mtime).isoformat()
+            accessed = lambda a: datetime.fromtimestamp(a.st_atime).isoformat()
+        converters = {
+            "name": lambda a: a.filename,
+            "path": lambda a: os.path.join(remote_path, a.filename),
+            "size": lambda a: a.st_size,
+            "is_directory": lambda a: S_ISDIR(a.st_mode),
+            "modified": modified,
+            "accessed": accessed
+        }
+        getters = [converters[field] for field in fields]
+        
+        channel = self._open_channel()
+        try:
+            for file_attr in channel.listdir_iter(remote_path, read_aheads):
+                values = tuple(getter(file_attr) for getter in getters)
+                yield values if compact else dict(zip(fields, values))
+        finally:
+            channel.close()
+    
+    @_instrumented()
+    def file_exists(self, remote_path, use_cache=True):
         """Check if a file exists on the SFTP server."""
         try:
-            self.sftp.stat(remote_path)
+            self._stat(remote_path, use_cache)
             return True
         except FileNotFoundError:
             return False
     
-    def get_file_info(self, remote_path):
+    @_instrumented()
+    def get_file_info(self, remote_path, use_cache=True):
         """Get detailed information about a file or directory."""
         try:
-            file_attr = self.sftp.stat(remote_path)
+            file_attr = self._stat(remote_path, use_cache)
             is_directory = S_ISDIR(file_attr.st_mode)
             info = {
                 "path": remote_path,
@@ -0,0 +1,121 @@
+import os
+
+# Size of the byte ranges handed out to each stream in parallel transfers
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Size of the local reads feeding a remote file
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Number of read requests kept outstanding per file while downloading
+DEFAULT_QUEUE_DEPTH = 64
+
+# Suffix of in-progress files for resumable transfers, renamed away on completion
+PARTIAL_SUFFIX = '.part'
+
+# Suffix of the local checkpoint file that records a resumable transfer's progress
+CHECKPOINT_SUFFIX = '.sftp-checkpoint'
+
+# Directory of the checkpoints of resumable uploads, so that sources can be read-only
+# and don't get checkpoint files added next to them (downloads keep theirs with the
+# partial file)
+CHECKPOINT_DIR = os.path.join(os.path.expanduser("~"), ".sftp_client", "checkpoints")
+
+# Bytes transferred between checkpoint updates
+CHECKPOINT_INTERVAL = 8 * 1024 * 1024
+
+# Size of the block before the resume offset that is compared on both sides
+RESUME_VERIFY_SIZE = 64 * 1024
+
+# Hash algorithms accepted for transfer verification (any hashlib name also works)
+CHECKSUM_ALGORITHMS = ("sha256", "blake2b", "xxhash")
+
+# Fields available in directory listings
+LISTING_FIELDS = ("name", "path", "size", "is_directory", "modified", "accessed")
+
+# Maximum number of stat results kept by the metadata cache
+DEFAULT_CACHE_SIZE = 10000
+
+# Compression codecs for compressed uploads, with the suffix of the stored object,
+# in the order auto mode prefers them (zlib is always available)
+COMPRESSION_CODECS = {"zstd": ".zst", "lz4": ".lz4", "zlib": ".zz"}
+
+# Suffix of the metadata file stored next to a compressed upload's object
+COMPRESSION_META_SUFFIX = '.sftp-meta'
+
+# Auto mode only compresses files whose first block shrinks below this fraction
+COMPRESSION_MIN_RATIO = 0.9
+
+# Files from this size on are compressed on all cores (zstd)
+COMPRESSION_THREADS_MIN_SIZE = 8 * 1024 * 1024
+
+# AEAD ciphers come first where the installed paramiko supports them; names a
+# transport doesn't know are skipped and the rest of its defaults stay allowed
+_FAST_CIPHERS = ("aes128-gcm@openssh.com", "aes256-gcm@openssh.com", "aes128-ctr", "aes256-ctr")
+
+# Transport settings by profile name, for SFTPClient(profile=...):
+# window_size/max_packet_size of each channel, preferred ciphers and digests (MACs),
+# compress, rekey_bytes/rekey_packets before renegotiating keys, nodelay (TCP_NODELAY)
+# and keepalive (seconds between keepalive packets on an idle transport).
+# A 64KB max packet lets a full 32KB SFTP read response arrive in one SSH packet.
+TRANSPORT_PROFILES = {
+    "default": {},
+    "lan": {
+        "window_size": 8 * 1024 * 1024,
+        "max_packet_size": 64 * 1024,
+        "ciphers": _FAST_CIPHERS,
+        "compress": False,
+        "nodelay": True,
+    },
+    "wan": {
+        # Covers the bandwidth-delay product of ~1 Gbit/s at 250 ms round trips
+        "window_size": 64 * 1024 * 1024,
+        "max_packet_size": 64 * 1024,
+        "ciphers": _FAST_CIPHERS,
+        "compress": False,
+        "rekey_bytes": 2 ** 32,
+        "nodelay": True,
+        "keepalive": 30,
+    },
+    "cpu_constrained": {
+        "window_size": 4 * 1024 * 1024,
+        "max_packet_size": 64 * 1024,
+        "ciphers": ("aes128-gcm@openssh.com", "aes128-ctr"),
+        "digests": ("hmac-sha2-256-etm@openssh.com", "hmac-sha2-256", "hmac-sha1"),
+        "compress": False,
+        "rekey_bytes": 2 ** 32,
+    },
+    "low_bandwidth": {
+        "window_size": 4 * 1024 * 1024,
+        "ciphers": _FAST_CIPHERS,
+        "compress": True,
+        "nodelay": True,
+    },
+}
+
+# Retries after connection failures wait a random time of up to RETRY_BACKOFF * 2 ** attempt
+# seconds (exponential backoff with full jitter), capped at RETRY_MAX_DELAY
+RETRY_BACKOFF = 0.5
+RETRY_MAX_DELAY = 30
+
+# Profiles saved by calibration, keyed by "host:port"
+PROFILE_STORE = os.path.join(os.path.expanduser("~"), ".sftp_client_profiles.json")
+
+# Remote root of the deduplicating store: objects/<digest> holds each content once and
+# the manifest indexes it (see DedupStore)
+DEDUP_ROOT = ".sftp-dedup"
+DEDUP_MANIFEST = "manifest.json"
+
+# Server-side ways to place stored content at a path, tried in order. Only copy-data makes an
+# independent copy by default: exec-cp runs cp in an exec channel, which hangs on servers
+# forcing internal-sftp, and hardlink and symlink share the stored object with the placed
+# files, so overwriting one of them in place changes all of them
+DEDUP_METHODS = ("copy-data",)
+
+# Delta uploads compare the local file with the remote copy in blocks of this size (at most
+# 64KB, which paramiko-based servers hash correctly for the check-file extension), using
+# adler32 as the weak checksum and this strong hash
+DELTA_BLOCK_SIZE = 64 * 1024
+DELTA_ALGORITHM = "md5"
+
+# Suffix of the block signature file written next to a file by delta uploads
+SIGNATURE_SUFFIX = '.sftp-sig'
@@ -0,0 +1,363 @@
+import os
+import sys
+import json
+import time
+import socket
+import builtins
+import threading
+import socketserver
+
+# Directory of the daemons' control sockets, only accessible to the user
+SOCKET_DIR = os.path.join(os.path.expanduser("~"), ".sftp_client")
+
+# SFTPClient methods served by the daemon (their arguments and results are JSON)
+DAEMON_METHODS = ("ensure_directory", "upload_file", "upload_many", "download_file", "sync_up", "sync_down",
+                  "create_directory", "remove_file", "remove_directory", "list_directory", "iter_directory",
+                  "find", "file_exists", "get_file_info")
+
+# Methods whose results are streamed item by item
+_STREAMING_METHODS = ("iter_directory", "find")
+
+# Position and name of the local path argument of each method, resolved against the caller's directory
+_LOCAL_PATH_ARGUMENTS = {
+    "upload_file": (0, "local_path"),
+    "download_file": (1, "local_path"),
+    "sync_up": (0, "local_dir"),
+    "sync_down": (1, "local_dir"),
+}
+
+def default_socket_path(host, port, username):
+    """Control socket of the daemon for a server, like ssh's ControlPath %r@%h:%p."""
+    return os.path.join(SOCKET_DIR, f"{username}@{host}-{port}.sock")
+
+def _send(stream, message):
+    stream.write(json.dumps(message, default=str).encode() + b"\n")
+    stream.flush()
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Serve newline-delimited JSON requests from one local client."""
+    
+    def handle(self):
+        for line in self.rfile:
+            self.server.daemon.touch()
+            try:
+                request = json.loads(line)
+            except ValueError:
+                _send(self.wfile, {"error": "ValueError", "message": "Malformed request"})
+                continue
+            try:
+                self.server.daemon.handle_request(request, self.wfile)
+            except (BrokenPipeError, ConnectionResetError):
+                return  # The client disconnected
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class SFTPDaemon:
+    def __init__(self, host="localhost", port=2222, username="sftp_user", password=None, private_key_path=None,
+                 socket_path=None, max_connections=4, idle_timeout=None, profile=None, retries=0):
+        """
+        Keep authenticated SFTP connections open and serve SFTPClient calls over a
+        local Unix socket, like an ssh ControlMaster. Commands sent through
+        DaemonClient then cost one local round trip instead of a TCP and SSH handshake.
+        The socket is only accessible to the current user, who needs no further
+        authentication. With idle_timeout, the daemon exits after that many seconds
+        without requests (like ControlPersist). profile and retries configure the
+        pooled connections as in SFTPClient.
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.socket_path = socket_path or default_socket_path(host, port, username)
+        self.idle_timeout = idle_timeout
+        self._pool_options = dict(host=host, port=port, username=username, password=password,
+                                  private_key_path=private_key_path and os.path.abspath(private_key_path),
+                                  max_size=max_connections, min_size=1, profile=profile, retries=retries)
+        self.pool = None
+        self._server = None
+        self._started = None
+        self._last_request = time.time()
+        self._requests = 0
+        self._listening = False
+        self._lock = threading.Lock()
+    
+    def touch(self):
+        """Record activity for the idle timeout."""
+        with self._lock:
+            self._last_request = time.time()
+            self._requests += 1
+    
+    def start(self):
+        """Open the warm connection and start listening on the control socket."""
+        # paramiko is only needed by the daemon process, not by its clients
+        from sftp_pool import SFTPConnectionPool
+        
+        self.pool = SFTPConnectionPool(**self._pool_options)
+        self.pool.warm()
+        
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            if DaemonClient(self.socket_path).connect():
+                self.pool.close()
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            os.remove(self.socket_path)  # Left by a daemon that didn't shut down cleanly
+        
+        previous_umask = os.umask(0o177)
+        try:
+            self._server = _UnixServer(self.socket_path, _RequestHandler)
+        finally:
+            os.umask(previous_umask)
+        self._server.daemon = self
+        self._listening = True
+        self._started = time.time()
+        self._last_request = time.time()
+        if self.idle_timeout:
+            threading.Thread(target=self._watch_idle, daemon=True).start()
+        return self
+    
+    def serve_forever(self):
+        """Serve requests until stop() is called or the idle timeout expires."""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._cleanup()
+    
+    def start_background(self):
+        """Start serving on a background thread."""
+        self.start()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+    
+    def stop(self):
+        """Stop serving; serve_forever() then closes the connections."""
+        if self._server is not None:
+            # New clients find no daemon from now on, instead of a server shutting down
+            self._remove_socket()
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+    
+    def _remove_socket(self):
+        with self._lock:
+            if self._listening:
+                self._listening = False
+                if os.path.exists(self.socket_path):
+                    os.remove(self.socket_path)
+    
+    def _cleanup(self):
+        self._remove_socket()
+        self._server.server_close()
+        self.pool.close()
+    
+    def _watch_idle(self):
+        while True:
+            time.sleep(min(1.0, self.idle_timeout))
+            if time.time() - self._last_request > self.idle_timeout:
+                self.stop()
+                return
+    
+    def status(self):
+        """Get the daemon's target, connection settings, uptime and connection pool counters."""
+        return {
+            "pid": os.getpid(),
+            "host": self.host,
+            "port": self.port,
+            "username": self.username,
+            "profile": self._pool_options["profile"],
+            "retries": self._pool_options["retries"],
+            "socket": self.socket_path,
+            "uptime": time.time() - self._started,
+            "requests": self._requests,
+            "pool": self.pool.stats()
+        }
+    
+    def handle_request(self, request, stream):
+        """Run one request and write its response message(s) to stream."""
+        method = request.get("method")
+        try:
+            if method == "status":
+                _send(stream, {"result": self.status()})
+            elif method == "stop":
+                _send(stream, {"result": True})
+                self.stop()
+            elif method in DAEMON_METHODS:
+                args, kwargs = request.get("args", []), request.get("kwargs", {})
+                disconnected = None
+                with self.pool.connection() as client:
+                    result = getattr(client, method)(*args, **kwargs)
+                    if method in _STREAMING_METHODS:
+                        try:
+                            for item in result:
+                                _send(stream, {"item": item})
+                        except (BrokenPipeError, ConnectionResetError) as e:
+                            # The local client went away, the SFTP connection is still usable
+                            disconnected = e
+                        finally:
+                            # Stop the generator's requests before the connection is reused
+                            result.close()
+                        result = None
+                if disconnected:
+                    raise disconnected
+                _send(stream, {"result": result})
+            else:
+                raise ValueError(f"Unsupported daemon method: {method}")
+        except (BrokenPipeError, ConnectionResetError):
+            raise
+        except Exception as e:
+            _send(stream, {"error": type(e).__name__, "message": str(e)})
+
+class DaemonClient:
+    def __init__(self, socket_path, timeout=None):
+        """
+        Client for a running SFTPDaemon, exposing the DAEMON_METHODS of SFTPClient.
+        Local paths are resolved against the caller's working directory before they
+        are sent, progress callbacks are not supported, and errors are raised again
+        locally with the same built-in exception type when there is one.
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._socket = None
+        self._stream = None
+    
+    def connect(self):
+        """Connect to the daemon, returning False if none is listening."""
+        try:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(self.timeout)
+            self._socket.connect(self.socket_path)
+        except OSError:
+            self._socket.close()
+            self._socket = None
+            return False
+        self._stream = self._socket.makefile('rwb')
+        return True
+    
+    def disconnect(self):
+        """Close the connection to the daemon (the daemon keeps running)."""
+        if self._stream:
+            try:
+                self._stream.close()
+            except OSError:
+                pass  # The daemon exited
+        if self._socket:
+            self._socket.close()
+        self._stream = None
+        self._socket = None
+    
+    def __enter__(self):
+        """Context manager entry."""
+        self.connect()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit."""
+        self.disconnect()
+    
+    @staticmethod
+    def _raise(response):
+        error_type = getattr(builtins, response["error"], None)
+        if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+            error_type = RuntimeError
+        raise error_type(response["message"])
+    
+    def _request(self, method, args=(), kwargs=None):
+        if self._stream is None:
+            raise ConnectionError(f"Not connected to an SFTP daemon at {self.socket_path}")
+        _send(self._stream, {"method": method, "args": list(args), "kwargs": kwargs or {}})
+    
+    def _response(self):
+        line = self._stream.readline()
+        if not line:
+            raise ConnectionError("The SFTP daemon closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            self._raise(response)
+        return response
+    
+    def call(self, method, *args, **kwargs):
+        """Run a daemon method and return its result."""
+        self._request(method, args, kwargs)
+        return self._response()["result"]
+    
+    def _stream_items(self, method, args, kwargs):
+        self._request(method, args, kwargs)
+        while True:
+            response = self._response()
+            if "item" not in response:
+                return
+            yield response["item"]
+    
+    @staticmethod
+    def _localize(method, args, kwargs):
+        """Make local path arguments absolute, since the daemon runs in another directory."""
+        args = list(args)
+        if method == "upload_many":
+            pairs = args[0] if args else kwargs["pairs"]
+            pairs = [(os.path.abspath(local), remote) for local, remote in pairs]
+            if args:
+                args[0] = pairs
+            else:
+                kwargs["pairs"] = pairs
+        elif method in _LOCAL_PATH_ARGUMENTS:
+            position, name = _LOCAL_PATH_ARGUMENTS[method]
+            if len(args) > position:
+                # download_file without a local path saves to the current directory
+                args[position] = os.path.abspath(args[position] or ".")
+            else:
+                kwargs[name] = os.path.abspath(kwargs.get(name) or ".")
+        return args, kwargs
+    
+    def status(self):
+        """Get the daemon's target, connection settings, uptime and connection pool counters."""
+        return self.call("status")
+    
+    def stop(self):
+        """Ask the daemon to exit."""
+        return self.call("stop")
+    
+    def __getattr__(self, name):
+        if name not in DAEMON_METHODS:
+            raise AttributeError(f"{type(self).__name__} has no attribute {name!r}")
+        
+        def method(*args, **kwargs):
+            if any(callable(v) for v in list(args) + list(kwargs.values())):
+                raise TypeError("Callbacks can't be sent to the SFTP daemon")
+            args, kwargs = self._localize(name, args, kwargs)
+            if name in _STREAMING_METHODS:
+                return self._stream_items(name, args, kwargs)
+            return self.call(name, *args, **kwargs)
+        return method
+
+def spawn_daemon(argv, socket_path, timeout=10, env=None, log_path=None):
+    """
+    Run "python <argv>" detached from the terminal as the daemon process and wait
+    until it accepts connections on socket_path. The daemon's stderr goes to log_path
+    (by default the socket's path with a .log suffix, under SOCKET_DIR), which is
+    also where an early exit is reported from.
+    """
+    import subprocess
+    
+    if log_path is None:
+        log_path = os.path.splitext(socket_path)[0] + ".log"
+    directory = os.path.dirname(log_path)
+    if directory:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    log_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        process = subprocess.Popen([sys.executable] + argv, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                   stderr=log_fd, start_new_session=True, env=env)
+    finally:
+        # The daemon keeps its own copy
+        os.close(log_fd)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            with open(log_path, errors='replace') as log:
+                raise RuntimeError(f"SFTP daemon exited: {log.read().strip()}")
+        client = DaemonClient(socket_path)
+        if client.connect():
+            client.disconnect()
+            return process.pid
+        time.sleep(0.05)
+    process.kill()
+    raise TimeoutError(f"SFTP daemon did not start listening on {socket_path} (see {log_path})")
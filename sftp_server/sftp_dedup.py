@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import shlex
+import posixpath
+import threading
+from stat import S_ISDIR
+from paramiko import SSHException
+from paramiko.sftp import CMD_EXTENDED, int64
+from sftp_config import PARTIAL_SUFFIX, DEDUP_ROOT, DEDUP_MANIFEST, DEDUP_METHODS
+from sftp_client import file_digest
+
+class DedupStore:
+    def __init__(self, client, root=DEDUP_ROOT, algorithm="sha256", methods=DEDUP_METHODS):
+        """
+        Content-addressed uploads through a connected SFTPClient.
+        Each distinct content is uploaded once to "<root>/objects/<digest>" and indexed in
+        "<root>/manifest.json"; uploading a file whose digest is already stored places
+        the stored object at the destination on the server instead of sending it again.
+        methods are the server-side ways to place it, tried in order: "copy-data" (the
+        copy-data extension of OpenSSH 9, the default), "exec-cp" (cp run in an exec
+        channel), "hardlink" (hardlink@openssh.com) and "symlink" (relative to the
+        destination). Hardlinks and symlinks are not copies: a later upload overwriting
+        a placed file in place rewrites the stored object and every file placed from it,
+        so only use them for files that are never overwritten. A method the server
+        refuses is not tried again, and when none works files are uploaded to their
+        destination directly. Stored objects get a modification time derived from their
+        digest, so one modified since it was stored is not reused.
+        """
+        self.client = client
+        self.root = root.rstrip('/') or '/'
+        self.algorithm = algorithm
+        self.methods = list(methods)
+        self._index = None
+        self._dirty = False
+        self._digests = {}  # Local digests by path, with the size and mtime they were computed at
+        self._lock = threading.Lock()
+        self._stats = {"uploads": 0, "deduplicated": 0, "bytes_sent": 0, "bytes_saved": 0}
+    
+    @property
+    def manifest_path(self):
+        return posixpath.join(self.root, DEDUP_MANIFEST)
+    
+    def object_path(self, digest):
+        """Remote path of the object holding a content, fanned out by the first two hex digits."""
+        return posixpath.join(self.root, "objects", digest[:2], digest)
+    
+    def _load_manifest(self):
+        """Read the manifest from the server, or an empty one."""
+        try:
+            with self.client.sftp.open(self.manifest_path, 'rb') as f:
+                manifest = json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return {}
+        if manifest.get("algorithm") != self.algorithm:
+            return {}
+        return manifest.get("objects", {})
+    
+    def index(self):
+        """Get the objects known to the manifest, by digest."""
+        if self._index is None:
+            self._index = self._load_manifest()
+        return self._index
+    
+    def refresh(self):
+        """Forget the cached manifest, so the next upload reads it again."""
+        self._index = None
+    
+    def flush(self):
+        """
+        Write new index entries to the manifest. The server's copy is merged in first,
+        so entries added concurrently by other clients are kept.
+        """
+        if not self._dirty:
+            return
+        objects = self._load_manifest()
+        objects.update(self._index)
+        data = json.dumps({"algorithm": self.algorithm, "objects": objects}, sort_keys=True).encode()
+        partial_path = self.manifest_path + PARTIAL_SUFFIX
+        self.client.upload_bytes(data, partial_path)
+        self.client._commit_remote(partial_path, self.manifest_path)
+        self._index = objects
+        self._dirty = False
+    
+    def digest(self, local_path):
+        """Hash a local file, reusing the digest while its size and mtime are unchanged."""
+        st = os.stat(local_path)
+        key = os.path.abspath(local_path)
+        cached = self._digests.get(key)
+        if cached and cached[:2] == (st.st_size, st.st_mtime_ns):
+            return cached[2]
+        digest = file_digest(local_path, self.algorithm)
+        self._digests[key] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+    
+    @staticmethod
+    def _marker(digest):
+        """Modification time given to a stored object, which any write to it replaces with the current time."""
+        return int(digest[:7], 16)  # Before 1979
+    
+    def _stored(self, digest, size):
+        """Check that an indexed object is still on the server, unmodified."""
+        entry = self.index().get(digest)
+        if entry is None:
+            return False
+        try:
+            file_attr = self.client.sftp.stat(self.object_path(digest))
+            if file_attr.st_size == size and file_attr.st_mtime == entry.get("mtime") == self._marker(digest):
+                return True
+        except FileNotFoundError:
+            pass
+        # Removed or overwritten since it was indexed
+        del self._index[digest]
+        self._dirty = True
+        return False
+    
+    def _store(self, remote_path, digest, size):
+        """Copy an uploaded file into the store on the server and index it."""
+        object_path = self.object_path(digest)
+        self.client.ensure_directory(posixpath.dirname(object_path))
+        if self._place(remote_path, object_path, size) is None:
+            return
+        marker = self._marker(digest)
+        self.client.sftp.utime(object_path, (marker, marker))
+        self.index()[digest] = {"size": size, "mtime": marker, "stored": time.time()}
+        self._dirty = True
+    
+    def _hardlink(self, source, target):
+        sftp = self.client.sftp
+        sftp._request(CMD_EXTENDED, "hardlink@openssh.com", sftp._adjust_cwd(source), sftp._adjust_cwd(target))
+    
+    def _copy_data(self, source, target):
+        sftp = self.client.sftp
+        with sftp.open(source, 'rb') as src, sftp.open(target, 'wb') as dst:
+            # Length 0 copies up to the end of the source
+            sftp._request(CMD_EXTENDED, "copy-data", src.handle, int64(0), int64(0), dst.handle, int64(0))
+    
+    def _symlink(self, source, target):
+        self.client.sftp.symlink(posixpath.relpath(source, posixpath.dirname(target) or '.'), target)
+    
+    def _exec_cp(self, source, target):
+        channel = self.client.transport.open_session()
+        try:
+            channel.exec_command(f"cp -- {shlex.quote(source)} {shlex.quote(target)}")
+            status = channel.recv_exit_status()
+        finally:
+            channel.close()
+        if status != 0:
+            raise IOError(f"cp exited with status {status}")
+    
+    def _place(self, source, remote_path, size):
+        """Make remote_path a copy of source on the server, returning the method used or None."""
+        partial_path = remote_path + PARTIAL_SUFFIX
+        for method in list(self.methods):
+            self._discard(partial_path)  # Left by an interrupted placement
+            try:
+                getattr(self, "_" + method.replace("-", "_"))(source, partial_path)
+                if self.client.sftp.stat(partial_path).st_size != size:
+                    raise IOError(f"Size mismatch placing {remote_path} with {method}")
+            except FileNotFoundError:
+                # The source was removed since it was checked
+                self._discard(partial_path)
+                return None
+            except (IOError, EOFError, SSHException):
+                # Unsupported by the server (or refused across filesystems), don't try it again
+                self._discard(partial_path)
+                with self._lock:
+                    if method in self.methods:
+                        self.methods.remove(method)
+                if self.client.metrics:
+                    self.client.metrics.record_retry("dedup")
+                continue
+            self.client._commit_remote(partial_path, remote_path)
+            self.client._invalidate(remote_path)
+            self.client._update_sidecars(remote_path)
+            return method
+        return None
+    
+    def _discard(self, remote_path):
+        try:
+            self.client.sftp.remove(remote_path)
+        except IOError:
+            pass
+    
+    def _resolve_remote_path(self, local_path, remote_path):
+        """Apply upload_file's rules for a missing or directory remote_path."""
+        if not remote_path:
+            return os.path.basename(local_path)
+        try:
+            if S_ISDIR(self.client._stat(remote_path).st_mode):
+                return posixpath.join(remote_path, os.path.basename(local_path))
+        except FileNotFoundError:
+            pass
+        return remote_path
+    
+    def upload_file(self, local_path, remote_path=None, flush=True, **kwargs):
+        """
+        Upload a file unless its content is already stored, in which case it is copied
+        or linked on the server. New content is sent to remote_path, then copied into
+        the store on the server, so it is only sent once. The result has upload_file's
+        fields plus the digest, deduplicated, the placement method and bytes_saved.
+        Other keyword arguments go to SFTPClient.upload_file when the content is sent.
+        With flush False, the manifest is only updated by flush().
+        """
+        if not os.path.isfile(local_path):
+            raise FileNotFoundError(f"Local file not found: {local_path}")
+        start_time = time.time()
+        remote_path = self._resolve_remote_path(local_path, remote_path)
+        size = os.path.getsize(local_path)
+        digest = self.digest(local_path)
+        object_path = self.object_path(digest)
+        
+        sent = 0
+        method = None
+        if self.methods and self._stored(digest, size):
+            if posixpath.dirname(remote_path):
+                self.client.ensure_directory(posixpath.dirname(remote_path))
+            method = self._place(object_path, remote_path, size)
+        if method is None:
+            # New content, or no server-side copy: send the file where it belongs
+            self.client.upload_file(local_path, remote_path, **kwargs)
+            sent = size
+            if self.methods and digest not in self.index():
+                self._store(remote_path, digest, size)
+        if flush:
+            self.flush()
+        
+        saved = size if method else 0
+        elapsed_time = time.time() - start_time
+        with self._lock:
+            self._stats["uploads"] += 1
+            self._stats["deduplicated"] += 1 if saved else 0
+            self._stats["bytes_sent"] += sent
+            self._stats["bytes_saved"] += saved
+        return {
+            "path": remote_path,
+            "size": size,
+            "digest": digest,
+            "deduplicated": bool(saved),
+            "method": method,
+            "bytes_sent": sent,
+            "bytes_saved": saved,
+            "time": elapsed_time,
+            "speed": size / elapsed_time if elapsed_time > 0 else 0
+        }
+    
+    def upload_many(self, pairs, **kwargs):
+        """
+        Upload (local_path, remote_path) pairs through the store, writing the manifest
+        once at the end, and return the results with the totals sent and saved.
+        """
+        results = []
+        try:
+            for local_path, remote_path in pairs:
+                results.append(self.upload_file(local_path, remote_path, flush=False, **kwargs))
+        finally:
+            self.flush()
+        return {
+            "files": results,
+            "deduplicated": sum(1 for r in results if r["deduplicated"]),
+            "bytes_sent": sum(r["bytes_sent"] for r in results),
+            "bytes_saved": sum(r["bytes_saved"] for r in results)
+        }
+    
+    def stats(self):
+        """Get upload, deduplication and byte counters."""
+        with self._lock:
+            return dict(self._stats, methods=list(self.methods))
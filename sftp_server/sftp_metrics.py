@@ -0,0 +1,211 @@
+import time
+import threading
+from contextlib import contextmanager
+from paramiko.sftp import CMD_NAMES, CMD_WRITE, CMD_DATA, CMD_EXTENDED
+
+# Latency histogram bucket upper bounds in seconds (the Prometheus client defaults)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Request id and data length that precede the payload of an SSH_FXP_DATA packet
+_DATA_HEADER_SIZE = 8
+
+class _Histogram:
+    """Cumulative latency histogram with fixed bucket bounds."""
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.bytes = 0
+    
+    def observe(self, seconds, size=None):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        if size:
+            self.bytes += size
+
+class SFTPMetrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Collect SFTPClient instrumentation: per-operation latency histograms,
+        SFTP requests issued by type, payload bytes sent and received, and
+        errors and retries. One instance can be shared by several clients
+        (e.g. through SFTPConnectionPool) and is safe to update from threads.
+        Hooks added with add_hook(hook) are called as hook(kind, name, value)
+        for every event, kind being "latency", "request", "bytes", "error" or "retry".
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._hooks = []
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        """Clear all collected values."""
+        with self._lock:
+            self._operations = {}
+            self._requests = {}
+            self._bytes = {"sent": 0, "received": 0}
+            self._errors = {}
+            self._retries = {}
+            self._started = time.time()
+    
+    def add_hook(self, hook):
+        """Register a callable hook(kind, name, value) called on every event."""
+        self._hooks.append(hook)
+    
+    def remove_hook(self, hook):
+        """Unregister a hook."""
+        self._hooks.remove(hook)
+    
+    def _emit(self, kind, name, value):
+        for hook in self._hooks:
+            hook(kind, name, value)
+    
+    def observe(self, operation, seconds, size=None, error=None):
+        """Record the duration of an operation, with the bytes it moved and the error it raised, if any."""
+        with self._lock:
+            histogram = self._operations.get(operation)
+            if histogram is None:
+                histogram = self._operations[operation] = _Histogram(self.buckets)
+            histogram.observe(seconds, size)
+        self._emit("latency", operation, seconds)
+        if error is not None:
+            self.record_error(operation, error)
+    
+    @contextmanager
+    def time(self, operation):
+        """Time a with block as operation, counting an exception leaving it as an error."""
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.observe(operation, time.perf_counter() - start, error=error)
+    
+    def count_request(self, request):
+        """Count one SFTP request of the given type (e.g. "open", "stat")."""
+        with self._lock:
+            self._requests[request] = self._requests.get(request, 0) + 1
+        self._emit("request", request, 1)
+    
+    def add_bytes(self, direction, count):
+        """Add payload bytes moved in a direction ("sent" or "received")."""
+        with self._lock:
+            self._bytes[direction] = self._bytes.get(direction, 0) + count
+        self._emit("bytes", direction, count)
+    
+    def record_error(self, operation, error):
+        """Count a failed operation by exception type, or by error if it is a string."""
+        error_type = error if isinstance(error, str) else type(error).__name__
+        with self._lock:
+            errors_by_type = self._errors.setdefault(operation, {})
+            errors_by_type[error_type] = errors_by_type.get(error_type, 0) + 1
+        self._emit("error", operation, error)
+    
+    def record_retry(self, operation):
+        """Count one retry of an operation."""
+        with self._lock:
+            self._retries[operation] = self._retries.get(operation, 0) + 1
+        self._emit("retry", operation, 1)
+    
+    def instrument(self, sftp):
+        """
+        Count the requests and payload bytes of a paramiko SFTPClient channel.
+        Every request goes through _async_request and every response through
+        _read_packet, including paramiko's own prefetch and pipelined writes.
+        """
+        async_request = sftp._async_request
+        read_packet = sftp._read_packet
+        
+        def counted_request(fileobj, t, *args):
+            if t == CMD_EXTENDED and args:
+                # Name extensions individually, e.g. posix-rename@openssh.com
+                name = args[0]
+                self.count_request(name.decode() if isinstance(name, bytes) else name)
+            else:
+                self.count_request(CMD_NAMES.get(t, str(t)))
+            if t == CMD_WRITE:
+                self.add_bytes("sent", len(args[2]))
+            return async_request(fileobj, t, *args)
+        
+        def counted_packet():
+            t, data = read_packet()
+            if t == CMD_DATA:
+                self.add_bytes("received", max(0, len(data) - _DATA_HEADER_SIZE))
+            return t, data
+        
+        sftp._async_request = counted_request
+        sftp._read_packet = counted_packet
+        return sftp
+    
+    def snapshot(self):
+        """Get all collected values as a JSON-serializable dictionary."""
+        with self._lock:
+            operations = {}
+            for operation, h in sorted(self._operations.items()):
+                operations[operation] = {
+                    "count": h.count,
+                    "errors": sum(self._errors.get(operation, {}).values()),
+                    "total_time": h.sum,
+                    "mean_time": h.sum / h.count if h.count else 0,
+                    "bytes": h.bytes,
+                    "speed": h.bytes / h.sum if h.sum > 0 else 0,
+                    "buckets": {str(bound): count for bound, count in zip(self.buckets, h.counts)},
+                }
+            return {
+                "uptime": time.time() - self._started,
+                "operations": operations,
+                "requests": dict(sorted(self._requests.items())),
+                "requests_total": sum(self._requests.values()),
+                "bytes": dict(self._bytes),
+                "errors": {operation: dict(counts) for operation, counts in self._errors.items()},
+                "retries": dict(self._retries),
+            }
+    
+    def to_prometheus(self, prefix="sftp_client"):
+        """Render the collected values in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        
+        def family(name, metric_type, help_text):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+        
+        family("operation_duration_seconds", "histogram", "Latency of SFTPClient operations.")
+        for operation, stats in snapshot["operations"].items():
+            for bound, count in stats["buckets"].items():
+                lines.append(f'{prefix}_operation_duration_seconds_bucket{{operation="{operation}",le="{bound}"}} {count}')
+            lines.append(f'{prefix}_operation_duration_seconds_bucket{{operation="{operation}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'{prefix}_operation_duration_seconds_sum{{operation="{operation}"}} {stats["total_time"]}')
+            lines.append(f'{prefix}_operation_duration_seconds_count{{operation="{operation}"}} {stats["count"]}')
+        
+        family("operation_bytes_total", "counter", "Bytes transferred by SFTPClient operations.")
+        for operation, stats in snapshot["operations"].items():
+            if stats["bytes"]:
+                lines.append(f'{prefix}_operation_bytes_total{{operation="{operation}"}} {stats["bytes"]}')
+        
+        family("requests_total", "counter", "SFTP protocol requests issued.")
+        for request, count in snapshot["requests"].items():
+            lines.append(f'{prefix}_requests_total{{request="{request}"}} {count}')
+        
+        family("payload_bytes_total", "counter", "File data bytes written and read over SFTP.")
+        for direction, count in snapshot["bytes"].items():
+            lines.append(f'{prefix}_payload_bytes_total{{direction="{direction}"}} {count}')
+        
+        family("errors_total", "counter", "Failed SFTPClient operations.")
+        for operation, counts in snapshot["errors"].items():
+            for error_type, count in counts.items():
+                lines.append(f'{prefix}_errors_total{{operation="{operation}",error="{error_type}"}} {count}')
+        
+        family("retries_total", "counter", "Retried SFTPClient operations.")
+        for operation, count in snapshot["retries"].items():
+            lines.append(f'{prefix}_retries_total{{operation="{operation}"}} {count}')
+        
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,257 @@
+import time
+import threading
+import paramiko
+from contextlib import contextmanager
+from sftp_client import SFTPClient
+
+class SFTPConnectionPool:
+    def __init__(self, host="localhost", port=2222, username="sftp_user", password=None, private_key_path=None,
+                 max_size=4, min_size=0, idle_timeout=300, health_check_interval=30, metrics=None,
+                 profile=None, retries=0):
+        """
+        Initialize a pool of authenticated SFTP connections.
+        Connections are opened lazily up to max_size and kept warm between uses.
+        Idle connections older than idle_timeout seconds are closed, and a connection
+        that has not been used for health_check_interval seconds is probed before
+        being handed out again.
+        metrics (an SFTPMetrics instance) is shared by all pooled connections, and
+        profile is the transport tuning profile they are opened with and retries the
+        number of reconnect-and-retry attempts of each connection (see SFTPClient).
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.private_key_path = private_key_path
+        self.max_size = max_size
+        self.min_size = min_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.metrics = metrics
+        self.profile = profile
+        self.retries = retries
+        
+        self._idle = []  # (client, last_used) pairs, most recently used last
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stats = {"created": 0, "reused": 0, "evicted": 0, "failed_checks": 0, "waits": 0}
+    
+    def __enter__(self):
+        """Context manager entry."""
+        self.warm()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit."""
+        self.close()
+    
+    def _create(self):
+        """Open and authenticate a new connection."""
+        client = SFTPClient(self.host, self.port, self.username, self.password, self.private_key_path,
+                            metrics=self.metrics, profile=self.profile, retries=self.retries)
+        if not client.connect():
+            raise ConnectionError(f"Failed to connect to SFTP server {self.host}:{self.port}")
+        return client
+    
+    def _is_healthy(self, client):
+        """Check that a pooled connection can still serve requests."""
+        if client.transport is None or not client.transport.is_active():
+            return False
+        try:
+            client.sftp.normalize('.')
+            return True
+        except Exception:
+            return False
+    
+    def _evict_idle(self):
+        """
+        Take the connections that have been idle for longer than idle_timeout out of the
+        pool (lock held) and return them, to be disconnected once the lock is released.
+        """
+        now = time.time()
+        keep, evicted = [], []
+        for client, last_used in self._idle:
+            if now - last_used > self.idle_timeout and self._size > self.min_size:
+                evicted.append(client)
+                self._size -= 1
+                self._stats["evicted"] += 1
+            else:
+                keep.append((client, last_used))
+        self._idle = keep
+        return evicted
+    
+    def warm(self):
+        """Open connections until min_size are available."""
+        with self._condition:
+            missing = self.min_size - self._size
+            self._size += max(0, missing)
+        
+        for _ in range(max(0, missing)):
+            try:
+                client = self._create()
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._condition.notify()
+                raise
+            with self._condition:
+                self._stats["created"] += 1
+                self._idle.append((client, time.time()))
+                self._condition.notify()
+    
+    def acquire(self, timeout=None):
+        """
+        Take a connection from the pool, opening a new one if the pool is not full.
+        Blocks until a connection is released when max_size connections are in use.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            evicted = []
+            try:
+                with self._condition:
+                    if self._closed:
+                        raise RuntimeError("Connection pool is closed")
+                    evicted = self._evict_idle()
+                    
+                    if self._idle:
+                        client, last_used = self._idle.pop()
+                    elif self._size < self.max_size:
+                        # Reserve a slot, then connect outside the lock
+                        self._size += 1
+                        client, last_used = None, None
+                    else:
+                        self._stats["waits"] += 1
+                        remaining = None if deadline is None else deadline - time.time()
+                        if remaining is not None and remaining <= 0:
+                            raise TimeoutError("Timed out waiting for an SFTP connection")
+                        self._condition.wait(remaining)
+                        continue
+            finally:
+                # A slow SSH teardown mustn't hold up the other threads
+                for evicted_client in evicted:
+                    evicted_client.disconnect()
+            
+            if client is None:
+                try:
+                    client = self._create()
+                except Exception:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+                with self._condition:
+                    self._stats["created"] += 1
+                return client
+            
+            if time.time() - last_used > self.health_check_interval and not self._is_healthy(client):
+                self._discard(client)
+                with self._condition:
+                    self._stats["failed_checks"] += 1
+                if self.metrics:
+                    self.metrics.record_retry("acquire")
+                continue
+            
+            with self._condition:
+                self._stats["reused"] += 1
+            return client
+    
+    def release(self, client, discard=False):
+        """Return a connection to the pool, or close it if discard is True or the pool is closed."""
+        if not discard and client.transport is not None and client.transport.is_active():
+            with self._condition:
+                if not self._closed:
+                    self._idle.append((client, time.time()))
+                    self._condition.notify()
+                    return
+        self._discard(client)
+    
+    def _discard(self, client):
+        """Close a connection and free its slot."""
+        client.disconnect()
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+    
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection for the duration of a with block."""
+        client = self.acquire(timeout)
+        discard = False
+        try:
+            yield client
+        except (EOFError, OSError, paramiko.SSHException) as e:
+            # Connection-level failures leave the transport in an unknown state; errors
+            # the server returned (missing file, SFTP_EOF, failed rename...) don't
+            discard = client._is_connection_error(e)
+            raise
+        finally:
+            self.release(client, discard)
+    
+    def close(self):
+        """Close all idle connections and refuse further use of the pool."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for client, _ in idle:
+            client.disconnect()
+    
+    def stats(self):
+        """Get pool usage counters."""
+        with self._condition:
+            return dict(self._stats, size=self._size, idle=len(self._idle), max_size=self.max_size)
+    
+    def _run(self, method, *args, **kwargs):
+        """Run an SFTPClient method on a pooled connection."""
+        with self.connection() as client:
+            return getattr(client, method)(*args, **kwargs)
+    
+    def ensure_directory(self, remote_path):
+        """Recursively create remote directories if they don't exist."""
+        return self._run("ensure_directory", remote_path)
+    
+    def upload_file(self, local_path, remote_path=None, **kwargs):
+        """Upload a file to the SFTP server."""
+        return self._run("upload_file", local_path, remote_path, **kwargs)
+    
+    def download_file(self, remote_path, local_path=None, **kwargs):
+        """Download a file from the SFTP server."""
+        return self._run("download_file", remote_path, local_path, **kwargs)
+    
+    def upload_bytes(self, data, remote_path, **kwargs):
+        """Upload an in-memory buffer to the SFTP server."""
+        return self._run("upload_bytes", data, remote_path, **kwargs)
+    
+    def upload_stream(self, stream, remote_path, **kwargs):
+        """Upload everything read from a file-like object to the SFTP server."""
+        return self._run("upload_stream", stream, remote_path, **kwargs)
+    
+    def download_into(self, remote_path, target, **kwargs):
+        """Download a file into a writable buffer or file-like object."""
+        return self._run("download_into", remote_path, target, **kwargs)
+    
+    def create_directory(self, remote_path):
+        """Create a directory on the SFTP server."""
+        return self._run("create_directory", remote_path)
+    
+    def remove_file(self, remote_path):
+        """Remove a file from the SFTP server."""
+        return self._run("remove_file", remote_path)
+    
+    def remove_directory(self, remote_path, recursive=False):
+        """Remove a directory from the SFTP server."""
+        return self._run("remove_directory", remote_path, recursive)
+    
+    def list_directory(self, remote_path='.'):
+        """List contents of a directory on the SFTP server."""
+        return self._run("list_directory", remote_path)
+    
+    def file_exists(self, remote_path):
+        """Check if a file exists on the SFTP server."""
+        return self._run("file_exists", remote_path)
+    
+    def get_file_info(self, remote_path):
+        """Get detailed information about a file or directory."""
+        return self._run("get_file_info", remote_path)
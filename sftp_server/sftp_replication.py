@@ -0,0 +1,270 @@
+import os
+import time
+import threading
+import posixpath
+from collections import deque
+import paramiko
+from sftp_config import READ_BLOCK_SIZE, PARTIAL_SUFFIX
+from sftp_client import SFTPClient
+
+# Bytes a replica may fall behind the quorum before it is dropped
+DEFAULT_REPLICA_BUFFER = 64 * 1024 * 1024
+
+# Seconds the quorum waits in total for a replica with a full buffer before dropping it
+DEFAULT_STALL_TIMEOUT = 1.0
+
+# Seconds replicas still writing once quorum acknowledged the file get to finish
+DEFAULT_STRAGGLER_TIMEOUT = 30.0
+
+class _Replica:
+    """Upload state of one server."""
+    
+    def __init__(self, client):
+        self.client = client
+        self.blocks = deque()
+        self.buffered = 0
+        self.status = "pending"
+        self.stalled = 0.0
+        self.error = None
+        self.bytes = 0
+        self.time = 0.0
+        self.thread = None
+    
+    @property
+    def active(self):
+        return self.status in ("pending", "writing")
+    
+    def report(self):
+        return {
+            "host": self.client.host,
+            "port": self.client.port,
+            "status": self.status,
+            "bytes": self.bytes,
+            "time": self.time,
+            "speed": self.bytes / self.time if self.time > 0 else 0,
+            "error": self.error
+        }
+
+class SFTPReplicator:
+    def __init__(self, clients, quorum=None, buffer_size=DEFAULT_REPLICA_BUFFER, block_size=READ_BLOCK_SIZE,
+                 stall_timeout=DEFAULT_STALL_TIMEOUT, straggler_timeout=DEFAULT_STRAGGLER_TIMEOUT):
+        """
+        Upload files to several servers at once, reading each file once.
+        clients are connected SFTPClients, one per server. An upload succeeds when
+        quorum of them (all by default) have stored the whole file. Each replica
+        buffers up to buffer_size bytes of blocks that it hasn't written yet; once
+        quorum replicas are ready for the next block, the others wait for a replica
+        whose buffer is still full, up to stall_timeout seconds over the whole upload,
+        then it is dropped instead of holding them back. Once quorum replicas stored
+        the file, the rest get straggler_timeout seconds to finish before they are
+        dropped too, so a hung server can't block the upload.
+        """
+        self.clients = list(clients)
+        self.quorum = quorum or len(self.clients)
+        if not 1 <= self.quorum <= len(self.clients):
+            raise ValueError(f"Quorum must be between 1 and {len(self.clients)}")
+        self.block_size = block_size
+        self.max_blocks = max(1, buffer_size // block_size)
+        self.stall_timeout = stall_timeout
+        self.straggler_timeout = straggler_timeout
+        self._condition = threading.Condition()
+    
+    @classmethod
+    def connect(cls, hosts, username="sftp_user", password=None, private_key_path=None, **kwargs):
+        """Connect to each "host:port" (or (host, port) pair) and return a replicator for them."""
+        clients = []
+        try:
+            for host in hosts:
+                host, port = host.rsplit(":", 1) if isinstance(host, str) else host
+                client = SFTPClient(host, int(port), username, password, private_key_path)
+                if not client.connect():
+                    raise ConnectionError(f"Failed to connect to SFTP server {host}:{port}")
+                clients.append(client)
+        except Exception:
+            for client in clients:
+                client.disconnect()
+            raise
+        return cls(clients, **kwargs)
+    
+    def disconnect(self):
+        """Disconnect every client."""
+        for client in self.clients:
+            client.disconnect()
+    
+    def __enter__(self):
+        """Context manager entry."""
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit."""
+        self.disconnect()
+    
+    def _fail(self, replica, status, error):
+        """Mark a replica as failed or dropped (lock held)."""
+        if replica.active:
+            replica.status = status
+            replica.error = str(error)
+            replica.blocks.clear()
+            replica.buffered = 0
+            self._condition.notify_all()
+    
+    def _write(self, replica, remote_path, size):
+        """Write the blocks queued for a replica to a partial file, then move it into place."""
+        client = replica.client
+        partial_path = remote_path + PARTIAL_SUFFIX
+        start_time = time.time()
+        try:
+            if posixpath.dirname(remote_path):
+                client.ensure_directory(posixpath.dirname(remote_path))
+            with client.sftp.open(partial_path, 'wb', bufsize=0) as remote_file:
+                remote_file.set_pipelined(True)
+                while True:
+                    with self._condition:
+                        while replica.active and not replica.blocks:
+                            self._condition.wait()
+                        if not replica.active:
+                            break
+                        data = replica.blocks[0]
+                    if data is None:
+                        break
+                    for piece in client._blocks(memoryview(data), paramiko.SFTPFile.MAX_REQUEST_SIZE):
+                        remote_file.write(piece)
+                    with self._condition:
+                        if replica.blocks:
+                            replica.blocks.popleft()
+                            replica.buffered -= 1
+                        replica.bytes += len(data)
+                        self._condition.notify_all()
+            if replica.active:
+                written = client.sftp.stat(partial_path).st_size
+                if written != size:
+                    raise IOError(f"Size mismatch: sent {size} bytes, server has {written}")
+                client._invalidate(remote_path)
+                client._commit_remote(partial_path, remote_path)
+                client._update_sidecars(remote_path)
+                with self._condition:
+                    # Unless it was dropped as a straggler meanwhile
+                    if replica.active:
+                        replica.status = "ok"
+                    self._condition.notify_all()
+        except Exception as e:
+            with self._condition:
+                self._fail(replica, "failed", e)
+        finally:
+            replica.time = time.time() - start_time
+            if replica.status != "ok":
+                try:
+                    client.sftp.remove(partial_path)
+                except Exception:
+                    pass
+    
+    def upload_file(self, local_path, remote_path=None, callback=None):
+        """
+        Upload a local file to every server, returning the per-replica status, bytes,
+        speed and error, and the number of replicas that acknowledged it. When fewer
+        than quorum did, the result has an "error" and the copies that were completed
+        are left in place.
+        """
+        if not os.path.isfile(local_path):
+            raise FileNotFoundError(f"Local file not found: {local_path}")
+        remote_path = remote_path or os.path.basename(local_path)
+        size = os.path.getsize(local_path)
+        start_time = time.time()
+        replicas = [_Replica(client) for client in self.clients]
+        for replica in replicas:
+            replica.status = "writing"
+            replica.thread = threading.Thread(target=self._write, args=(replica, remote_path, size), daemon=True)
+            replica.thread.start()
+        
+        sent = 0
+        finished = False
+        try:
+            with open(local_path, 'rb') as local_file:
+                for data in iter(lambda: local_file.read(self.block_size), b""):
+                    if not self._enqueue(replicas, data):
+                        break
+                    sent += len(data)
+                    if callback:
+                        callback(sent, size)
+                else:
+                    finished = self._enqueue(replicas, None)  # End of file
+        finally:
+            if not finished:
+                # Quorum lost, or the local read or callback failed: stop the other writers
+                with self._condition:
+                    for replica in replicas:
+                        self._fail(replica, "failed", "Upload aborted")
+            self._settle(replicas)
+        
+        acknowledged = sum(1 for r in replicas if r.status == "ok")
+        elapsed_time = time.time() - start_time
+        result = {
+            "path": remote_path,
+            "size": size,
+            "quorum": self.quorum,
+            "acknowledged": acknowledged,
+            "replicas": [r.report() for r in replicas],
+            "time": elapsed_time,
+            "speed": size / elapsed_time if elapsed_time > 0 else 0
+        }
+        if acknowledged < self.quorum:
+            result["error"] = f"Only {acknowledged} of {len(replicas)} replicas stored the file, {self.quorum} required"
+        return result
+    
+    def _settle(self, replicas):
+        """
+        Wait for the replicas to finish writing, giving the ones still writing once quorum
+        acknowledged the file straggler_timeout seconds before dropping them. A dropped
+        writer stuck in a request is left to finish in the background.
+        """
+        with self._condition:
+            while (any(r.active for r in replicas) and
+                   sum(1 for r in replicas if r.status == "ok") < self.quorum):
+                self._condition.wait()
+            deadline = time.time() + self.straggler_timeout
+            while any(r.active for r in replicas) and time.time() < deadline:
+                self._condition.wait(deadline - time.time())
+            for replica in replicas:
+                self._fail(replica, "dropped", f"Still writing {self.straggler_timeout}s after quorum was reached")
+        for replica in replicas:
+            # Writers that are done only have their cleanup left
+            replica.thread.join(max(0.0, deadline - time.time()))
+    
+    def _enqueue(self, replicas, data):
+        """
+        Queue a block (None for the end of the file) for every active replica once
+        quorum of them have room for it. The ones that don't are waited for while they
+        have stall_timeout left, then dropped. Returns False when fewer than quorum
+        replicas are left.
+        """
+        with self._condition:
+            while True:
+                active = [r for r in replicas if r.active]
+                ready = [r for r in active if r.buffered < self.max_blocks]
+                if len(active) < self.quorum:
+                    return False
+                if len(ready) >= self.quorum:
+                    break
+                self._condition.wait()
+            
+            # A brief stall shouldn't cost a replica
+            while True:
+                lagging = [r for r in replicas
+                           if r.active and r.buffered >= self.max_blocks and r.stalled < self.stall_timeout]
+                if not lagging:
+                    break
+                start_time = time.time()
+                self._condition.wait(min(self.stall_timeout - r.stalled for r in lagging))
+                for replica in lagging:
+                    replica.stalled += time.time() - start_time
+            active = [r for r in replicas if r.active]
+            if len(active) < self.quorum:
+                return False
+            for replica in active:
+                if replica.buffered < self.max_blocks:
+                    replica.blocks.append(data)
+                    replica.buffered += 1
+                else:
+                    self._fail(replica, "dropped", f"Fell more than {self.max_blocks * self.block_size} bytes behind")
+            self._condition.notify_all()
+            return True
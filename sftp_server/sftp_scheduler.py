@@ -0,0 +1,261 @@
+import time
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+# SFTPClient methods taking a progress callback, through which transfers are throttled
+TRANSFER_METHODS = ("upload_file", "download_file", "upload_bytes", "upload_stream", "download_into")
+
+# Number of recent queue wait times kept for stats()
+WAIT_SAMPLES = 1000
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        """
+        Limit a byte rate to rate bytes per second, allowing bursts of up to burst
+        bytes (one second's worth by default). Safe to share between threads.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def consume(self, count):
+        """Take count tokens, sleeping as long as needed to stay under the rate."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Go into debt rather than waiting for the tokens in the lock, so the
+            # callers are delayed in arrival order
+            self._tokens -= count
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+class _Throttle:
+    """Progress callback consuming the bytes transferred from token buckets."""
+    
+    def __init__(self, buckets, callback=None):
+        self.buckets = buckets
+        self.callback = callback
+        self.throttled = 0.0
+        self._last = 0
+        self._lock = threading.Lock()
+    
+    def __call__(self, transferred, total):
+        with self._lock:
+            # Parallel streams report out of order
+            delta = max(0, transferred - self._last)
+            self._last = max(self._last, transferred)
+        throttled = sum(bucket.consume(delta) for bucket in self.buckets)
+        with self._lock:
+            self.throttled += throttled
+        if self.callback:
+            self.callback(transferred, total)
+    
+    def skip(self, count):
+        """Count bytes already transferred before a resume without consuming tokens for them."""
+        with self._lock:
+            self._last += count
+
+class _Task:
+    """A queued transfer."""
+    
+    def __init__(self, sequence, host, job, priority, method, args, kwargs):
+        self.sequence = sequence
+        self.host = host
+        self.job = job
+        self.priority = priority
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.submitted = time.time()
+
+class TransferScheduler:
+    def __init__(self, pools, max_concurrent=4, max_per_host=2, bandwidth_limit=None, metrics=None):
+        """
+        Run SFTPClient transfers from several jobs on shared connection pools.
+        pools is an SFTPConnectionPool or a dictionary of them by host name.
+        Queued transfers start by priority (higher values first); between jobs of
+        the same priority, the job with the fewest running transfers goes next, then
+        the one served least recently, so a job queuing many files doesn't hold back
+        one queuing a single file.
+        At most max_concurrent transfers run at once, and max_per_host per host.
+        bandwidth_limit caps the bytes per second of all transfers together, and
+        set_job_limit() caps a single job. metrics (an SFTPMetrics instance) records
+        queue wait times as the "scheduler.wait" operation.
+        """
+        if not isinstance(pools, dict):
+            pools = {f"{pools.host}:{pools.port}": pools}
+        self.pools = pools
+        self.max_concurrent = max_concurrent
+        self.max_per_host = max_per_host
+        self.metrics = metrics
+        self._global_bucket = TokenBucket(bandwidth_limit) if bandwidth_limit else None
+        self._job_buckets = {}
+        
+        self._queue = []
+        self._running = {}  # Running transfers by host and by job
+        self._last_started = {}  # Dispatch number of each job's latest transfer
+        self._dispatched = itertools.count()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "bytes": 0, "throttled_time": 0.0}
+        self._sequence = itertools.count()
+        self._closed = False
+        self._condition = threading.Condition()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(max_concurrent)]
+        for worker in self._workers:
+            worker.start()
+    
+    def __enter__(self):
+        """Context manager entry."""
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit."""
+        self.shutdown()
+    
+    def set_job_limit(self, job, bandwidth_limit):
+        """Cap the bytes per second of a job's transfers, or remove the cap if bandwidth_limit is None."""
+        with self._condition:
+            if bandwidth_limit:
+                self._job_buckets[job] = TokenBucket(bandwidth_limit)
+            else:
+                self._job_buckets.pop(job, None)
+    
+    def submit(self, method, *args, host=None, job="default", priority=0, **kwargs):
+        """
+        Queue an SFTPClient transfer method (see TRANSFER_METHODS) with its arguments
+        and return a Future for its result dictionary, which gains queued_time and
+        run_time in seconds. host is required when there are several pools.
+        """
+        if method not in TRANSFER_METHODS:
+            raise ValueError(f"Unsupported transfer method: {method}")
+        if host is None:
+            if len(self.pools) != 1:
+                raise ValueError("A host is required when scheduling on several pools")
+            host = next(iter(self.pools))
+        elif host not in self.pools:
+            raise ValueError(f"Unknown host: {host}")
+        
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Transfer scheduler is shut down")
+            task = _Task(next(self._sequence), host, job, priority, method, args, kwargs)
+            self._queue.append(task)
+            self._stats["submitted"] += 1
+            self._condition.notify()
+        return task.future
+    
+    def upload_file(self, local_path, remote_path=None, **kwargs):
+        """Queue an upload; see submit() for the scheduling options."""
+        return self.submit("upload_file", local_path, remote_path, **kwargs)
+    
+    def download_file(self, remote_path, local_path=None, **kwargs):
+        """Queue a download; see submit() for the scheduling options."""
+        return self.submit("download_file", remote_path, local_path, **kwargs)
+    
+    def _next_task(self):
+        """Pick the next task that can start, or None (lock held)."""
+        best = None
+        for task in self._queue:
+            if self._running.get(("host", task.host), 0) >= self.max_per_host:
+                continue
+            key = (-task.priority, self._running.get(("job", task.job), 0), self._last_started.get(task.job, -1),
+                   task.sequence)
+            if best is None or key < best[0]:
+                best = (key, task)
+        if best is None:
+            return None
+        task = best[1]
+        self._queue.remove(task)
+        self._last_started[task.job] = next(self._dispatched)
+        return task
+    
+    def _work(self):
+        while True:
+            with self._condition:
+                while True:
+                    task = self._next_task()
+                    if task is not None or (self._closed and not self._queue):
+                        break
+                    self._condition.wait()
+                if task is None:
+                    return
+                if not task.future.set_running_or_notify_cancel():
+                    self._stats["cancelled"] += 1
+                    continue
+                for key in (("host", task.host), ("job", task.job)):
+                    self._running[key] = self._running.get(key, 0) + 1
+                queued_time = time.time() - task.submitted
+                self._waits.append(queued_time)
+                buckets = [b for b in (self._job_buckets.get(task.job), self._global_bucket) if b]
+            
+            if self.metrics:
+                self.metrics.observe("scheduler.wait", queued_time)
+            try:
+                result = self._run(task, buckets)
+                result["queued_time"] = queued_time
+                task.future.set_result(result)
+            except Exception as e:
+                task.future.set_exception(e)
+            finally:
+                with self._condition:
+                    for key in (("host", task.host), ("job", task.job)):
+                        self._running[key] -= 1
+                    self._stats["failed" if task.future.exception() else "completed"] += 1
+                    self._condition.notify_all()
+    
+    def _run(self, task, buckets):
+        """Run a task on a pooled connection, throttled by the token buckets."""
+        kwargs = dict(task.kwargs)
+        throttle = None
+        if buckets:
+            throttle = kwargs["callback"] = _Throttle(buckets, kwargs.get("callback"))
+        start = time.time()
+        with self.pools[task.host].connection() as client:
+            result = getattr(client, task.method)(*task.args, **kwargs)
+        result["run_time"] = time.time() - start
+        with self._condition:
+            self._stats["bytes"] += result.get("size") or 0
+            if throttle:
+                self._stats["throttled_time"] += throttle.throttled
+        return result
+    
+    def stats(self):
+        """Get queue depth, running transfers, wait times and transfer counters."""
+        with self._condition:
+            depth = {}
+            for task in self._queue:
+                depth[task.priority] = depth.get(task.priority, 0) + 1
+            waits = sorted(self._waits)
+            running = {name: count for (kind, name), count in self._running.items() if kind == "host" and count}
+            return dict(
+                self._stats,
+                queue_depth=len(self._queue),
+                queue_depth_by_priority=depth,
+                running=sum(running.values()),
+                running_by_host=running,
+                wait_mean=sum(waits) / len(waits) if waits else 0,
+                wait_p95=waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0,
+                wait_max=waits[-1] if waits else 0,
+            )
+    
+    def shutdown(self, wait=True, cancel_pending=False):
+        """Stop accepting transfers, optionally cancelling the queued ones, and wait for the rest."""
+        with self._condition:
+            self._closed = True
+            if cancel_pending:
+                for task in self._queue:
+                    task.future.cancel()
+                    self._stats["cancelled"] += 1
+                self._queue = []
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
@@ -0,0 +1,292 @@
+import os
+import socket
+import logging
+import threading
+import paramiko
+from paramiko import SFTPServer, SFTPServerInterface, SFTPAttributes, SFTPHandle, SFTP_OK, SFTP_FAILURE
+from paramiko.sftp import CMD_EXTENDED
+
+# Client disconnects are routine here, keep paramiko's server-side errors off stderr
+logging.getLogger("sftp_test_server").addHandler(logging.NullHandler())
+
+def _errno_status(e):
+    """Convert an OSError to an SFTP status code."""
+    return SFTPServer.convert_errno(e.errno)
+
+def _set_file_attr(path, attr):
+    """Apply SFTP attributes to a local file, truncating without clearing it first as paramiko's helper does."""
+    if attr._flags & attr.FLAG_SIZE:
+        os.truncate(path, attr.st_size)
+        attr._flags &= ~attr.FLAG_SIZE
+    SFTPServer.set_file_attr(path, attr)
+
+class _StubServer(paramiko.ServerInterface):
+    """SSH server policy: accept the configured user with any key, or with the configured password."""
+    
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+    
+    def check_auth_password(self, username, password):
+        if username == self.username and (self.password is None or password == self.password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+    
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL if username == self.username else paramiko.AUTH_FAILED
+    
+    def get_allowed_auths(self, username):
+        return "password,publickey"
+    
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+class _StubHandle(SFTPHandle):
+    """Open file on the local filesystem."""
+    
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return _errno_status(e)
+    
+    def chattr(self, attr):
+        try:
+            _set_file_attr(self.filename, attr)
+            return SFTP_OK
+        except OSError as e:
+            return _errno_status(e)
+
+class _StubSFTPServer(SFTPServerInterface):
+    """SFTP subsystem that serves a local directory, chrooted like the Docker server."""
+    
+    # Set per server through a subclass, see LocalSFTPServer.start()
+    root = None
+    
+    def _local_path(self, path):
+        return self.root + self.canonicalize(path)
+    
+    def canonicalize(self, path):
+        return os.path.normpath(path if path.startswith('/') else '/' + path)
+    
+    def list_folder(self, path):
+        local_path = self._local_path(path)
+        try:
+            entries = []
+            for name in os.listdir(local_path):
+                attr = SFTPAttributes.from_stat(os.lstat(os.path.join(local_path, name)))
+                attr.filename = name
+                entries.append(attr)
+            return entries
+        except OSError as e:
+            return _errno_status(e)
+    
+    def stat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.stat(self._local_path(path)))
+        except OSError as e:
+            return _errno_status(e)
+    
+    def lstat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.lstat(self._local_path(path)))
+        except OSError as e:
+            return _errno_status(e)
+    
+    def open(self, path, flags, attr):
+        local_path = self._local_path(path)
+        try:
+            fd = os.open(local_path, flags | getattr(os, 'O_BINARY', 0), 0o644)
+        except OSError as e:
+            return _errno_status(e)
+        if (flags & os.O_CREAT) and attr is not None:
+            attr._flags &= ~attr.FLAG_PERMISSIONS
+            SFTPServer.set_file_attr(local_path, attr)
+        
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = _StubHandle(flags)
+        handle.filename = local_path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+    
+    def _call(self, func, *args):
+        try:
+            func(*args)
+            return SFTP_OK
+        except OSError as e:
+            return _errno_status(e)
+    
+    def remove(self, path):
+        return self._call(os.remove, self._local_path(path))
+    
+    def rename(self, oldpath, newpath):
+        new_local_path = self._local_path(newpath)
+        if os.path.exists(new_local_path):
+            # SFTP rename doesn't overwrite, posix-rename does
+            return SFTP_FAILURE
+        return self._call(os.rename, self._local_path(oldpath), new_local_path)
+    
+    def posix_rename(self, oldpath, newpath):
+        return self._call(os.replace, self._local_path(oldpath), self._local_path(newpath))
+    
+    def mkdir(self, path, attr):
+        return self._call(os.mkdir, self._local_path(path))
+    
+    def rmdir(self, path):
+        return self._call(os.rmdir, self._local_path(path))
+    
+    def chattr(self, path, attr):
+        return self._call(_set_file_attr, self._local_path(path), attr)
+    
+    def hardlink(self, oldpath, newpath):
+        return self._call(os.link, self._local_path(oldpath), self._local_path(newpath))
+    
+    def symlink(self, target_path, path):
+        return self._call(os.symlink, target_path, self._local_path(path))
+    
+    def readlink(self, path):
+        try:
+            return os.readlink(self._local_path(path))
+        except OSError as e:
+            return _errno_status(e)
+
+class _ExtendedSFTPServer(SFTPServer):
+    """SFTP subsystem with OpenSSH's hardlink@openssh.com and copy-data extensions."""
+    
+    def _process(self, t, request_number, msg):
+        if t == CMD_EXTENDED:
+            start = msg.packet.tell()
+            tag = msg.get_text()
+            if tag == "hardlink@openssh.com":
+                oldpath = msg.get_text()
+                newpath = msg.get_text()
+                self._send_status(request_number, self.server.hardlink(oldpath, newpath))
+                return
+            if tag == "copy-data":
+                self._send_status(request_number, self._copy_data(msg))
+                return
+            msg.packet.seek(start)
+        super()._process(t, request_number, msg)
+    
+    def _copy_data(self, msg):
+        """Copy length bytes (to the end if 0) between two open handles."""
+        read_handle = msg.get_binary()
+        read_offset = msg.get_int64()
+        length = msg.get_int64()
+        write_handle = msg.get_binary()
+        write_offset = msg.get_int64()
+        if read_handle not in self.file_table or write_handle not in self.file_table:
+            return SFTP_FAILURE
+        source = self.file_table[read_handle].readfile
+        target = self.file_table[write_handle].writefile
+        try:
+            source.seek(read_offset)
+            target.seek(write_offset)
+            remaining = length or None
+            while remaining is None or remaining > 0:
+                data = source.read(1024 * 1024 if remaining is None else min(remaining, 1024 * 1024))
+                if not data:
+                    break
+                target.write(data)
+                if remaining is not None:
+                    remaining -= len(data)
+            target.flush()
+            return SFTP_OK
+        except OSError as e:
+            return _errno_status(e)
+
+class LocalSFTPServer:
+    def __init__(self, root, host="127.0.0.1", port=0, username="sftp_user", password=None):
+        """
+        In-process paramiko SFTP server serving a local directory on loopback.
+        It stands in for the Docker server in tests and benchmarks: port 0 picks a free
+        port, any key is accepted for username, and so is any password unless one is given.
+        Like OpenSSH, it supports the posix-rename, hardlink and copy-data extensions.
+        """
+        self.root = os.path.abspath(root)
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self._socket = None
+        self._thread = None
+        self._transports = []
+        self._lock = threading.Lock()
+    
+    def __enter__(self):
+        """Context manager entry."""
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit."""
+        self.stop()
+    
+    def start(self):
+        """Start accepting connections in a background thread."""
+        os.makedirs(self.root, exist_ok=True)
+        self._handler = type("RootedSFTPServer", (_StubSFTPServer,), {"root": self.root})
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen(64)
+        self.port = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+    
+    def _serve(self):
+        """Accept connections until stop() closes the listening socket."""
+        listener = self._socket
+        while True:
+            try:
+                sock, _ = listener.accept()
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                break
+            # Negotiate in a separate thread so a slow client doesn't block the others
+            threading.Thread(target=self._start_transport, args=(sock,), daemon=True).start()
+    
+    def _start_transport(self, sock):
+        """Run the SSH handshake for an accepted connection."""
+        transport = paramiko.Transport(sock)
+        transport.set_log_channel("sftp_test_server.transport")
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler("sftp", _ExtendedSFTPServer, self._handler)
+        try:
+            transport.start_server(server=_StubServer(self.username, self.password))
+        except (paramiko.SSHException, EOFError, OSError):
+            transport.close()
+            return
+        with self._lock:
+            self._transports = [t for t in self._transports if t.is_active()] + [transport]
+    
+    def drop_connections(self):
+        """Abruptly close every client connection, as a network failure would."""
+        with self._lock:
+            transports, self._transports = self._transports, []
+        for transport in transports:
+            transport.close()
+    
+    def stop(self):
+        """Stop accepting connections and close the open ones."""
+        if self._socket is not None:
+            try:
+                # Closing alone doesn't wake up a thread blocked in accept()
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._socket.close()
+            self._socket = None
+        self.drop_connections()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
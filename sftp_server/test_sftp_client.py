@@ -1,9 +1,27 @@
 import json
 import time
+import asyncio
 import random
+import io
+import mmap
+import shutil
+import tempfile
+import threading
 import unittest
 import os
-from sftp_client import SFTPClient
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from sftp_client import (SFTPClient, TRANSPORT_PROFILES, file_digest, files_match, load_profiles, resolve_profile,
+                         MetadataCache, _Progress, zstandard, lz4_frame)
+from sftp_pool import SFTPConnectionPool
+from async_sftp_client import AsyncSFTPClient
+from sftp_metrics import SFTPMetrics
+from sftp_test_server import LocalSFTPServer
+from sftp_daemon import SFTPDaemon, DaemonClient
+from sftp_scheduler import TransferScheduler, TokenBucket, _Throttle
+from sftp_dedup import DedupStore
+from sftp_replication import SFTPReplicator
+from sftp_benchmark import PRESETS, run_benchmarks, compare, percentile, calibrate
 
 class TestSFTPClient(unittest.TestCase):
     
@@ -18,12 +36,17 @@ class TestSFTPClient(unittest.TestCase):
         cls.create_test_file("test_files/medium_file.bin", 1024 * 1024)  # 1MB
         cls.create_test_file("test_files/large_file.bin", 10 * 1024 * 1024)  # 10MB
         
-        # Connect to SFTP server
-        password = os.environ.get('SFTP_PASSWORD')
-        if not password:
-            raise ValueError("SFTP_PASSWORD environment variable must be set to run tests")
+        # Connect to SFTP server, or to an in-process stand-in when no password is set
+        cls.server = None
+        cls.host, cls.port = "localhost", 2222
+        cls.password = os.environ.get('SFTP_PASSWORD')
+        if not cls.password:
+            cls.server = LocalSFTPServer(tempfile.mkdtemp(prefix="sftp_test_root_")).start()
+            cls.host, cls.port, cls.password = cls.server.host, cls.server.port, "test"
             
-        cls.client = SFTPClient(password=password)
+        # Keep resumable upload checkpoints out of the home directory
+        cls.checkpoint_dir = tempfile.mkdtemp(prefix="sftp_checkpoints_")
+        cls.client = SFTPClient(cls.host, cls.port, password=cls.password, checkpoint_dir=cls.checkpoint_dir)
         cls.client.connect()
         
     @classmethod
@@ -41,12 +64,22 @@ class TestSFTPClient(unittest.TestCase):
             pass
         
         # Clean up local files
-        for file in ["downloaded_small.txt", "downloaded_medium.bin", "downloaded_large.bin"]:
+        shutil.rmtree("test_files/sync_src", ignore_errors=True)
+        shutil.rmtree("test_files/sync_dst", ignore_errors=True)
+        shutil.rmtree(cls.checkpoint_dir, ignore_errors=True)
+        for file in ["downloaded_small.txt", "downloaded_medium.bin", "downloaded_large.bin",
+                     "downloaded_parallel.bin", "downloaded_ranges.bin", "downloaded_cancelled.bin",
+                     "downloaded_resumed.bin", "downloaded_verified.bin", "downloaded_metrics.bin",
+                     "downloaded_text.txt", "downloaded_daemon.bin", "downloaded_scheduled.bin",
+                     "downloaded_dedup.bin", "downloaded_delta.bin", "downloaded_retry.bin"]:
             if os.path.exists(file):
                 os.remove(file)
         
         # Disconnect from SFTP server
         cls.client.disconnect()
+        if cls.server:
+            cls.server.stop()
+            shutil.rmtree(cls.server.root, ignore_errors=True)
     
     @staticmethod
     def create_test_file(filename, size):
@@ -159,6 +192,883 @@ class TestSFTPClient(unittest.TestCase):
         result = self.client.remove_directory("test_directory", recursive=True)
         self.assertTrue(result["removed"])
         self.assertFalse(self.client.file_exists("test_directory"))
+    
+    def test_12_parallel_upload(self):
+        """Test uploading a file over several parallel channels."""
+        result = self.client.upload_file("test_files/large_file.bin", "test_directory/parallel_file.bin",
+                                         streams=4, chunk_size=1024 * 1024)
+        self.assertEqual(result["size"], 10 * 1024 * 1024)
+        self.assertEqual(len(result["streams"]), 4)
+        self.assertEqual(sum(s["bytes"] for s in result["streams"]), 10 * 1024 * 1024)
+        
+        self.client.download_file("test_directory/parallel_file.bin", "downloaded_parallel.bin")
+        with open("test_files/large_file.bin", "rb") as f1, open("downloaded_parallel.bin", "rb") as f2:
+            self.assertEqual(f1.read(), f2.read())
+        print(f"Parallel upload speed: {result['speed'] / 1024 / 1024:.2f} MB/s")
+    
+    def test_13_parallel_download(self):
+        """Test downloading disjoint ranges over several parallel channels."""
+        result = self.client.download_file("test_directory/parallel_file.bin", "downloaded_ranges.bin",
+                                           streams=3, chunk_size=1024 * 1024, queue_depth=16)
+        self.assertEqual(result["size"], 10 * 1024 * 1024)
+        self.assertEqual(len(result["streams"]), 3)
+        self.assertEqual(result["queue_depth"], 16)
+        
+        with open("test_files/large_file.bin", "rb") as f1, open("downloaded_ranges.bin", "rb") as f2:
+            self.assertEqual(f1.read(), f2.read())
+        print(f"Parallel download speed: {result['speed'] / 1024 / 1024:.2f} MB/s")
+    
+    def test_14_connection_pool(self):
+        """Test sharing pooled connections between threads."""
+        with SFTPConnectionPool(host=self.host, port=self.port, password=self.password, max_size=2) as pool:
+            with ThreadPoolExecutor(max_workers=6) as executor:
+                results = list(executor.map(
+                    lambda i: pool.upload_file("test_files/small_file.txt", f"test_directory/pooled_{i}.txt"),
+                    range(6)))
+            self.assertEqual([r["size"] for r in results], [1024] * 6)
+            self.assertTrue(pool.file_exists("test_directory/pooled_5.txt"))
+            
+            stats = pool.stats()
+            self.assertLessEqual(stats["created"], 2)
+            self.assertEqual(stats["created"] + stats["reused"], 7)
+            print(json.dumps(stats, indent=2))
+            
+            # Errors returned by the server keep the connection in the pool
+            for error in (EOFError(), OSError("Failure")):
+                with self.assertRaises(type(error)):
+                    with pool.connection() as client:
+                        raise error
+                with pool.connection() as reused:
+                    self.assertIs(reused, client)
+            self.assertEqual(pool.stats()["size"], stats["size"])
+        
+        # Idle connections are disconnected without holding the pool's lock
+        with SFTPConnectionPool(host=self.host, port=self.port, password=self.password, idle_timeout=0) as pool:
+            idle = pool.acquire()
+            pool.release(idle)
+            disconnect = idle.disconnect
+            def checked_disconnect():
+                checker = threading.Thread(target=pool.stats)
+                checker.start()
+                checker.join(5)
+                self.assertFalse(checker.is_alive())
+                disconnect()
+            idle.disconnect = checked_disconnect
+            client = pool.acquire()
+            self.assertIsNot(client, idle)
+            self.assertEqual(pool.stats()["evicted"], 1)
+            self.assertIsNone(idle.transport)
+            
+            # A connection released after the pool was closed is closed too
+            pool.close()
+            pool.release(client)
+            self.assertIsNone(client.transport)
+            self.assertEqual(pool.stats()["size"], 0)
+    
+    def test_15_async_client(self):
+        """Test concurrent and cancelled operations through the asyncio client."""
+        async def run():
+            async with AsyncSFTPClient(host=self.host, port=self.port, password=self.password, max_connections=3) as client:
+                uploads = [client.upload_file("test_files/small_file.txt", f"test_directory/async_{i}.txt")
+                           for i in range(20)]
+                results = await asyncio.gather(*uploads)
+                self.assertEqual(len(results), 20)
+                files = await client.list_directory("test_directory")
+                self.assertEqual(len([f for f in files if f["name"].startswith("async_")]), 20)
+                self.assertLessEqual(client.pool.stats()["created"], 3)
+                
+                # Cancel a download once it has started moving data
+                started = asyncio.Event()
+                loop = asyncio.get_running_loop()
+                task = asyncio.create_task(client.download_file(
+                    "test_directory/parallel_file.bin", "downloaded_cancelled.bin", queue_depth=1,
+                    callback=lambda done, total: loop.call_soon_threadsafe(started.set)))
+                await started.wait()
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                self.assertTrue(await client.file_exists("test_directory/async_0.txt"))
+        
+        asyncio.run(run())
+    
+    def test_16_sync_directory(self):
+        """Test mirroring a directory tree in both directions."""
+        os.makedirs("test_files/sync_src/sub", exist_ok=True)
+        self.create_test_file("test_files/sync_src/a.bin", 2048)
+        self.create_test_file("test_files/sync_src/sub/b.bin", 4096)
+        
+        result = self.client.sync_up("test_files/sync_src", "test_directory/sync")
+        self.assertEqual(result["transferred"], ["a.bin", os.path.join("sub", "b.bin")])
+        
+        # Nothing changed, nothing to transfer
+        result = self.client.sync_up("test_files/sync_src", "test_directory/sync")
+        self.assertEqual(result["transferred"], [])
+        self.assertEqual(result["unchanged"], 2)
+        
+        self.create_test_file("test_files/sync_src/a.bin", 3000)
+        os.remove("test_files/sync_src/sub/b.bin")
+        result = self.client.sync_up("test_files/sync_src", "test_directory/sync", delete=True, dry_run=True)
+        self.assertEqual(result["transferred"], ["a.bin"])
+        self.assertEqual(result["deleted"], [os.path.join("sub", "b.bin")])
+        self.assertTrue(self.client.file_exists("test_directory/sync/sub/b.bin"))
+        
+        self.client.sync_up("test_files/sync_src", "test_directory/sync", delete=True)
+        self.assertFalse(self.client.file_exists("test_directory/sync/sub/b.bin"))
+        
+        result = self.client.sync_down("test_directory/sync", "test_files/sync_dst")
+        self.assertEqual(result["transferred"], ["a.bin"])
+        with open("test_files/sync_src/a.bin", "rb") as f1, open("test_files/sync_dst/a.bin", "rb") as f2:
+            self.assertEqual(f1.read(), f2.read())
+        self.assertEqual(self.client.sync_down("test_directory/sync", "test_files/sync_dst")["transferred"], [])
+    
+    def test_17_metadata_cache(self):
+        """Test that the metadata cache saves stats and is invalidated by the client's own changes."""
+        with SFTPClient(host=self.host, port=self.port, password=self.password, cache_ttl=60) as client:
+            for i in range(10):
+                client.upload_file("test_files/small_file.txt", f"test_directory/cached/a/b/file_{i}.txt")
+            self.assertTrue(client.cache.is_known_directory("test_directory/cached/a/b"))
+            self.assertTrue(client.file_exists("test_directory/cached/a/b/file_0.txt"))
+            self.assertGreater(client.cache.stats()["hits"], 0)
+            
+            client.remove_file("test_directory/cached/a/b/file_0.txt")
+            self.assertFalse(client.file_exists("test_directory/cached/a/b/file_0.txt"))
+            
+            # Changes made by another client are only seen when bypassing the cache
+            self.client.remove_file("test_directory/cached/a/b/file_1.txt")
+            self.assertTrue(client.file_exists("test_directory/cached/a/b/file_1.txt"))
+            self.assertFalse(client.file_exists("test_directory/cached/a/b/file_1.txt", use_cache=False))
+            self.assertFalse(client.file_exists("test_directory/cached/a/b/file_1.txt"))
+            
+            client.remove_directory("test_directory/cached", recursive=True)
+            self.assertFalse(client.cache.is_known_directory("test_directory/cached/a/b"))
+            self.assertFalse(client.file_exists("test_directory/cached/a/b/file_2.txt"))
+            
+            # A directory removed by another client is recreated when the upload fails with ENOENT
+            client.upload_file("test_files/small_file.txt", "test_directory/cached/c/file.txt")
+            self.client.remove_directory("test_directory/cached/c", recursive=True)
+            self.assertTrue(client.cache.is_known_directory("test_directory/cached/c"))
+            client.upload_file("test_files/small_file.txt", "test_directory/cached/c/file.txt")
+            self.assertTrue(self.client.file_exists("test_directory/cached/c/file.txt"))
+            client.upload_bytes(b"data", "test_directory/cached/c/file.txt")
+            self.client.remove_directory("test_directory/cached/c", recursive=True)
+            client.upload_bytes(b"data", "test_directory/cached/c/file.txt")
+            self.assertTrue(self.client.file_exists("test_directory/cached/c/file.txt"))
+            client.remove_directory("test_directory/cached", recursive=True)
+        
+        # Known directories expire and are evicted like the stat entries
+        cache = MetadataCache(ttl=0.2, max_entries=2)
+        for name in ("a", "b", "c"):
+            cache.add_directory(name)
+        self.assertFalse(cache.is_known_directory("a"))
+        self.assertTrue(cache.is_known_directory("c"))
+        time.sleep(0.3)
+        self.assertFalse(cache.is_known_directory("c"))
+        self.assertEqual(cache.stats()["known_directories"], 1)
+    
+    def test_18_upload_many(self):
+        """Test uploading a batch of small files into several new directories."""
+        pairs = [("test_files/small_file.txt", f"test_directory/batch/dir_{i % 4}/file_{i}.txt") for i in range(40)]
+        pairs.append(("test_files/missing.txt", "test_directory/batch/missing.txt"))
+        result = self.client.upload_many(pairs, concurrency=4)
+        self.assertEqual(result["count"], 40)
+        self.assertEqual(result["failed"], 1)
+        self.assertFalse(result["files"][-1]["uploaded"])
+        self.assertEqual(result["size"], 40 * 1024)
+        self.assertTrue(self.client.file_exists("test_directory/batch/dir_3/file_39.txt"))
+        print(f"Batch upload rate: {result['files_per_sec']:.1f} files/s")
+    
+    def test_19_walk_and_parallel_remove(self):
+        """Test walking a tree concurrently and removing it in parallel."""
+        pairs = [("test_files/small_file.txt", f"test_directory/tree/d{i % 3}/e{i % 2}/file_{i}.txt")
+                 for i in range(30)]
+        self.client.upload_many(pairs)
+        
+        entries = list(self.client.walk("test_directory/tree", workers=3))
+        paths = {path for path, _ in entries}
+        self.assertEqual(len(entries), 30 + 3 + 6)
+        self.assertIn("test_directory/tree/d2/e1/file_5.txt", paths)
+        
+        removed = []
+        result = self.client.remove_directory("test_directory/tree", recursive=True, workers=3,
+                                              progress=lambda path, count: removed.append(path))
+        self.assertTrue(result["removed"])
+        self.assertEqual(result["files_removed"], 30)
+        self.assertEqual(result["directories_removed"], 10)
+        self.assertEqual(len(removed), 40)
+        self.assertFalse(self.client.file_exists("test_directory/tree"))
+        
+        result = self.client.remove_directory("test_directory/tree", recursive=True)
+        self.assertFalse(result["removed"])
+        self.assertTrue(result["failed"])
+    
+    def test_20_iter_directory(self):
+        """Test streaming a directory listing with selected fields."""
+        self.client.upload_many([("test_files/small_file.txt", f"test_directory/listing/file_{i}.txt")
+                                 for i in range(120)])
+        
+        entries = list(self.client.iter_directory("test_directory/listing", read_aheads=4))
+        self.assertEqual(len(entries), 120)
+        self.assertEqual(set(entries[0]), {"name", "path", "size", "is_directory", "modified", "accessed"})
+        
+        compact = list(self.client.iter_directory("test_directory/listing", fields=["name", "size", "modified"],
+                                                  raw_times=True, compact=True))
+        self.assertIn(("file_7.txt", 1024), [entry[:2] for entry in compact])
+        self.assertIsInstance(compact[0][2], int)
+        
+        # Stopping early leaves the main channel usable
+        first = next(iter(self.client.iter_directory("test_directory/listing")))
+        self.assertTrue(self.client.file_exists(first["path"]))
+        with self.assertRaises(ValueError):
+            list(self.client.iter_directory("test_directory/listing", fields=["owner"]))
+    
+    def test_21_resumable_transfers(self):
+        """Test resuming interrupted uploads and downloads from their checkpoints."""
+        def interrupt_after(limit):
+            def callback(transferred, total):
+                if transferred >= limit:
+                    raise ConnectionError("Simulated connection drop")
+            return callback
+        
+        with self.assertRaises(ConnectionError):
+            self.client.upload_file("test_files/large_file.bin", "test_directory/resumed.bin", resume=True,
+                                    callback=interrupt_after(4 * 1024 * 1024))
+        self.assertFalse(self.client.file_exists("test_directory/resumed.bin"))
+        # The checkpoint is kept out of the source tree
+        checkpoint_path = self.client._upload_checkpoint_path("test_files/large_file.bin", "test_directory/resumed.bin")
+        self.assertTrue(os.path.exists(checkpoint_path))
+        self.assertFalse(os.path.exists("test_files/large_file.bin.sftp-checkpoint"))
+        
+        result = self.client.upload_file("test_files/large_file.bin", "test_directory/resumed.bin", resume=True)
+        self.assertGreaterEqual(result["resumed_from"], 4 * 1024 * 1024)
+        self.assertEqual(result["transferred"], result["size"] - result["resumed_from"])
+        self.assertFalse(self.client.file_exists("test_directory/resumed.bin.part"))
+        self.assertFalse(os.path.exists(checkpoint_path))
+        
+        with self.assertRaises(ConnectionError):
+            self.client.download_file("test_directory/resumed.bin", "downloaded_resumed.bin", resume=True,
+                                      callback=interrupt_after(3 * 1024 * 1024))
+        self.assertTrue(os.path.exists("downloaded_resumed.bin.part"))
+        
+        result = self.client.download_file("test_directory/resumed.bin", "downloaded_resumed.bin", resume=True)
+        self.assertGreaterEqual(result["resumed_from"], 3 * 1024 * 1024)
+        self.assertFalse(os.path.exists("downloaded_resumed.bin.part"))
+        with open("test_files/large_file.bin", "rb") as f1, open("downloaded_resumed.bin", "rb") as f2:
+            self.assertEqual(f1.read(), f2.read())
+    
+    def test_22_verified_transfers(self):
+        """Test hashing transfers in the same pass and checking the remote checksum file."""
+        expected = file_digest("test_files/medium_file.bin", "sha256")
+        result = self.client.upload_file("test_files/medium_file.bin", "test_directory/verified.bin", verify="sha256")
+        self.assertEqual(result["digest"], expected)
+        self.assertTrue(self.client.file_exists("test_directory/verified.bin.sha256"))
+        
+        result = self.client.download_file("test_directory/verified.bin", "downloaded_verified.bin", verify="sha256")
+        self.assertEqual(result["digest"], expected)
+        self.assertTrue(result["verified"])
+        
+        result = self.client.download_file("test_directory/verified.bin", "downloaded_verified.bin", streams=3,
+                                           chunk_size=256 * 1024, verify="sha256")
+        self.assertTrue(result["verified"])
+        
+        # A file without a checksum file can't be verified, only hashed
+        result = self.client.download_file("test_directory/parallel_file.bin", "downloaded_verified.bin",
+                                           verify="blake2b")
+        self.assertIsNone(result["verified"])
+        self.assertEqual(result["digest"], file_digest("test_files/large_file.bin", "blake2b"))
+        
+        # A corrupted remote file fails verification
+        with self.client.sftp.open("test_directory/verified.bin", 'r+b') as f:
+            f.seek(1000)
+            f.write(b"corrupted")
+        with self.assertRaises(IOError):
+            self.client.download_file("test_directory/verified.bin", "downloaded_verified.bin", verify="sha256")
+        
+        # Verified uploads remove the checksum files earlier ones wrote for other algorithms
+        self.client.upload_file("test_files/medium_file.bin", "test_directory/verified.bin", verify="blake2b")
+        self.assertFalse(self.client.file_exists("test_directory/verified.bin.sha256"))
+        
+        # Plain uploads only do with clean_sidecars, and otherwise don't look for any sidecar
+        metrics = SFTPMetrics()
+        with SFTPClient(self.host, self.port, password=self.password, metrics=metrics) as client:
+            client.upload_file("test_files/small_file.txt", "test_directory/verified.bin")
+        self.assertNotIn("opendir", metrics.snapshot()["requests"])
+        self.assertEqual(metrics.snapshot()["requests"]["open"], 1)
+        self.assertTrue(self.client.file_exists("test_directory/verified.bin.blake2b"))
+        with SFTPClient(self.host, self.port, password=self.password, clean_sidecars=True) as client:
+            client.upload_file("test_files/small_file.txt", "test_directory/verified.bin")
+        self.assertFalse(self.client.file_exists("test_directory/verified.bin.blake2b"))
+        result = self.client.download_file("test_directory/verified.bin", "downloaded_verified.bin", verify="blake2b")
+        self.assertIsNone(result["verified"])
+        
+        # A user's own checksum files are left alone
+        self.client.upload_bytes(b"user notes\n", "test_directory/notes.sha256")
+        self.client.upload_file("test_files/small_file.txt", "test_directory/notes")
+        self.client.remove_file("test_directory/notes")
+        self.assertTrue(self.client.file_exists("test_directory/notes.sha256"))
+    
+    def test_23_benchmark(self):
+        """Test the benchmark suite's statistics and baseline comparison."""
+        self.assertEqual(percentile([4, 1, 3, 2], 0.5), 2.5)
+        self.assertAlmostEqual(percentile([1, 2, 3, 4, 5], 0.99), 4.96)
+        
+        config = dict(PRESETS["quick"], repeat=2)
+        report = run_benchmarks(self.client, config, ["single_file", "small_files"], verbose=False)
+        self.assertIn("upload/1MB", report["results"])
+        summary = report["results"]["upload_many/50x4096"]
+        self.assertEqual(summary["runs"], 2)
+        self.assertLessEqual(summary["median"], summary["p95"])
+        self.assertLessEqual(summary["p95"], summary["p99"])
+        self.assertFalse(self.client.file_exists("sftp_benchmark"))
+        
+        self.assertFalse(any(c["regression"] for c in compare(report, report)))
+        faster = {"results": {name: dict(r, median=r["median"] / 2) for name, r in report["results"].items()}}
+        comparison = compare(report, faster, threshold=0.5)
+        self.assertEqual(len(comparison), len(report["results"]))
+        self.assertTrue(all(c["regression"] for c in comparison))
+        print(json.dumps(report["results"]["upload/1MB"], indent=2))
+    
+    def test_24_metrics(self):
+        """Test per-operation latency, request and byte instrumentation."""
+        metrics = SFTPMetrics()
+        events = []
+        metrics.add_hook(lambda kind, name, value: events.append((kind, name)))
+        with SFTPClient(self.host, self.port, password=self.password, metrics=metrics) as client:
+            client.upload_file("test_files/medium_file.bin", "test_directory/metrics.bin", write_checksum=False)
+            client.download_file("test_directory/metrics.bin", "downloaded_metrics.bin", streams=2,
+                                 chunk_size=256 * 1024)
+            self.assertFalse(client.file_exists("test_directory/missing.bin"))
+            self.assertFalse(client.remove_file("test_directory/missing.bin")["removed"])
+            with self.assertRaises(FileNotFoundError):
+                client.download_file("test_directory/missing.bin", "downloaded_metrics.bin")
+            self.assertEqual(len(list(client.iter_directory("test_directory"))), len(client.list_directory("test_directory")))
+        
+        snapshot = metrics.snapshot()
+        operations = snapshot["operations"]
+        for operation in ["connect", "connect.handshake", "connect.auth", "upload_file", "iter_directory",
+                          "list_directory"]:
+            self.assertEqual(operations[operation]["count"], 1)
+        self.assertEqual(operations["upload_file"]["bytes"], 1024 * 1024)
+        self.assertEqual(operations["download_file"]["errors"], 1)
+        self.assertEqual(snapshot["errors"]["download_file"], {"FileNotFoundError": 1})
+        self.assertEqual(snapshot["errors"]["remove_file"], {"failed": 1})
+        self.assertEqual(snapshot["bytes"], {"sent": 1024 * 1024, "received": 1024 * 1024})
+        self.assertGreaterEqual(snapshot["requests"]["write"], 32)
+        self.assertGreaterEqual(snapshot["requests"]["read"], 32)
+        self.assertEqual(snapshot["requests_total"], sum(snapshot["requests"].values()))
+        self.assertIn(("latency", "upload_file"), events)
+        
+        text = metrics.to_prometheus()
+        self.assertIn('sftp_client_operation_duration_seconds_count{operation="upload_file"} 1', text)
+        self.assertIn('sftp_client_payload_bytes_total{direction="sent"} 1048576', text)
+        self.assertIn('sftp_client_errors_total{operation="download_file",error="FileNotFoundError"} 1', text)
+        self.assertIn('sftp_client_operation_bytes_total{operation="upload_file"} 1048576', text)
+        print(json.dumps(snapshot["requests"], indent=2))
+    
+    def test_25_transport_profiles(self):
+        """Test connecting with tuning profiles and calibrating the fastest one."""
+        for name in TRANSPORT_PROFILES:
+            with SFTPClient(self.host, self.port, password=self.password, profile=name) as client:
+                self.assertEqual(client.upload_file("test_files/medium_file.bin", "test_directory/profile.bin")["size"],
+                                 1024 * 1024)
+        
+        with SFTPClient(self.host, self.port, password=self.password, profile="wan") as client:
+            channel = client.sftp.get_channel()
+            self.assertEqual(channel.in_window_size, TRANSPORT_PROFILES["wan"]["window_size"])
+            self.assertEqual(client.transport.packetizer.REKEY_BYTES, 2 ** 32)
+            # Ciphers are reordered, never restricted to ones the transport lacks
+            self.assertIn(client.transport.remote_cipher, client.transport.get_security_options().ciphers)
+        with self.assertRaises(ValueError):
+            SFTPClient(self.host, self.port, profile="fastest")
+        
+        store = os.path.join("test_files", "profiles.json")
+        candidates = {"default": TRANSPORT_PROFILES["default"], "lan": TRANSPORT_PROFILES["lan"]}
+        results = calibrate(self.host, self.port, password=self.password, size=256 * 1024, repeat=1,
+                            candidates=candidates, store=store, verbose=False)
+        self.assertEqual(sorted(r["name"] for r in results), ["default", "lan"])
+        self.assertLessEqual(results[0]["median"], results[1]["median"])
+        saved = load_profiles(store)[f"{self.host}:{self.port}"]
+        self.assertEqual(resolve_profile("auto", self.host, self.port, store), saved)
+        self.assertEqual(resolve_profile("auto", "elsewhere", 22, store), {})
+    
+    def test_26_memory_transfers(self):
+        """Test uploading from and downloading into buffers, mmaps and streams."""
+        with open("test_files/medium_file.bin", 'rb') as f:
+            data = f.read()
+        
+        result = self.client.upload_bytes(data, "test_directory/memory/bytes.bin", verify="sha256")
+        self.assertEqual(result["size"], len(data))
+        self.assertEqual(result["digest"], file_digest("test_files/medium_file.bin", "sha256"))
+        self.client.upload_bytes(memoryview(data)[1000:5000], "test_directory/memory/slice.bin")
+        self.assertEqual(self.client.get_file_info("test_directory/memory/slice.bin")["size"], 4000)
+        self.client.upload_stream(io.BytesIO(data), "test_directory/memory/stream.bin")
+        self.client.upload_file("test_files/medium_file.bin", "test_directory/memory/mapped.bin", use_mmap=True)
+        
+        buffer = bytearray(len(data) + 10)
+        result = self.client.download_into("test_directory/memory/bytes.bin", buffer, verify="sha256")
+        self.assertTrue(result["verified"])
+        self.assertEqual(bytes(buffer[:len(data)]), data)
+        
+        with mmap.mmap(-1, len(data)) as mapped:
+            self.client.download_into("test_directory/memory/mapped.bin", mapped, queue_depth=4)
+            self.assertEqual(mapped[:], data)
+        
+        stream = io.BytesIO()
+        self.client.download_into("test_directory/memory/stream.bin", stream)
+        self.assertEqual(stream.getvalue(), data)
+        self.assertEqual(b"".join(self.client.download_stream("test_directory/memory/slice.bin")), data[1000:5000])
+        
+        with self.assertRaises(ValueError):
+            self.client.download_into("test_directory/memory/bytes.bin", bytearray(100))
+        with self.assertRaises(TypeError):
+            self.client.download_into("test_directory/memory/bytes.bin", data)
+    
+    def test_27_compressed_transfers(self):
+        """Test compressing uploads and decompressing downloads transparently."""
+        with open("test_files/text_file.txt", 'w') as f:
+            for i in range(50000):
+                f.write(f'{{"id": {i}, "name": "item {i}", "tags": ["a", "b"]}}\n')
+        size = os.path.getsize("test_files/text_file.txt")
+        
+        codecs = ["zlib"] + [c for c, module in [("zstd", zstandard), ("lz4", lz4_frame)] if module is not None]
+        for codec in codecs:
+            result = self.client.upload_file("test_files/text_file.txt", f"test_directory/compressed/{codec}.txt",
+                                             compress=codec, verify="sha256")
+            self.assertEqual(result["size"], size)
+            self.assertLess(result["ratio"], 0.5)
+            self.assertFalse(self.client.file_exists(f"test_directory/compressed/{codec}.txt"))
+            self.assertEqual(self.client.get_file_info(result["path"])["size"], result["compressed_size"])
+            
+            result = self.client.download_file(f"test_directory/compressed/{codec}.txt", "downloaded_text.txt",
+                                               verify="sha256")
+            self.assertEqual(result["codec"], codec)
+            self.assertTrue(result["verified"])
+            self.assertTrue(files_match("test_files/text_file.txt", "downloaded_text.txt"))
+        
+        # Auto mode leaves random data alone
+        result = self.client.upload_file("test_files/medium_file.bin", "test_directory/compressed/random.bin",
+                                         compress="auto")
+        self.assertIsNone(result["codec"])
+        self.assertTrue(self.client.file_exists("test_directory/compressed/random.bin"))
+        result = self.client.upload_file("test_files/text_file.txt", "test_directory/compressed/auto.txt",
+                                         compress="auto")
+        self.assertIn(result["codec"], codecs)
+        
+        with self.assertRaises(ValueError):
+            self.client.upload_file("test_files/text_file.txt", "test_directory/compressed/bad.txt", compress="rar")
+        
+        # A plain upload takes precedence over the compressed copy, which remove_file takes with it
+        self.client.upload_file("test_files/small_file.txt", "test_directory/compressed/zlib.txt")
+        self.assertTrue(self.client.file_exists("test_directory/compressed/zlib.txt.zz"))
+        result = self.client.download_file("test_directory/compressed/zlib.txt", "downloaded_text.txt")
+        self.assertEqual((result["size"], result.get("codec")), (1024, None))
+        self.assertTrue(self.client.remove_file("test_directory/compressed/zlib.txt")["removed"])
+        for suffix in (".zz", ".sftp-meta", ".sha256"):
+            self.assertFalse(self.client.file_exists("test_directory/compressed/zlib.txt" + suffix))
+        
+        # With clean_sidecars, so does the plain upload; remove_file also removes a file only stored compressed
+        self.client.upload_file("test_files/text_file.txt", "test_directory/compressed/zlib.txt", compress="zlib")
+        with SFTPClient(self.host, self.port, password=self.password, clean_sidecars=True) as client:
+            client.upload_file("test_files/small_file.txt", "test_directory/compressed/zlib.txt")
+        self.assertFalse(self.client.file_exists("test_directory/compressed/zlib.txt.sftp-meta"))
+        self.client.upload_file("test_files/text_file.txt", "test_directory/compressed/zlib.txt", compress="zlib")
+        self.assertTrue(self.client.remove_file("test_directory/compressed/zlib.txt")["removed"])
+        self.assertFalse(self.client.file_exists("test_directory/compressed/zlib.txt.zz"))
+        with self.assertRaises(FileNotFoundError):
+            self.client.download_file("test_directory/compressed/zlib.txt", "downloaded_text.txt")
+        
+        # Files that only look like compressed uploads belong to someone else and stay
+        self.client.upload_bytes(b"not ours", "test_directory/compressed/a.tar.zst")
+        self.client.upload_bytes(b"{}", "test_directory/compressed/b.tar.sftp-meta")
+        self.client.upload_file("test_files/small_file.txt", "test_directory/compressed/a.tar")
+        self.client.upload_file("test_files/small_file.txt", "test_directory/compressed/b.tar")
+        self.assertTrue(self.client.remove_file("test_directory/compressed/a.tar")["removed"])
+        self.assertTrue(self.client.remove_file("test_directory/compressed/b.tar")["removed"])
+        self.assertTrue(self.client.file_exists("test_directory/compressed/a.tar.zst"))
+        self.assertTrue(self.client.file_exists("test_directory/compressed/b.tar.sftp-meta"))
+    
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_28_multithreaded_compression(self):
+        """Test that large files are compressed with zstd worker threads and still round trip."""
+        with open("test_files/large_text_file.txt", 'wb') as f:
+            for i in range(8):
+                f.write(os.urandom(640 * 1024).hex().encode())
+        result = self.client.upload_file("test_files/large_text_file.txt", "test_directory/compressed/large.txt",
+                                         compress="zstd")
+        self.assertLess(result["ratio"], 0.6)
+        self.client.download_file("test_directory/compressed/large.txt", "downloaded_text.txt")
+        self.assertTrue(files_match("test_files/large_text_file.txt", "downloaded_text.txt"))
+    
+    def test_29_daemon(self):
+        """Test running commands through a daemon holding a warm connection."""
+        socket_dir = tempfile.mkdtemp(prefix="sftp_daemon_")
+        socket_path = os.path.join(socket_dir, "daemon.sock")
+        daemon = SFTPDaemon(self.host, self.port, password=self.password, socket_path=socket_path,
+                            max_connections=2).start_background()
+        try:
+            self.assertEqual(os.stat(socket_path).st_mode & 0o777, 0o600)
+            with DaemonClient(socket_path) as client:
+                self.assertTrue(client.create_directory("test_directory/daemon")["created"])
+                result = client.upload_file("test_files/medium_file.bin", "test_directory/daemon/medium.bin")
+                self.assertEqual(result["size"], 1024 * 1024)
+                self.assertEqual(client.get_file_info("test_directory/daemon/medium.bin")["size"], 1024 * 1024)
+                names = [entry["name"] for entry in client.iter_directory("test_directory/daemon")]
+                self.assertEqual(names, ["medium.bin"])
+                
+                client.download_file("test_directory/daemon/medium.bin", "downloaded_daemon.bin")
+                self.assertTrue(files_match("test_files/medium_file.bin", "downloaded_daemon.bin"))
+                
+                # Errors come back with their type, and the connection stays usable
+                with self.assertRaises(FileNotFoundError):
+                    client.download_file("test_directory/daemon/missing.bin", "downloaded_daemon.bin")
+                with self.assertRaises(TypeError):
+                    client.upload_file("test_files/small_file.txt", callback=lambda sent, total: None)
+                with self.assertRaises(AttributeError):
+                    client.walk
+                self.assertTrue(client.file_exists("test_directory/daemon/medium.bin"))
+                
+                status = client.status()
+                self.assertEqual(status["pool"]["size"], 1)
+                self.assertGreater(status["requests"], 5)
+                self.assertEqual((status["profile"], status["retries"]), (None, 0))
+                
+                # A client leaving in the middle of a listing stops it and keeps the SFTP connection
+                closed = threading.Event()
+                def endless(self, *args, **kwargs):
+                    try:
+                        while True:
+                            yield {"name": "entry.bin"}
+                    finally:
+                        closed.set()
+                with mock.patch.object(SFTPClient, "iter_directory", endless):
+                    with DaemonClient(socket_path) as leaving:
+                        self.assertEqual(next(leaving.iter_directory("test_directory/daemon"))["name"], "entry.bin")
+                    self.assertTrue(closed.wait(5))
+                self.assertEqual(client.status()["pool"]["size"], 1)
+                client.stop()
+            
+            # The daemon removes its socket when it exits
+            deadline = time.time() + 5
+            while os.path.exists(socket_path) and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertFalse(os.path.exists(socket_path))
+            self.assertFalse(DaemonClient(socket_path).connect())
+        finally:
+            daemon.stop()
+            shutil.rmtree(socket_dir, ignore_errors=True)
+    
+    def test_30_transfer_scheduler(self):
+        """Test transfer priorities, fairness between jobs and bandwidth limits."""
+        bucket = TokenBucket(1000, burst=100)
+        bucket.consume(100)
+        self.assertAlmostEqual(bucket.consume(100), 0.1, delta=0.02)
+        
+        # The offset of a resumed transfer is reported without waiting for tokens
+        reported = []
+        throttle = _Throttle([TokenBucket(1000, burst=100)], lambda sent, total: reported.append(sent))
+        progress = _Progress(throttle, 1024 * 1024)
+        progress.skip(1024 * 1024 - 50)
+        progress.update(50)
+        self.assertEqual((reported, throttle.throttled), ([1024 * 1024 - 50, 1024 * 1024], 0))
+        
+        self.client.ensure_directory("test_directory/scheduled")
+        pool = SFTPConnectionPool(self.host, self.port, password=self.password, max_size=2)
+        metrics = SFTPMetrics()
+        with pool, TransferScheduler(pool, max_concurrent=2, max_per_host=1, metrics=metrics) as scheduler:
+            # Hold the only slot for the host while the other transfers are queued
+            started, release = threading.Event(), threading.Event()
+            
+            def gate(sent, total):
+                started.set()
+                release.wait()
+            
+            order = []
+            first = scheduler.upload_file("test_files/small_file.txt", "test_directory/scheduled/first.txt",
+                                          job="bulk", callback=gate)
+            self.assertTrue(started.wait(5))
+            futures = {name: scheduler.upload_file("test_files/small_file.txt", f"test_directory/scheduled/{name}.txt",
+                                                   job=job, priority=priority)
+                       for name, job, priority in [("bulk1", "bulk", 0), ("bulk2", "bulk", 0), ("other", "other", 0),
+                                                   ("urgent", "interactive", 10)]}
+            for name, future in futures.items():
+                future.add_done_callback(lambda f, name=name: order.append(name))
+            self.assertEqual(scheduler.stats()["queue_depth"], 4)
+            self.assertEqual(scheduler.stats()["running_by_host"], {f"{self.host}:{self.port}": 1})
+            release.set()
+            
+            results = [f.result(timeout=30) for f in [first] + list(futures.values())]
+            self.assertEqual(order, ["urgent", "other", "bulk1", "bulk2"])
+            self.assertGreater(results[0]["run_time"], 0)
+            self.assertGreater(results[1]["queued_time"], results[0]["queued_time"])
+            
+            # A job limited to 512 KB/s with a 512 KB burst needs about a second for 1 MB
+            self.client.upload_file("test_files/medium_file.bin", "test_directory/scheduled/medium.bin")
+            scheduler.set_job_limit("slow", 512 * 1024)
+            result = scheduler.download_file("test_directory/scheduled/medium.bin", "downloaded_scheduled.bin",
+                                             job="slow").result(timeout=30)
+            self.assertGreater(result["run_time"], 0.8)
+            self.assertTrue(files_match("test_files/medium_file.bin", "downloaded_scheduled.bin"))
+            
+            stats = scheduler.stats()
+            self.assertEqual((stats["completed"], stats["failed"], stats["queue_depth"]), (6, 0, 0))
+            self.assertGreater(stats["throttled_time"], 0.3)
+            self.assertGreaterEqual(stats["wait_max"], stats["wait_p95"])
+            self.assertEqual(metrics.snapshot()["operations"]["scheduler.wait"]["count"], 6)
+            
+            with self.assertRaises(ValueError):
+                scheduler.submit("remove_file", "test_directory/scheduled/first.txt")
+    
+    def test_31_deduplicated_uploads(self):
+        """Test that stored content is placed on the server instead of being sent again."""
+        size = 1024 * 1024
+        store = DedupStore(self.client, root="test_directory/dedup-store")
+        result = store.upload_file("test_files/medium_file.bin", "test_directory/dedup/first.bin")
+        self.assertEqual((result["deduplicated"], result["bytes_sent"], result["bytes_saved"]), (False, size, 0))
+        self.assertEqual(result["digest"], file_digest("test_files/medium_file.bin", "sha256"))
+        self.assertTrue(self.client.file_exists(store.object_path(result["digest"])))
+        
+        result = store.upload_file("test_files/medium_file.bin", "test_directory/dedup/second.bin")
+        self.assertEqual((result["deduplicated"], result["method"], result["bytes_saved"]), (True, "copy-data", size))
+        self.assertEqual(store.stats()["bytes_saved"], size)
+        
+        # Overwriting a placed copy leaves the stored object alone
+        self.client.upload_file("test_files/small_file.txt", "test_directory/dedup/second.bin")
+        result = store.upload_file("test_files/medium_file.bin", "test_directory/dedup/third.bin")
+        self.assertEqual((result["deduplicated"], result["bytes_sent"]), (True, 0))
+        
+        # Another store reads the manifest; links are opt-in
+        for method in ["hardlink", "symlink"]:
+            other = DedupStore(self.client, root="test_directory/dedup-store", methods=[method])
+            self.assertIn(result["digest"], other.index())
+            result = other.upload_file("test_files/medium_file.bin", f"test_directory/dedup/{method}.bin")
+            self.assertEqual((result["deduplicated"], result["method"]), (True, method))
+            self.client.download_file(f"test_directory/dedup/{method}.bin", "downloaded_dedup.bin")
+            self.assertTrue(files_match("test_files/medium_file.bin", "downloaded_dedup.bin"))
+        
+        # An object changed through a hardlinked file is not reused
+        self.client.upload_file("test_files/small_file.txt", "test_directory/dedup/hardlink.bin")
+        other = DedupStore(self.client, root="test_directory/dedup-store")
+        result = other.upload_file("test_files/medium_file.bin", "test_directory/dedup/relinked.bin")
+        self.assertEqual((result["deduplicated"], result["bytes_sent"]), (False, size))
+        self.client.download_file("test_directory/dedup/relinked.bin", "downloaded_dedup.bin")
+        self.assertTrue(files_match("test_files/medium_file.bin", "downloaded_dedup.bin"))
+        result = other.upload_file("test_files/medium_file.bin", "test_directory/dedup/restored.bin")
+        self.assertEqual((result["deduplicated"], result["method"]), (True, "copy-data"))
+        
+        # Servers refusing every method get plain uploads, sending new content once
+        unsupported = DedupStore(self.client, root="test_directory/dedup-exec", methods=["exec-cp"])
+        result = unsupported.upload_file("test_files/medium_file.bin", "test_directory/dedup/exec.bin")
+        self.assertEqual((result["deduplicated"], result["method"], result["bytes_sent"]), (False, None, size))
+        self.assertEqual(unsupported.stats()["methods"], [])
+        self.assertEqual(self.client.get_file_info("test_directory/dedup/exec.bin")["size"], size)
+        
+        summary = store.upload_many([("test_files/small_file.txt", "test_directory/dedup/small1.txt"),
+                                     ("test_files/small_file.txt", "test_directory/dedup/small2.txt"),
+                                     ("test_files/medium_file.bin", "test_directory/dedup/")])
+        self.assertEqual((summary["deduplicated"], summary["bytes_sent"], summary["bytes_saved"]), (2, 1024, 1024 + size))
+        self.assertTrue(self.client.file_exists("test_directory/dedup/medium_file.bin"))
+    
+    def test_32_delta_upload(self):
+        """Test that delta uploads only send the blocks that changed."""
+        block = 64 * 1024
+        self.create_test_file("test_files/delta.bin", 32 * block)
+        result = self.client.upload_file("test_files/delta.bin", "test_directory/delta/file.bin", delta=True)
+        self.assertEqual((result["signature"], result["changed_blocks"], result["bytes_sent"]), (None, 32, 32 * block))
+        
+        # Change one block in the middle and append to the last one
+        with open("test_files/delta.bin", 'r+b') as f:
+            f.seek(5 * block + 100)
+            f.write(b"changed")
+            f.seek(0, os.SEEK_END)
+            f.write(b"appended" * 125)
+        result = self.client.upload_file("test_files/delta.bin", "test_directory/delta/file.bin", delta=True,
+                                         verify="sha256")
+        self.assertEqual((result["signature"], result["changed_blocks"]), ("check-file", 2))
+        self.assertEqual(result["bytes_sent"], block + 1000)
+        self.assertEqual(result["bytes_saved"], 31 * block)
+        self.client.download_file("test_directory/delta/file.bin", "downloaded_delta.bin", verify="sha256")
+        self.assertTrue(files_match("test_files/delta.bin", "downloaded_delta.bin"))
+        
+        # Without check-file (OpenSSH), the signature file written by the last upload is used
+        with open("test_files/delta.bin", 'r+b') as f:
+            f.seek(10 * block)
+            f.write(b"again")
+            f.truncate(20 * block + 10)
+        with mock.patch.object(SFTPClient, "_check_file_signatures", side_effect=IOError("Operation unsupported")):
+            result = self.client.upload_file("test_files/delta.bin", "test_directory/delta/file.bin", delta=True)
+            self.assertEqual((result["signature"], result["changed_blocks"]), ("signature-file", 2))
+            self.client.download_file("test_directory/delta/file.bin", "downloaded_delta.bin")
+            self.assertTrue(files_match("test_files/delta.bin", "downloaded_delta.bin"))
+            
+            # A signature file that doesn't match the remote file anymore is ignored, and the
+            # exec channel refused by the test server falls back to sending everything
+            self.client.sftp.utime("test_directory/delta/file.bin", (0, 0))
+            result = self.client.upload_file("test_files/delta.bin", "test_directory/delta/file.bin", delta=True,
+                                             delta_exec=True)
+            self.assertEqual((result["signature"], result["bytes_saved"]), (None, 0))
+        
+        with self.assertRaises(ValueError):
+            self.client.upload_file("test_files/delta.bin", "test_directory/delta/file.bin", delta=True, resume=True)
+    
+    def test_33_find(self):
+        """Test searching a remote tree with filters and pruning by glob prefix."""
+        for path, size in [("logs/2023-01/a.gz", 100), ("logs/2024-01/b.gz", 200), ("logs/2024-02/c.txt", 5000),
+                           ("other/d.gz", 300)]:
+            self.client.upload_bytes(os.urandom(size), f"test_directory/find/{path}")
+        self.client.sftp.utime("test_directory/find/logs/2023-01/a.gz", (1000, 1000))
+        
+        def find(**kwargs):
+            return sorted(os.path.relpath(e["path"], "test_directory/find")
+                          for e in self.client.find("test_directory/find", **kwargs))
+        
+        self.assertEqual(find(pattern="*.gz"), ["logs/2023-01/a.gz", "logs/2024-01/b.gz", "other/d.gz"])
+        self.assertEqual(find(pattern="**/*.gz", newer_than=2000), ["logs/2024-01/b.gz", "other/d.gz"])
+        self.assertEqual(find(min_size=1000), ["logs/2024-02/c.txt"])
+        self.assertEqual(find(type="d", pattern="logs/*"), ["logs/2023-01", "logs/2024-01", "logs/2024-02"])
+        
+        # The test server refuses exec channels, so the walk takes over
+        self.assertEqual(find(pattern="*.txt", use_exec=True), ["logs/2024-02/c.txt"])
+        
+        entry = next(self.client.find("test_directory/find", pattern="b.gz", raw_times=True))
+        self.assertEqual((entry["type"], entry["size"]), ("f", 200))
+        self.assertIsInstance(entry["modified"], (int, float))
+        
+        # Subtrees that can't match a path pattern are not listed
+        metrics = SFTPMetrics()
+        with SFTPClient(self.host, self.port, password=self.password, metrics=metrics) as client:
+            results = [e["path"] for e in client.find("test_directory/find", pattern="logs/2024-*/*.gz")]
+        self.assertEqual(results, ["test_directory/find/logs/2024-01/b.gz"])
+        self.assertEqual(metrics.snapshot()["requests"]["opendir"], 4)
+    
+    def test_34_replicated_upload(self):
+        """Test fan-out uploads with a quorum, dropping a replica that falls behind."""
+        servers = [LocalSFTPServer(tempfile.mkdtemp(prefix="sftp_replica_")).start() for _ in range(2)]
+        self.addCleanup(lambda: [(s.stop(), shutil.rmtree(s.root, ignore_errors=True)) for s in servers])
+        hosts = [f"{s.host}:{s.port}" for s in servers]
+        
+        with SFTPReplicator.connect(hosts, password="test") as replicator:
+            result = replicator.upload_file("test_files/medium_file.bin", "replicated/file.bin")
+            self.assertNotIn("error", result)
+            self.assertEqual((result["quorum"], result["acknowledged"]), (2, 2))
+            self.assertTrue(all(r["status"] == "ok" and r["bytes"] == 1024 * 1024 for r in result["replicas"]))
+            for server in servers:
+                self.assertTrue(files_match("test_files/medium_file.bin",
+                                            os.path.join(server.root, "replicated/file.bin")))
+        
+        # A replica slowed down on every write is dropped once its buffer is full
+        metrics = SFTPMetrics()
+        slow_hook = lambda kind, name, value: time.sleep(0.05) if name == "write" else None
+        metrics.add_hook(slow_hook)
+        slow = SFTPClient(self.host, self.port, password=self.password, metrics=metrics)
+        slow.connect()
+        fast = [SFTPClient(s.host, s.port, password="test") for s in servers]
+        for client in fast:
+            client.connect()
+        replicator = SFTPReplicator(fast + [slow], quorum=2, buffer_size=256 * 1024, block_size=64 * 1024)
+        try:
+            result = replicator.upload_file("test_files/large_file.bin", "test_directory/replicated.bin")
+            self.assertNotIn("error", result)
+            self.assertEqual(result["acknowledged"], 2)
+            self.assertEqual([r["status"] for r in result["replicas"]], ["ok", "ok", "dropped"])
+            self.assertLess(result["replicas"][2]["bytes"], 10 * 1024 * 1024)
+            self.assertFalse(self.client.file_exists("test_directory/replicated.bin"))
+            self.assertFalse(self.client.file_exists("test_directory/replicated.bin.part"))
+            
+            # A brief stall doesn't cost a replica
+            metrics.remove_hook(slow_hook)
+            stalled = threading.Event()
+            stall_hook = lambda kind, name, value: (stalled.set(), time.sleep(0.3)) \
+                if name == "write" and not stalled.is_set() else None
+            metrics.add_hook(stall_hook)
+            result = replicator.upload_file("test_files/medium_file.bin", "test_directory/stalled.bin")
+            self.assertEqual([r["status"] for r in result["replicas"]], ["ok", "ok", "ok"])
+            
+            # A replica hung once quorum acknowledged the file doesn't block the upload
+            release = threading.Event()
+            metrics.remove_hook(stall_hook)
+            metrics.add_hook(lambda kind, name, value: release.wait() if name == "write" else None)
+            replicator.straggler_timeout = 0.5
+            start_time = time.time()
+            result = replicator.upload_file("test_files/small_file.txt", "test_directory/straggler.txt")
+            release.set()
+            self.assertLess(time.time() - start_time, 5)
+            self.assertEqual(result["acknowledged"], 2)
+            self.assertEqual([r["status"] for r in result["replicas"]], ["ok", "ok", "dropped"])
+            
+            # Below quorum, the upload reports an error
+            fast[1].disconnect()
+            replicator.quorum = 3
+            result = replicator.upload_file("test_files/small_file.txt", "replicated/small.txt")
+            self.assertIn("error", result)
+            self.assertEqual(result["replicas"][1]["status"], "failed")
+        finally:
+            replicator.disconnect()
+        
+        with self.assertRaises(ValueError):
+            SFTPReplicator([self.client], quorum=2)
+    
+    def test_35_reconnect_and_retry(self):
+        """Test reconnecting and retrying after connections are dropped mid-operation."""
+        if self.server is None:
+            self.skipTest("Dropping connections needs the local test server")
+        metrics = SFTPMetrics()
+        client = SFTPClient(self.host, self.port, password=self.password, metrics=metrics, retries=3,
+                            retry_backoff=0.01, keepalive=5, timeout=10)
+        self.assertTrue(client.connect())
+        self.addCleanup(client.disconnect)
+        client.upload_file("test_files/small_file.txt", "test_directory/retry/small.txt")
+        
+        # A session dropped while idle is reconnected before the next call
+        self.server.drop_connections()
+        deadline = time.time() + 5
+        while client.is_connected() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(client.is_connected())
+        self.assertEqual(client.get_file_info("test_directory/retry/small.txt")["size"], 1024)
+        self.assertTrue(client.is_connected())
+        self.server.drop_connections()
+        self.assertEqual([f["name"] for f in client.list_directory("test_directory/retry")], ["small.txt"])
+        
+        # Connections dropped in the middle of transfers
+        def drop_after(request, count):
+            def hook(kind, name, value):
+                if kind == "request" and name == request:
+                    seen[0] += 1
+                    if seen[0] == count:
+                        self.server.drop_connections()
+            seen = [0]
+            metrics.add_hook(hook)
+            self.addCleanup(metrics.remove_hook, hook)
+        
+        drop_after("write", 50)
+        result = client.upload_file("test_files/large_file.bin", "test_directory/retry/large.bin")
+        self.assertEqual(result["size"], 10 * 1024 * 1024)
+        self.assertEqual(metrics.snapshot()["retries"]["upload_file"], 1)
+        drop_after("read", 50)
+        client.download_file("test_directory/retry/large.bin", "downloaded_retry.bin")
+        self.assertTrue(files_match("test_files/large_file.bin", "downloaded_retry.bin"))
+        self.assertEqual(metrics.snapshot()["retries"]["download_file"], 1)
+        
+        # Errors from the server are not retried
+        with self.assertRaises(FileNotFoundError):
+            client.download_file("test_directory/retry/missing.bin", "downloaded_retry.bin")
+        self.assertNotIn("stat", metrics.snapshot()["retries"])
+        # paramiko raises EOFError for an SFTP_EOF status too, which only a dead session makes a connection failure
+        self.assertFalse(client._is_connection_error(EOFError()))
+        
+        # Retries stop when reconnecting keeps failing
+        self.server.drop_connections()
+        with mock.patch.object(client, "connect", return_value=False):
+            with self.assertRaises(ConnectionError):
+                client.file_exists("test_directory/retry/small.txt")
+        self.assertEqual(metrics.snapshot()["retries"]["stat"], 3)
+        
+        for attempt in range(10):
+            self.assertTrue(0 <= client._backoff_delay(attempt) <= min(client.retry_max_delay, 0.01 * 2 ** attempt))
+        
+        # Without retries, a dropped connection stays broken
+        with SFTPClient(self.host, self.port, password=self.password) as plain:
+            self.server.drop_connections()
+            self.assertIn("error", plain.get_file_info("test_directory/retry/small.txt"))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file